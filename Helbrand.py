@@ -1,525 +1,1447 @@
+import atexit
+import builtins
 import random
 import json
-
-# Race and sub-race definitions
-races = {
-    "Beast Race": {
-        "health": 120,
-        "strength": 15,
-        "defense": 10,
-        "magic": 5,
-        "agility": 10
-    },
-    "Half-Orc": {
-        "health": 110,
-        "strength": 20,
-        "defense": 15,
-        "magic": 5,
-        "agility": 7
-    },
-    "Elves": {
-        "health": 100,
-        "strength": 8,
-        "defense": 5,
-        "magic": 20,
-        "agility": 15
-    },
-    "Terrans": {
-        "health": 100,
-        "strength": 10,
-        "defense": 10,
-        "magic": 10,
-        "agility": 10
-    }
+import sys
+from bisect import bisect_left, bisect_right
+
+import content
+from crafting import recipe_book
+from dialogue import Conversation, FlatDialogue, dialogue_store
+from encounters import encounter_table
+from enemies import enemy_archetype, enemy_registry
+from items import ARMOR, CONSUMABLE, MATERIAL, TYPES, WEAPON, item_registry
+from journal import SAVE_DIR, SaveDirectory
+from rng import RandomStream
+
+# Game data (races, skills, store stock, locations and NPCs) lives in data/
+# and is loaded on first use through the content registry.
+
+# Everything the game tells the player goes out as an event: a kind plus the
+# data needed to describe it. The console turns events into the familiar
+# terminal text, while the session engine hands them to clients as-is and
+# NullEvents drops them before any formatting happens.
+
+def render_skill_tree(data):
+    lines = ["\n=== Skill Tree ==="]
+    for skill in data["skills"]:
+        lines.append(f"{skill['name']}: Level {skill['level']}/{skill['max_level']} - {skill['description']}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def render_skill_plan(data):
+    if not data["steps"]:
+        return f"You already have {data['skill']} at level {data['level']} or higher."
+    lines = [f"\n=== Path to {data['skill']} level {data['level']} ({data['cost']} skill points) ==="]
+    for idx, step in enumerate(data["steps"], 1):
+        lines.append(f"{idx}. Upgrade {step}")
+    return "\n".join(lines)
+
+
+def render_status(data):
+    return "\n".join([
+        f"\n=== {data['name']}'s Status ===",
+        f"Health: {data['health']}",
+        f"Strength: {data['strength']} (+{data['weapon_bonus']})",
+        f"Defense: {data['defense']} (+{data['defense_bonus']})",
+        f"Magic: {data['magic']}",
+        f"Agility: {data['agility']}",
+        f"Gold: {data['gold']}",
+        f"Inventory: {data['inventory']}",
+        f"Equipped Weapon: {data['equipped_weapon']}",
+        f"Equipped Armor: {data['equipped_armor']}",
+        f"Level: {data['level']}, EXP: {data['exp']}",
+        f"Skill Points: {data['skill_points']}\n",
+    ])
+
+
+def render_npc_options(data):
+    lines = [f"{data['npc']} ({data['role']}):"]
+    for i, option in enumerate(data["options"], 1):
+        lines.append(f"{i}. {option}")
+    return "\n".join(lines)
+
+
+def render_locations(data):
+    lines = ["\n=== Available Locations ==="]
+    for location, description in data["locations"].items():
+        lines.append(f"{location}: {description}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def render_store(data):
+    lines = ["\n=== Store ==="]
+    for item, price in data["items"].items():
+        lines.append(f"{item}: {price} gold")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def render_blacksmith_items(data):
+    lines = ["\nAvailable items in inventory:"]
+    for idx, item in enumerate(data["items"]):
+        lines.append(f"{idx + 1}. {item}")
+    return "\n".join(lines)
+
+
+def render_craftable(data):
+    if not data["recipes"]:
+        return "\nYou don't have the materials for any recipe."
+    lines = ["\nRecipes you can craft:"]
+    for recipe in data["recipes"]:
+        lines.append(f"- {recipe['first']} + {recipe['second']} -> {recipe['result']}")
+    return "\n".join(lines)
+
+
+def render_inventory(data):
+    lines = ["\n=== Inventory ==="]
+    if data["items"]:
+        for item in data["items"]:
+            lines.append(f"- {item}")
+    else:
+        lines.append("Your inventory is empty.")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def render_sell_list(data):
+    return "\n".join(["\n=== Inventory ==="] + list(data["items"]))
+
+
+def render_coliseum_auto(data):
+    lines = [f"\n=== Battle Coliseum: {data['battles']} victories, {data['gold']} gold earned ==="]
+    if data["loot"]:
+        lines.append("Loot: " + ", ".join(data["loot"]))
+    if data["fell_in"] is not None:
+        lines.append(f"You were defeated in battle {data['fell_in']}. Health: {data['health']}")
+    else:
+        lines.append(f"You leave the Battle Coliseum with {data['health']} health.")
+    return "\n".join(lines)
+
+
+def render_options(data):
+    lines = [data["title"]]
+    for idx, option in enumerate(data["options"], 1):
+        lines.append(f"{idx}. {option}")
+    return "\n".join(lines)
+
+
+MESSAGES = {
+    "narration": "{text}",
+    "error": "{message}",
+    "skill_tree": render_skill_tree,
+    "status": render_status,
+    "npc_options": render_npc_options,
+    "npc_says": "{npc} says: '{line}'",
+    "npc_confused": "{npc} doesn't understand what you're saying.",
+    "not_enough_skill_points": "Not enough skill points to upgrade this skill.",
+    "skill_maxed": "{skill} is already at max level.",
+    "skill_locked": "{skill} requires {dependency} to be level {required_level} first.",
+    "skill_upgraded": "Upgraded {skill} to level {level}.",
+    "skill_not_found": "Skill {skill} not found.",
+    "skill_plan": render_skill_plan,
+    "skill_unreachable": "{skill} cannot reach level {level}.",
+    "skill_unavailable": "{skill} is not available or not upgraded yet.",
+    "power_strike": "{player} uses {skill}! Deals {damage} critical damage.",
+    "berserk": "{player} goes Berserk! Deals {damage} boosted damage.",
+    "fireball": "{player} casts {skill}! Deals {damage} fire damage.",
+    "lightning_strike": "{player} summons {skill}! Deals {damage} lightning damage.",
+    "area_hit": "{skill} hits {count} enemies!",
+    "moved": "\nYou have moved to {location}.\n",
+    "player_attack": "{player} attacks! {enemy} takes {damage} damage. Enemy health: {enemy_health}",
+    "enemy_attack": "The {enemy} attacks you and deals {damage} damage!",
+    "group_attack": "{count} enemies attack you and deal {damage} damage in total!",
+    "item_used": "Used {item}. Health is now {health}.",
+    "item_unusable": "{item} cannot be used right now.",
+    "item_missing": "You don't have {item} in your inventory.",
+    "exp_gained": "Gained {amount} EXP! Current EXP: {exp}",
+    "level_up": "Congratulations! {player} leveled up to Level {level}. Skill points available: {skill_points}",
+    "level_up_bonus": "\nYou leveled up! You are now Level {level}.\n"
+                      "You have earned 2 skill points. Total Skill Points: {skill_points}\n",
+    "equipped": "Equipped {item}.",
+    "not_equippable": "{item} cannot be equipped.",
+    "locations": render_locations,
+    "store_items": render_store,
+    "purchased": "{item} purchased! Remaining gold: {gold}",
+    "not_enough_gold": "Not enough gold to buy this item.",
+    "inventory_full": "Your inventory is full, there is no room for {item}.",
+    "not_in_store": "{item} is not available in the store.",
+    "sold": "{item} sold for {price} gold! Current gold: {gold}",
+    "cannot_sell": "{item} cannot be sold.",
+    "purchased_batch": "{count} items purchased for {total} gold! Remaining gold: {gold}",
+    "sold_batch": "{count} items sold for {price} gold! Current gold: {gold}",
+    "sell_list": render_sell_list,
+    "need_two_items": "You need at least two weapons to combine.",
+    "blacksmith_items": render_blacksmith_items,
+    "craftable": render_craftable,
+    "combined": "\n{first} and {second} were combined to create {result}!",
+    "inventory": render_inventory,
+    "menu": render_options,
+    "combat_start": "\nYou are fighting a {enemy}!",
+    "group_start": "\nYou are fighting a group of {count} enemies led by a {enemy}!",
+    "combat_actions": "\nCombat Actions: [1] Attack [2] Use Item [3] Use Skills [4] Flee",
+    "fled": "You fled the battle!",
+    "defeated": "You were defeated!",
+    "enemy_defeated": "You defeated the {enemy}!",
+    "enemies_defeated": "You defeated {count} of them! Enemies left standing: {standing}",
+    "group_defeated": "You defeated the whole group!",
+    "trap": "A trap goes off! You take {damage} damage.",
+    "gold_found": "You gained {amount} gold. Current gold: {gold}",
+    "battle": "\n=== Battle {battle} ===",
+    "challenger": "A fierce {enemy} appears with {health} health and {attack_power} attack power!",
+    "swarm": "A swarm of {count} grunts ({enemy}) pours into the arena, {health} health each!",
+    "victory_reward": "Victory! You earned {gold} gold.",
+    "unique_item": "You have obtained a {item}!",
+    "coliseum_defeat": "You have been defeated in the Battle Coliseum!",
+    "coliseum_leave": "You leave the Battle Coliseum after {battles} victories, carrying your rewards.",
+    "coliseum_auto": render_coliseum_auto,
+    "seed": "Random seed: {seed} (replay this game with --seed {seed})",
+    "game_saved": "\nGame saved successfully!\n",
+    "game_loaded": "\nGame loaded successfully!\n",
+    "no_save": "\nNo saved game found!\n",
 }
 
-sub_races = {
-    "Demonic": {
-        "health": -10,
-        "strength": 5,
-        "defense": 0,
-        "magic": 10,
-        "agility": 5
-    },
-    "Angelic": {
-        "health": 0,
-        "strength": 5,
-        "defense": 10,
-        "magic": 15,
-        "agility": 10
-    },
-    "Vampire": {
-        "health": 20,
-        "strength": 10,
-        "defense": -5,
-        "magic": 10,
-        "agility": 5
-    },
-    "Werewolf": {
-        "health": 30,
-        "strength": 15,
-        "defense": 10,
-        "magic": -10,
-        "agility": 5
-    },
-    "Succubus": {
-        "health": -10,
-        "strength": 5,
-        "defense": -5,
-        "magic": 25,
-        "agility": 10
-    },
-    "Incubus": {
-        "health": -10,
-        "strength": 5,
-        "defense": 0,
-        "magic": 20,
-        "agility": 10
-    }
-}
+
+def render_event(kind, data):
+    template = MESSAGES[kind]
+    if callable(template):
+        return template(data)
+    return template.format(**data)
+
+
+class Console:
+    # Default event sink: renders every event as terminal text. The text
+    # collects in a frame that goes out in a single write when the game next
+    # waits for the player (see input below) or exits, not one print per event.
+    def __init__(self, stream=None):
+        self.stream = stream  # None for whatever sys.stdout is at flush time
+        self.frame = []
+
+    def emit(self, kind, **data):
+        self.frame.append(render_event(kind, data))
+
+    def flush(self):
+        if self.frame:
+            text = "\n".join(self.frame) + "\n"
+            self.frame = []
+            stream = self.stream or sys.stdout
+            stream.write(text)
+            stream.flush()
+
+
+class NullEvents:
+    # Sink for headless and batch runs: events are dropped unformatted
+    def emit(self, kind, **data):
+        pass
+
+
+console = Console()
+atexit.register(console.flush)
+
+
+def input(prompt=""):
+    # Every prompt ends a turn: show what the console has buffered before waiting on the player
+    console.flush()
+    return builtins.input(prompt)
+
+# Conditions a skill effect can require before it fires, by name. They take
+# the caster's health and base health, scalars or NumPy arrays alike.
+EFFECT_CONDITIONS = {}
+
+
+def effect_condition(name):
+    def register(function):
+        EFFECT_CONDITIONS[name] = function
+        return function
+    return register
+
+
+@effect_condition("low_health")
+def low_health(health, base_health):
+    return health < (0.3 * base_health)
+
+
+class SkillEffect:
+    # Compiled combat effect of one skill: damage is the caster's stat times
+    # multipliers[level], worked out up front for every level a SkillTree can
+    # hold. Area effects hit every member of an EnemyGroup at once.
+    __slots__ = ("stat", "multipliers", "message", "condition", "area")
+
+    def __init__(self, effect):
+        self.stat = effect["stat"]
+        self.multipliers = (0,) + tuple(effect["base"] + (effect["per_level"] * level) for level in range(1, 256))
+        self.message = effect["message"]
+        self.condition = EFFECT_CONDITIONS[effect["when"]] if effect.get("when") else None
+        self.area = effect.get("area", False)
+
+    def damage(self, stat_value, level):
+        return stat_value * self.multipliers[level]
+
+
+@content.compiler("skills")
+def compile_skills(data):
+    # Normalize every skill's dependencies to a list of [skill, level] pairs
+    # (the old format was a single flat [skill, level] pair) and put the
+    # skills in dependency order, so cycles and typos fail at load time.
+    skills = data["skills"]
+    for name, skill in skills.items():
+        dependencies = skill.get("dependencies") or []
+        if len(dependencies) == 2 and isinstance(dependencies[0], str) and isinstance(dependencies[1], int):
+            dependencies = [dependencies]
+        skill["dependencies"] = [[dependency, level] for dependency, level in dependencies]
+        for dependency, level in skill["dependencies"]:
+            if dependency not in skills:
+                raise content.ContentError(f"Skill {name!r} depends on unknown skill {dependency!r}")
+
+    order = []
+    waiting = {name: len(skill["dependencies"]) for name, skill in skills.items()}
+    dependents = {name: [] for name in skills}
+    for name, skill in skills.items():
+        for dependency, level in skill["dependencies"]:
+            dependents[dependency].append(name)
+    ready = [name for name, count in waiting.items() if count == 0]
+    while ready:
+        name = ready.pop()
+        order.append(name)
+        for dependent in dependents[name]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                ready.append(dependent)
+    if len(order) != len(skills):
+        cycle = sorted(name for name, count in waiting.items() if count)
+        raise content.ContentError(f"Skill dependencies form a cycle through {', '.join(cycle)}")
+    data["order"] = order
+
+    for name, skill in skills.items():
+        effect = skill.get("effect")
+        if effect is not None and effect.get("when") is not None and effect["when"] not in EFFECT_CONDITIONS:
+            raise content.ContentError(f"Skill {name!r} has unknown effect condition {effect['when']!r}")
+    return data
+
+
+class SkillBook:
+    # Skill metadata (description, cost, max level, dependencies) loaded once
+    # and shared by every SkillTree; each player only stores its levels.
+    # Dependencies are kept as a DAG over skill indexes: requires[i] holds
+    # (skill, level) pairs skill i needs, dependents[i] the skills needing i.
+    shared = None
+
+    def __init__(self, skills, order=None):
+        self.names = tuple(skills)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.info = tuple(skills[name] for name in self.names)
+        self.requires = tuple(
+            tuple((self.index[dependency], level) for dependency, level in skill["dependencies"])
+            for skill in self.info
+        )
+        dependents = [[] for _ in self.names]
+        for index, requirements in enumerate(self.requires):
+            for dependency, level in requirements:
+                dependents[dependency].append(index)
+        self.dependents = tuple(tuple(indexes) for indexes in dependents)
+        self.order = tuple(self.index[name] for name in order) if order else tuple(range(len(self.names)))
+        self.position = {index: position for position, index in enumerate(self.order)}
+        self.costs = tuple(skill["cost"] for skill in self.info)
+        self.max_levels = tuple(skill["max_level"] for skill in self.info)
+        # Skill index -> SkillEffect, or None for skills with no combat effect
+        self.effects = tuple(SkillEffect(skill["effect"]) if "effect" in skill else None for skill in self.info)
+        # Skills whose prerequisites are met with every skill at level 0
+        self.base_unlocked = self.unlock_bits(bytes(len(self.names)))
+        self.plans = {}
+
+    @classmethod
+    def get(cls):
+        if cls.shared is None:
+            data = content.load("skills")
+            cls.shared = cls(data["skills"], data.get("order"))
+        return cls.shared
+
+    def meets(self, index, levels):
+        for dependency, level in self.requires[index]:
+            if levels[dependency] < level:
+                return False
+        return True
+
+    def unlock_bits(self, levels, indexes=None, bits=0):
+        # Recompute the unlocked bit of each skill in indexes (default: all of them)
+        for index in range(len(self.names)) if indexes is None else indexes:
+            if self.meets(index, levels):
+                bits |= 1 << index
+            else:
+                bits &= ~(1 << index)
+        return bits
+
+    def requirements(self, skill_name, level=1):
+        # Every (skill, level) needed to have skill_name at level, in an order
+        # that can be learned front to back. Cached per target; every level
+        # past the skill's max is unreachable alike and shares one entry.
+        target = self.index[skill_name]
+        level = max(0, min(level, self.max_levels[target] + 1))
+        key = (skill_name, level)
+        if key not in self.plans:
+            needed = {target: level}
+            for index in reversed(self.order[:self.position[target] + 1]):
+                if index in needed:
+                    for dependency, required_level in self.requires[index]:
+                        if needed.get(dependency, 0) < required_level:
+                            needed[dependency] = required_level
+            self.plans[key] = tuple(
+                (index, needed[index]) for index in self.order[:self.position[target] + 1] if index in needed
+            )
+        return self.plans[key]
+
+
+class SkillView:
+    # Dict-style window onto one skill of one SkillTree, e.g. view["level"]
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == "level":
+            return self.tree.levels[self.index]
+        return self.tree.book.info[self.index][key]
+
+    def __setitem__(self, key, value):
+        if key != "level":
+            raise KeyError(f"{key} is shared skill metadata and cannot be changed per player")
+        self.tree.set_level(self.tree.book.names[self.index], value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class SkillLevels:
+    # Read-only mapping of skill name -> SkillView, standing in for the old per-player skills dict
+    __slots__ = ("tree",)
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def __getitem__(self, skill_name):
+        return SkillView(self.tree, self.tree.book.index[skill_name])
+
+    def __contains__(self, skill_name):
+        return skill_name in self.tree.book.index
+
+    def __iter__(self):
+        return iter(self.tree.book.names)
+
+    def __len__(self):
+        return len(self.tree.book.names)
+
+    def get(self, skill_name, default=None):
+        if skill_name in self.tree.book.index:
+            return self[skill_name]
+        return default
+
+    def keys(self):
+        return self.tree.book.names
+
+    def items(self):
+        return [(name, self[name]) for name in self.tree.book.names]
+
 
 class SkillTree:
-    def __init__(self):
-        self.skills = {
-            "Strength": {
-                "level": 0,
-                "description": "Increases melee attack damage.",
-                "cost": 1,
-                "max_level": 5,
-                "dependencies": []
-            },
-            "Power Strike": {
-                "level": 0,
-                "description": "Increases critical hit chance. Requires Strength Level 2.",
-                "cost": 2,
-                "max_level": 3,
-                "dependencies": ["Strength", 2]
-            },
-            "Berserk": {
-                "level": 0,
-                "description": "Grants bonus damage when health is low. Requires Power Strike.",
-                "cost": 3,
-                "max_level": 1,
-                "dependencies": ["Power Strike", 1]
-            },
-            "Dexterity": {
-                "level": 0,
-                "description": "Increases ranged attack accuracy.",
-                "cost": 1,
-                "max_level": 5,
-                "dependencies": []
-            },
-            "Agility": {
-                "level": 0,
-                "description": "Increases chance to dodge. Requires Dexterity Level 2.",
-                "cost": 2,
-                "max_level": 3,
-                "dependencies": ["Dexterity", 2]
-            },
-            "Precision": {
-                "level": 0,
-                "description": "Increases critical hit chance with ranged weapons. Requires Agility.",
-                "cost": 3,
-                "max_level": 1,
-                "dependencies": ["Agility", 1]
-            },
-            "Magic": {
-                "level": 0,
-                "description": "Increases magical damage and mana.",
-                "cost": 1,
-                "max_level": 5,
-                "dependencies": []
-            },
-            "Fireball": {
-                "level": 0,
-                "description": "Casts a fireball that deals AoE damage. Requires Magic Level 2.",
-                "cost": 2,
-                "max_level": 3,
-                "dependencies": ["Magic", 2]
-            },
-            "Lightning Strike": {
-                "level": 0,
-                "description": "Calls down lightning on enemies. Requires Fireball.",
-                "cost": 3,
-                "max_level": 1,
-                "dependencies": ["Fireball", 1]
-            }
-        }
+    __slots__ = ("book", "levels", "unlocked")
 
-    def display_skills(self):
-        print("\n=== Skill Tree ===")
-        for skill, data in self.skills.items():
-            print(f"{skill}: Level {data['level']}/{data['max_level']} - {data['description']}")
-        print()
+    def __init__(self):
+        self.book = SkillBook.get()
+        self.levels = bytearray(len(self.book.names))  # One byte per skill level
+        self.unlocked = self.book.base_unlocked  # Bit i set when skill i's prerequisites are met
+
+    @property
+    def skills(self):
+        return SkillLevels(self)
+
+    def level(self, skill_name):
+        index = self.book.index.get(skill_name)
+        return 0 if index is None else self.levels[index]
+
+    def set_level(self, skill_name, level):
+        index = self.book.index[skill_name]
+        self.levels[index] = level
+        self.unlocked = self.book.unlock_bits(self.levels, self.book.dependents[index], self.unlocked)
+
+    def refresh_unlocks(self):
+        # Call after writing to levels directly
+        self.unlocked = self.book.unlock_bits(self.levels)
+
+    def is_unlocked(self, skill_name):
+        return bool(self.unlocked >> self.book.index[skill_name] & 1)
+
+    def level_map(self):
+        return dict(zip(self.book.names, self.levels))
+
+    def plan(self, skill_name, level=1):
+        # Cheapest way to reach skill_name at level: the upgrades to make, in
+        # order, and their total skill point cost. None if it can't be done.
+        steps = []
+        cost = 0
+        for index, needed in self.book.requirements(skill_name, level):
+            if needed > self.book.max_levels[index]:
+                return None
+            for _ in range(self.levels[index], needed):
+                steps.append(self.book.names[index])
+                cost += self.book.costs[index]
+        return steps, cost
+
+    def display_skills(self, events=console):
+        skills = [
+            {"name": skill, "level": level, "max_level": data["max_level"], "description": data["description"]}
+            for skill, level, data in zip(self.book.names, self.levels, self.book.info)
+        ]
+        events.emit("skill_tree", skills=skills)
+
+    def show_plan(self, skill_name, level=1, events=console):
+        if skill_name not in self.book.index:
+            events.emit("skill_not_found", skill=skill_name)
+            return
+        plan = self.plan(skill_name, level)
+        if plan is None:
+            events.emit("skill_unreachable", skill=skill_name, level=level)
+            return
+        steps, cost = plan
+        events.emit("skill_plan", skill=skill_name, level=level, steps=steps, cost=cost)
 
     def upgrade_skill(self, skill_name, player):
-        if skill_name in self.skills:
-            skill = self.skills[skill_name]
+        events = player.events
+        index = self.book.index.get(skill_name)
+        if index is not None:
+            skill = self.book.info[index]
 
             # Check if player has enough skill points
             if player.skill_points < skill["cost"]:
-                print("Not enough skill points to upgrade this skill.")
+                events.emit("not_enough_skill_points")
                 return
 
             # Check if skill is already maxed out
-            if skill["level"] >= skill["max_level"]:
-                print(f"{skill_name} is already at max level.")
+            if self.levels[index] >= skill["max_level"]:
+                events.emit("skill_maxed", skill=skill_name)
                 return
 
             # Check if dependencies are met
-            if skill["dependencies"]:
-                dependency, required_level = skill["dependencies"]
-                if self.skills[dependency]["level"] < required_level:
-                    print(f"{skill_name} requires {dependency} to be level {required_level} first.")
-                    return
+            if not self.unlocked >> index & 1:
+                for dependency, required_level in self.book.requires[index]:
+                    if self.levels[dependency] < required_level:
+                        events.emit("skill_locked", skill=skill_name, dependency=self.book.names[dependency],
+                                    required_level=required_level)
+                        return
 
             # Upgrade skill
-            skill["level"] += 1
+            self.levels[index] += 1
+            if self.book.dependents[index]:
+                self.unlocked = self.book.unlock_bits(self.levels, self.book.dependents[index], self.unlocked)
             player.skill_points -= skill["cost"]
-            print(f"Upgraded {skill_name} to level {skill['level']}.")
+            events.emit("skill_upgraded", skill=skill_name, level=self.levels[index])
         else:
-            print(f"Skill {skill_name} not found.")
+            events.emit("skill_not_found", skill=skill_name)
 
 class NPC:
-    def __init__(self, name, role, dialogue_options):
+    # NPCs are shared by every game; where a player is in the dialogue is
+    # kept by the Conversation that converse() starts
+    def __init__(self, name, role, dialogue_options=None):
         self.name = name
         self.role = role
+        # Given a list of lines the NPC speaks those, otherwise its graph from the dialogue store
         self.dialogue_options = dialogue_options
+        self.dialogue = None  # (dialogue, start node), looked up on first use
+
+    def converse(self, player=None, events=console):
+        if self.dialogue is None:
+            if self.dialogue_options is not None:
+                self.dialogue = (FlatDialogue(self.dialogue_options), 0)
+            else:
+                store = dialogue_store()
+                start = store.start(self.name)
+                self.dialogue = (store, start) if start is not None else (FlatDialogue([]), 0)
+        dialogue, start = self.dialogue
+        return Conversation(self, dialogue, start, player, events)
+
+    def talk(self, events=console, player=None):
+        conversation = self.converse(player, events)
+        while conversation.choices:
+            choice = int(input("Choose a dialogue option: "))
+            conversation.choose(choice)
+
+# NPCs for different locations, built the first time a location needs them
+location_npcs_cache = {}
+
+def location_npcs(location):
+    if location not in location_npcs_cache:
+        location_npcs_cache[location] = [
+            NPC(npc["name"], npc["role"], npc.get("dialogue"))
+            for npc in content.load("npcs")["npcs"].get(location, [])
+        ]
+    return location_npcs_cache[location]
+
+# Old module-level NPC list names, still importable from this module
+NPC_LISTS = {
+    "senaria_npcs": "Senaria",
+    "dark_amazon_npcs": "Dark Amazon",
+    "senaria_dungeon_npcs": "Senaria Dungeon",
+    "decaria_mountains_npcs": "Decaria Mountains",
+    "crystal_caverns_npcs": "Crystal Caverns",
+    "forgotten_swamp_npcs": "Forgotten Swamp",
+}
 
-    def talk(self):
-        print(f"{self.name} ({self.role}):")
-        for i, option in enumerate(self.dialogue_options, 1):
-            print(f"{i}. {option}")
-        choice = int(input("Choose a dialogue option: "))
-        if 1 <= choice <= len(self.dialogue_options):
-            print(f"{self.name} says: '{self.dialogue_options[choice - 1]}'")
+def __getattr__(name):
+    # Lazily provide the old module-level content tables (races, sub_races and the NPC lists)
+    if name in ("races", "sub_races"):
+        return content.load("races")[name]
+    if name in NPC_LISTS:
+        return location_npcs(NPC_LISTS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+base_health_cache = {}
+
+def base_health(race, sub_race):
+    # Starting health of a race/sub-race pair, used as the reference for "low health"
+    health = base_health_cache.get((race, sub_race))
+    if health is None:
+        tables = content.load("races")
+        health = tables["races"][race]["health"] + tables["sub_races"][sub_race]["health"]
+        base_health_cache[(race, sub_race)] = health
+    return health
+
+
+class InventoryFull(Exception):
+    pass
+
+
+class Inventory:
+    # Stacking inventory: one count per item id plus a per-category index,
+    # so adding, removing and membership checks are O(1) whatever its size.
+    # The category index and the change set are only built once something
+    # asks for them, so an inventory nobody browses or saves is one dict.
+    # It still behaves like the old list of names (in, len, iteration,
+    # append, remove, pop) so existing callers keep working.
+    __slots__ = ("counts", "categories", "size", "capacity", "changes", "changes_owner", "registry")
+
+    def __init__(self, items=(), capacity=None):
+        self.registry = item_registry()
+        self.counts = {}  # Item id -> count
+        self.categories = None  # Category -> {item id: None}, see by_category()
+        self.size = 0
+        self.capacity = capacity  # Maximum number of stacks, None for no limit
+        self.changes = None  # Ids whose count changed since the last take_changes(), None for none
+        self.changes_owner = None  # Whoever called take_changes() last (e.g. a save slot)
+        for item in items:
+            self.append(item)
+
+    @classmethod
+    def load(cls, data, capacity=None, hybrids=None):
+        # Accepts the old save format (a list of names), {name: count} and
+        # {save key: count}; hybrids are the save's hybrid records
+        inventory = cls(capacity=capacity)
+        if isinstance(data, dict):
+            registry = inventory.registry
+            resolved = registry.load_hybrids(hybrids) if hybrids else None
+            for key, count in data.items():
+                inventory.add_id(registry.from_save_key(key, resolved), count)
         else:
-            print(f"{self.name} doesn't understand what you're saying.")
+            for item in data:
+                inventory.add(item)
+        return inventory
+
+    def to_dict(self):
+        names = self.registry.names
+        return {names[item_id]: count for item_id, count in self.counts.items()}
+
+    def to_save(self):
+        # {save key: count}, see ItemRegistry.save_key
+        save_key = self.registry.save_key
+        return {save_key(item_id): count for item_id, count in self.counts.items()}
+
+    def has_room(self, item_name):
+        item_id = self.registry.id_of(item_name)
+        if item_id is None:
+            # Never registered, so not held either: it would need a new stack
+            return self.capacity is None or len(self.counts) < self.capacity
+        return self.has_room_id(item_id)
+
+    def has_room_for(self, items):
+        # Whether all of items (names) fit at once
+        if self.capacity is None:
+            return True
+        new = sum(1 for item in items if item not in self)
+        return len(self.counts) + new <= self.capacity
 
-# NPCs for different locations
-senaria_npcs = [
-    NPC("Elder Rowan", "Village Elder", ["Welcome to Senaria, the safest place in the land.", "Be careful in the dungeon, young one."]),
-    NPC("Merchant Tessa", "Trader", ["I sell the finest herbs and potions.", "Need to sell something? I can offer you a fair price."])
-]
+    def has_room_id(self, item_id):
+        return item_id in self.counts or self.capacity is None or len(self.counts) < self.capacity
 
-dark_amazon_npcs = [
-    NPC("Mysterious Wanderer", "Rogue", ["Watch your back in these woods.", "The creatures here don't take kindly to strangers."]),
-]
+    def add(self, item_name, count=1):
+        return self.add_id(self.registry.intern(item_name), count)
 
-senaria_dungeon_npcs = [
-    NPC("Ghostly Guardian", "Dungeon Spirit", ["You shouldn't be here, mortal.", "The treasures here come at a great cost."]),
-]
+    def add_id(self, item_id, count=1):
+        if count <= 0:
+            return True
+        if item_id in self.counts:
+            self.counts[item_id] += count
+        elif self.has_room_id(item_id):
+            self.counts[item_id] = count
+            if self.categories is not None:
+                self.categories[self.registry.types[item_id]][item_id] = None
+        else:
+            return False
+        self.size += count
+        self.changed(item_id)
+        return True
+
+    def discard(self, item_name, count=1):
+        # Remove up to count of an item, returning how many were removed
+        item_id = self.registry.id_of(item_name)
+        return 0 if item_id is None else self.discard_id(item_id, count)
+
+    def discard_id(self, item_id, count=1):
+        held = self.counts.get(item_id, 0)
+        count = min(count, held)
+        if count == held:
+            if held:
+                del self.counts[item_id]
+                if self.categories is not None:
+                    del self.categories[self.registry.types[item_id]][item_id]
+        else:
+            self.counts[item_id] = held - count
+        if count:
+            self.size -= count
+            self.changed(item_id)
+        return count
+
+    def changed(self, item_id):
+        if self.changes is None:
+            self.changes = {item_id}
+        else:
+            self.changes.add(item_id)
+
+    def take_changes(self, owner=None):
+        changes = self.changes
+        self.changes = None
+        self.changes_owner = owner
+        return () if changes is None else changes
+
+    def by_category(self):
+        if self.categories is None:
+            categories = {WEAPON: {}, ARMOR: {}, CONSUMABLE: {}, MATERIAL: {}}
+            types = self.registry.types
+            for item_id in self.counts:
+                categories[types[item_id]][item_id] = None
+            self.categories = categories
+        return self.categories
+
+    def count(self, item_name):
+        item_id = self.registry.id_of(item_name)
+        return 0 if item_id is None else self.counts.get(item_id, 0)
+
+    def count_id(self, item_id):
+        return self.counts.get(item_id, 0)
+
+    def stacks(self, category=None):
+        # (item, count) pairs, optionally for one category only
+        names = self.registry.names
+        if category is None:
+            return [(names[item_id], count) for item_id, count in self.counts.items()]
+        return [(names[item_id], self.counts[item_id]) for item_id in self.by_category()[category]]
+
+    def items_in(self, category):
+        names = self.registry.names
+        return [names[item_id] for item_id in self.by_category()[category]]
+
+    # List compatibility
+
+    def append(self, item_name):
+        if not self.add(item_name):
+            raise InventoryFull(f"No room for {item_name}")
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def remove(self, item_name):
+        if not self.discard(item_name):
+            raise ValueError(f"{item_name} not in inventory")
+
+    def pop(self, index=-1):
+        try:
+            item = self[index]
+        except IndexError:
+            raise IndexError("pop index out of range")
+        self.discard(item)
+        return item
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __contains__(self, item_name):
+        item_id = self.registry.id_of(item_name)
+        return item_id is not None and item_id in self.counts
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        names = self.registry.names
+        for item_id, count in self.counts.items():
+            item = names[item_id]
+            for _ in range(count):
+                yield item
+
+    def __eq__(self, other):
+        if isinstance(other, Inventory):
+            return self.counts == other.counts
+        return list(self) == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+# Player stats derived from other fields, and the fields each is computed from.
+# Each is cached in the player's "cached_<stat>" slot; its bit in
+# Player.stale is set when one of its fields changes.
+DERIVED_STATS = {
+    "weapon_bonus": ("equipped_weapon",),
+    "defense_bonus": ("equipped_armor",),
+    "attack": ("strength", "equipped_weapon"),
+    "armor": ("defense", "equipped_armor"),
+    "max_health": ("race", "sub_race"),
+}
 
-decaria_mountains_npcs = [
-    NPC("Hermit Griegor", "Mountain Sage", ["The dragons rule the peaks. Only the brave survive.", "I've seen trolls bigger than trees."]),
-]
+STALE_BITS = {stat: 1 << bit for bit, stat in enumerate(DERIVED_STATS)}
+WEAPON_BONUS_BIT, DEFENSE_BONUS_BIT, ATTACK_BIT, ARMOR_BIT, MAX_HEALTH_BIT = STALE_BITS.values()
+ALL_STALE = (1 << len(DERIVED_STATS)) - 1
 
-crystal_caverns_npcs = [
-    NPC("Gemstone Collector", "Treasure Hunter", ["I'm here for the gems. What about you?", "They say the crystals are alive..."]),
-]
 
-forgotten_swamp_npcs = [
-    NPC("Swamp Shaman", "Healer", ["The swamp will take your soul if you're not careful.", "I can offer you protection, for a price."]),
-]
+class TrackedField:
+    # Player field that marks the derived stats computed from it as stale
+    # whenever it is assigned. The value itself lives in the "_<field>" slot.
+    def __init__(self, field):
+        self.slot = f"_{field}"
+        self.dependents = 0
+        for stat, fields in DERIVED_STATS.items():
+            if field in fields:
+                self.dependents |= STALE_BITS[stat]
+
+    def __get__(self, player, owner=None):
+        if player is None:
+            return self
+        return getattr(player, self.slot)
+
+    def __set__(self, player, value):
+        setattr(player, self.slot, value)
+        player.stale |= self.dependents
+
+
+TRACKED_FIELDS = {field for fields in DERIVED_STATS.values() for field in fields}
 
 
 class Player:
+    __slots__ = (
+        "name", "health", "magic", "agility", "inventory", "gold", "location", "level", "exp", "skill_points",
+        "skill_tree", "events", "stale",
+    ) + tuple(f"_{field}" for field in sorted(TRACKED_FIELDS)) + tuple(f"cached_{stat}" for stat in DERIVED_STATS)
+
+    race = TrackedField("race")
+    sub_race = TrackedField("sub_race")
+    strength = TrackedField("strength")
+    defense = TrackedField("defense")
+    equipped_weapon = TrackedField("equipped_weapon")
+    equipped_armor = TrackedField("equipped_armor")
+
+    # Starter skill list, shared by every player rather than copied into each one
+    skills = {
+        "Power Strike": 1,
+        "Berserk": 1,
+        "Fireball": 1,
+        "Lightning Strike": 1,
+    }
+
     def __init__(self, name, race, sub_race):
+        self.stale = ALL_STALE
         self.name = name
         self.race = race
         self.sub_race = sub_race
-        self.health = races[race]["health"] + sub_races[sub_race]["health"]
-        self.strength = races[race]["strength"] + sub_races[sub_race]["strength"]
-        self.defense = races[race]["defense"] + sub_races[sub_race]["defense"]
-        self.magic = races[race]["magic"] + sub_races[sub_race]["magic"]
-        self.agility = races[race]["agility"] + sub_races[sub_race]["agility"]
-        self.inventory = []
+        tables = content.load("races")
+        base, bonus = tables["races"][race], tables["sub_races"][sub_race]
+        self.health = base["health"] + bonus["health"]
+        self.strength = base["strength"] + bonus["strength"]
+        self.defense = base["defense"] + bonus["defense"]
+        self.magic = base["magic"] + bonus["magic"]
+        self.agility = base["agility"] + bonus["agility"]
+        self.inventory = Inventory()
         self.gold = 1000  # Starting gold
         self.location = "Town"
         self.level = 1
         self.exp = 0
-        self.skills = {
-            "Power Strike": 1,
-            "Berserk": 1,
-            "Fireball": 1,
-            "Lightning Strike": 1,
-        }
         self.skill_points = 0  # Points earned when leveling up
         self.skill_tree = SkillTree()
         self.equipped_weapon = []
         self.equipped_armor = []
-
-    def use_skill(self, skill_name, enemy):
-        skill = self.skill_tree.skills.get(skill_name)
-        if skill and skill["level"] > 0:
-            if skill_name == "Power Strike":
-                # Example for Power Strike, increasing damage
-                damage = self.strength * 1.5
-                print(f"{self.name} uses {skill_name}! Deals {damage} critical damage.")
-            elif skill_name == "Fireball":
-                damage = self.magic * 2
-                print(f"{self.name} casts {skill_name}! Deals {damage} fire damage.")
-            elif skill_name == "Lightning Strike":
-                damage = self.magic * 3
-                print(f"{self.name} casts {skill_name}! Deals {damage} lightning damage.")
-            enemy.health -= damage
-        else:
-            print(f"{skill_name} is not available or not upgraded yet.")
+        self.events = console  # Where this player's game events are sent
+
+    def refresh_stats(self):
+        # Recompute the derived stats whose fields changed since the last read
+        stale = self.stale
+        if stale & WEAPON_BONUS_BIT:
+            self.cached_weapon_bonus = (item_registry().stat(self.equipped_weapon, "strength")
+                                        if self.equipped_weapon else 0)
+        if stale & DEFENSE_BONUS_BIT:
+            self.cached_defense_bonus = (item_registry().stat(self.equipped_armor, "defense")
+                                         if self.equipped_armor else 0)
+        if stale & ATTACK_BIT:
+            self.cached_attack = self.strength + self.cached_weapon_bonus
+        if stale & ARMOR_BIT:
+            self.cached_armor = self.defense + self.cached_defense_bonus
+        if stale & MAX_HEALTH_BIT:
+            self.cached_max_health = base_health(self.race, self.sub_race)
+        self.stale = 0
+
+    def base_health(self):
+        if self.stale:
+            self.refresh_stats()
+        return self.cached_max_health
+
+    def status(self):
+        return {
+            "name": self.name,
+            "health": self.health,
+            "strength": self.strength,
+            "weapon_bonus": self.get_weapon_bonus(),
+            "defense": self.defense,
+            "defense_bonus": self.get_defense_bonus(),
+            "magic": self.magic,
+            "agility": self.agility,
+            "gold": self.gold,
+            "inventory": list(self.inventory),
+            "equipped_weapon": self.equipped_weapon,
+            "equipped_armor": self.equipped_armor,
+            "level": self.level,
+            "exp": self.exp,
+            "skill_points": self.skill_points,
+        }
 
     def show_status(self):
-        print(f"\n=== {self.name}'s Status ===")
-        print(f"Health: {self.health}")
-        print(f"Strength: {self.strength} (+{self.get_weapon_bonus()})")
-        print(f"Defense: {self.defense} (+{self.get_defense_bonus()})")
-        print(f"Magic: {self.magic}")
-        print(f"Agility: {self.agility}")
-        print(f"Gold: {self.gold}")
-        print(f"Inventory: {self.inventory}")
-        print(f"Equipped Weapon: {self.equipped_weapon}")
-        print(f"Equipped Armor: {self.equipped_armor}")
-        print(f"Level: {self.level}, EXP: {self.exp}")
-        print(f"Skill Points: {self.skill_points}\n")
+        self.events.emit("status", **self.status())
 
     def move(self, new_location):
         self.location = new_location
-        print(f"\nYou have moved to {self.location}.\n")
-    
+        self.events.emit("moved", location=self.location)
+
     def upgrade_skill(self, skill_name):
         self.skill_tree.upgrade_skill(skill_name, self)
 
     def get_weapon_bonus(self):
-        if self.equipped_weapon:
-            if "Sword" in self.equipped_weapon:
-                return 5  # Swords increase strength by 5
-        return 0
-    
+        if self.stale:
+            self.refresh_stats()
+        return self.cached_weapon_bonus
+
     def get_defense_bonus(self):
-        if self.equipped_armor:
-            if "Steel Armor" in self.equipped_armor:
-                return 10  # Armor adds a defense bonus of 10
-        return 0
+        if self.stale:
+            self.refresh_stats()
+        return self.cached_defense_bonus
+
+    def get_attack(self):
+        if self.stale:
+            self.refresh_stats()
+        return self.cached_attack
 
     def attack(self, enemy):
         # Calculate damage based on player's strength and weapon bonus
-        damage = self.strength + self.get_weapon_bonus()
+        damage = self.get_attack()
+        if isinstance(enemy, EnemyGroup):
+            # Basic attacks hit one member of a group
+            index = enemy.target()
+            enemy.hit(damage, index)
+            self.events.emit("player_attack", player=self.name, enemy=enemy.members[index].name, damage=damage,
+                             enemy_health=enemy.healths[index].item())
+            return
         enemy.health -= damage
-        print(f"{self.name} attacks! {enemy.name} takes {damage} damage. Enemy health: {enemy.health}")
-    
+        self.events.emit("player_attack", player=self.name, enemy=enemy.name, damage=damage, enemy_health=enemy.health)
+
     def use_skill(self, skill_name, enemy):
-        skill = self.skill_tree.skills.get(skill_name)
-        
-        if skill and skill["level"] > 0:
-            # Power Strike increases damage based on level
-            if skill_name == "Power Strike":
-                base_damage = self.strength
-                # Boost damage according to Power Strike level
-                damage = base_damage * (1 + (0.25 * skill["level"]))  # 25% more damage per level
-                print(f"{self.name} uses {skill_name}! Deals {damage} critical damage.")
-                enemy.health -= damage
-
-            # Berserk grants bonus damage when player's health is low
-            elif skill_name == "Berserk" and self.health < (0.3 * (races[self.race]["health"] + sub_races[self.sub_race]["health"])):
-                base_damage = self.strength
-                # Increased damage when health is below 30%
-                damage = base_damage * (1.5 + (0.2 * skill["level"]))  # +50% base damage when low on health, scaling with level
-                print(f"{self.name} goes Berserk! Deals {damage} boosted damage.")
-                enemy.health -= damage
-
-            # Fireball deals magic damage based on Magic level
-            elif skill_name == "Fireball":
-                base_damage = self.magic
-                # Scale fireball damage based on the level of Fireball skill
-                damage = base_damage * (1.5 + (0.3 * skill["level"]))  # Fireball damage increases by 30% per level
-                print(f"{self.name} casts {skill_name}! Deals {damage} fire damage.")
-                enemy.health -= damage
-
-            # Lightning Strike deals high damage based on skill level
-            elif skill_name == "Lightning Strike":
-                base_damage = self.magic
-                # Deal more lightning damage depending on Lightning Strike's level
-                damage = base_damage * (2 + (0.5 * skill["level"]))  # High damage that scales with level
-                print(f"{self.name} summons {skill_name}! Deals {damage} lightning damage.")
-                enemy.health -= damage
+        tree = self.skill_tree
+        index = tree.book.index.get(skill_name)
+        level = 0 if index is None else tree.levels[index]
+
+        if level > 0:
+            effect = tree.book.effects[index]
+            # Skills without a combat effect, or whose condition isn't met (Berserk
+            # above 30% health), do nothing
+            if effect is not None and (effect.condition is None or effect.condition(self.health, self.base_health())):
+                damage = getattr(self, effect.stat) * effect.multipliers[level]
+                self.events.emit(effect.message, player=self.name, skill=skill_name, damage=damage)
+                if not isinstance(enemy, EnemyGroup):
+                    enemy.health -= damage
+                elif effect.area:
+                    self.events.emit("area_hit", skill=skill_name, count=enemy.hit_all(damage))
+                else:
+                    enemy.hit(damage)
 
         else:
-            print(f"{skill_name} is not available or not upgraded yet.")
-    
+            self.events.emit("skill_unavailable", skill=skill_name)
+
     def use_item(self, item_name):
-        if item_name in self.inventory:
-            if "Health Potion" in item_name:
-                self.health += 50
-                print(f"Used {item_name}. Health is now {self.health}.")
-                self.inventory.remove(item_name)
+        registry = item_registry()
+        item_id = registry.id_of(item_name)
+        if item_id is not None and self.inventory.count_id(item_id):
+            heal = registry.stats["heal"][item_id]
+            if heal > 0:
+                self.health += heal
+                self.events.emit("item_used", item=item_name, health=self.health)
+                self.inventory.discard_id(item_id)
             else:
-                print(f"{item_name} cannot be used right now.")
+                self.events.emit("item_unusable", item=item_name)
         else:
-            print(f"You don't have {item_name} in your inventory.")
-    
+            self.events.emit("item_missing", item=item_name)
+
     def gain_exp(self, amount):
         self.exp += amount
-        print(f"Gained {amount} EXP! Current EXP: {self.exp}")
+        self.events.emit("exp_gained", amount=amount, exp=self.exp)
         self.check_level_up()
-    
+
     def check_level_up(self):
         if self.exp >= self.level * 100:
             self.level += 1
             self.skill_points += 1
-            print(f"Congratulations! {self.name} leveled up to Level {self.level}. Skill points available: {self.skill_points}")
-    
+            self.events.emit("level_up", player=self.name, level=self.level, skill_points=self.skill_points)
+
     def equip_item(self, item_name):
-        if item_name in self.inventory:
-            if "Sword" in item_name or "Staff" in item_name:
+        registry = item_registry()
+        item_id = registry.id_of(item_name)
+        if item_id is not None and self.inventory.count_id(item_id):
+            slot = registry.slots[item_id]
+            if slot == "weapon":
                 self.equipped_weapon = item_name
-                print(f"Equipped {item_name}.")
-            elif "Armor" in item_name:
+                self.events.emit("equipped", item=item_name)
+            elif slot == "armor":
                 self.equipped_armor = item_name
-                print(f"Equipped {item_name}.")
+                self.events.emit("equipped", item=item_name)
             else:
-                print(f"{item_name} cannot be equipped.")
+                self.events.emit("not_equippable", item=item_name)
         else:
-            print(f"You don't have {item_name} in your inventory.")
+            self.events.emit("item_missing", item=item_name)
 
 class Enemy:
+    # Per-fight state only; name, attack range and drops live on the shared archetype
+    __slots__ = ("archetype", "health")
+
     def __init__(self, name, health, attack_power):
-        self.name = name
+        self.archetype = enemy_registry().variant(name, health, attack_power)
         self.health = health
-        self.attack_power = attack_power
 
-    def attack(self, player):
+    @classmethod
+    def spawn(cls, archetype):
+        enemy = cls.__new__(cls)
+        enemy.archetype = archetype
+        enemy.health = archetype.health
+        return enemy
+
+    @property
+    def name(self):
+        return self.archetype.name
+
+    @property
+    def attack_power(self):
+        return self.archetype.attack_max
+
+    def attack(self, player, rng=random):
         # Enemy attack uses attack_power to deal damage
-        damage = random.randint(5, self.attack_power)
+        damage = rng.randint(self.archetype.attack_min, self.archetype.attack_max)
         player.health -= damage
-        print(f"The {self.name} attacks you and deals {damage} damage!")
+        player.events.emit("enemy_attack", enemy=self.name, damage=damage)
 
     def is_alive(self):
         return self.health > 0
 
+
+class EnemyPool:
+    # Recycles Enemy objects between fights instead of allocating one per encounter
+    def __init__(self, limit=1024):
+        self.limit = limit
+        self.free = []
+
+    def acquire(self, archetype):
+        if self.free:
+            enemy = self.free.pop()
+            enemy.archetype = archetype
+            enemy.health = archetype.health
+            return enemy
+        return Enemy.spawn(archetype)
+
+    def release(self, enemy):
+        if len(self.free) < self.limit:
+            self.free.append(enemy)
+
+
+enemy_pool = EnemyPool()
+
+
+class EnemyGroup(Enemy):
+    # Several enemies fought at once. Each member's health, attack range and
+    # whether it is still standing sit in NumPy arrays, so an area skill or
+    # the whole group's turn is one array operation however big the group.
+    # Location events yield a group like a single Enemy; name, archetype and
+    # health describe the group as a whole.
+    __slots__ = ("members", "healths", "attack_min", "attack_max", "alive")
+
+    def __init__(self, archetypes):
+        import numpy as np
+
+        self.members = tuple(archetypes)
+        self.archetype = self.members[0]
+        self.healths = np.array([member.health for member in self.members], dtype=np.float64)
+        self.attack_min = np.array([member.attack_min for member in self.members], dtype=np.int64)
+        self.attack_max = np.array([member.attack_max for member in self.members], dtype=np.int64)
+        self.alive = np.ones(len(self.members), dtype=bool)
+
+    @classmethod
+    def spawn(cls, archetype, count=1):
+        return cls([archetype] * count)
+
+    def __len__(self):
+        return len(self.members)
+
+    @property
+    def health(self):
+        # Health left across the members still standing
+        return self.healths[self.alive].sum().item()
+
+    @property
+    def standing(self):
+        return int(self.alive.sum())
+
+    def is_alive(self):
+        return bool(self.alive.any())
+
+    def target(self):
+        # Single-target attacks go to the first member still standing
+        return int(self.alive.argmax())
+
+    def hit(self, damage, index=None):
+        self.healths[self.target() if index is None else index] -= damage
+
+    def hit_all(self, damage):
+        # Area damage to every member still standing; returns how many were hit
+        alive = self.alive
+        self.healths[alive] -= damage
+        return int(alive.sum())
+
+    def fallen(self):
+        # Members brought down since the last call, as an array of indexes
+        import numpy as np
+
+        down = self.alive & (self.healths <= 0)
+        self.alive &= ~down
+        return np.flatnonzero(down)
+
+    def attack(self, player, rng):
+        # Every member still standing attacks: one batch of rolls, one total
+        alive = self.alive
+        damage = int(rng.integers(self.attack_min[alive], self.attack_max[alive]).sum())
+        player.health -= damage
+        player.events.emit("group_attack", count=int(alive.sum()), damage=damage)
+
+coliseum_archetypes = {}
+swarm_archetypes = {}
+
+def coliseum_archetype(battle):
+    # One shared archetype per challenger number, built the first time anyone reaches it
+    archetype = coliseum_archetypes.get(battle)
+    if archetype is None:
+        health, attack_power, _ = coliseum_challenger(battle)
+        archetype = enemy_registry().variant(f"Coliseum Challenger {battle}", health, attack_power)
+        coliseum_archetypes[battle] = archetype
+    return archetype
+
+def swarm_archetype(battle):
+    # Member of the swarm fought in a swarm battle: weak alone, deadly in numbers
+    archetype = swarm_archetypes.get(battle)
+    if archetype is None:
+        archetype = enemy_registry().add(f"Coliseum Grunt {battle}", COLISEUM_SWARM_HEALTH + battle, 1,
+                                         1 + battle // COLISEUM_SWARM_EVERY)
+        swarm_archetypes[battle] = archetype
+    return archetype
+
 class World:
     def __init__(self):
-        self.locations = {
-            "Senaria": "A safe place to rest and buy items.",
-            "Dark Amazon": "A dark forest filled with dangerous creatures.",
-            "Senaria Dungeon": "An ancient dungeon with hidden treasures and deadly traps.",
-            "Senaria Ruins": "Ruins of an old kingdom. Watch out for ghosts!",
-            "Decaria Mountains": "A mountainous region covered in fog. Home to trolls and dragons.",
-            "Crystal Caverns": "A glittering cave filled with rare gems and fierce elementals.",
-            "Forgotten Swamp": "A murky swamp with poisonous creatures and ancient curses.",
-            "Battle Coliseum": "A fierce arena where endless battles await. Each victory makes the next battle harder!"
-        }
+        self.locations = dict(content.load("world")["locations"])
+
+    def show_locations(self, events=console):
+        events.emit("locations", locations=dict(self.locations))
+
+class StoreCatalog:
+    # Store stock indexed for browsing: the items of every category (and of
+    # the whole store, under None) sorted by price then name, with the prices
+    # in a parallel list so a price range is two bisects and a page is a slice.
+    def __init__(self, stock):
+        registry = item_registry()
+        self.prices = {}  # Stock order, item -> price
+        for item in stock:
+            if registry.id_of(item) is None:
+                raise content.ContentError(f"Store stock item {item!r} is not in data/items.json")
+            self.prices[item] = registry.price(item)
+        entries = sorted((price, item) for item, price in self.prices.items())
+        self.entries = {None: entries}
+        for category in TYPES:
+            self.entries[category] = [(price, item) for price, item in entries if registry.type_of(item) == category]
+        self.keys = {category: [price for price, _ in entries] for category, entries in self.entries.items()}
+
+    def __len__(self):
+        return len(self.prices)
+
+    def span(self, category=None, min_price=None, max_price=None):
+        # Index range of the items in category priced min_price..max_price (inclusive)
+        prices = self.keys.get(category, ())
+        start = 0 if min_price is None else bisect_left(prices, min_price)
+        end = len(prices) if max_price is None else bisect_right(prices, max_price)
+        return start, max(start, end)
+
+    def count(self, category=None, min_price=None, max_price=None):
+        start, end = self.span(category, min_price, max_price)
+        return end - start
+
+    def query(self, category=None, min_price=None, max_price=None, offset=0, limit=None):
+        # (item, price) pairs, cheapest first
+        start, end = self.span(category, min_price, max_price)
+        start = min(start + offset, end)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [(item, price) for price, item in self.entries[category][start:end]]
+
+
+catalog = None
+
+def store_catalog():
+    # Built once and shared by every Store
+    global catalog
+    if catalog is None:
+        catalog = StoreCatalog(content.load("store")["items"])
+    return catalog
 
-    def show_locations(self):
-        print("\n=== Available Locations ===")
-        for location, description in self.locations.items():
-            print(f"{location}: {description}")
-        print()
 
 class Store:
     def __init__(self):
-        self.items = {
-            "Iron Sword": 100,
-            "Steel Sword": 300,
-            "Magic Staff": 500,
-            "Health Potion": 50,
-            "Leather Armor": 150,
-            "Steel Armor": 400,
-            "Enchanted Armor": 600,
-            "Gemstone": 800,
-            "Rare Herbs": 30,
-            "Magic Scroll": 1000,
-        }
+        # Stock comes from data/store.json, prices from the item registry
+        self.catalog = store_catalog()
+        self.items = self.catalog.prices
 
-    def show_items(self):
-        print("\n=== Store ===")
-        for item, price in self.items.items():
-            print(f"{item}: {price} gold")
-        print()
+    def show_items(self, events=console, category=None, min_price=None, max_price=None, offset=0, limit=None):
+        if (category, min_price, max_price, offset, limit) == (None, None, None, 0, None):
+            items = dict(self.items)
+        else:
+            items = dict(self.catalog.query(category, min_price, max_price, offset, limit))
+        events.emit("store_items", items=items)
 
     def buy_item(self, item_name, player):
         if item_name in self.items:
             price = self.items[item_name]
-            if player.gold >= price:
-                player.inventory.append(item_name)
+            if not player.inventory.has_room(item_name):
+                player.events.emit("inventory_full", item=item_name)
+            elif player.gold >= price:
+                player.inventory.add(item_name)
                 player.gold -= price
-                print(f"{item_name} purchased! Remaining gold: {player.gold}")
+                player.events.emit("purchased", item=item_name, gold=player.gold)
             else:
-                print("Not enough gold to buy this item.")
+                player.events.emit("not_enough_gold")
         else:
-            print(f"{item_name} is not available in the store.")
+            player.events.emit("not_in_store", item=item_name)
 
     def sell_item(self, item_name, player):
         if item_name in player.inventory:
             # Items sell for half their purchase price
-            sell_price = int(self.items.get(item_name, 0) * 0.5)
+            sell_price = int(item_registry().price(item_name) * 0.5)
             if sell_price > 0:
                 player.inventory.remove(item_name)
                 player.gold += sell_price
-                print(f"{item_name} sold for {sell_price} gold! Current gold: {player.gold}")
+                player.events.emit("sold", item=item_name, price=sell_price, gold=player.gold)
             else:
-                print(f"{item_name} cannot be sold.")
+                player.events.emit("cannot_sell", item=item_name)
         else:
-            print(f"You don't have {item_name} in your inventory.")
+            player.events.emit("item_missing", item=item_name)
+
+    # Batches. A batch is {item: count} (or a list of names, repeats allowed)
+    # and goes through whole or not at all: one gold check, one room check.
+
+    def buy_items(self, items, player):
+        order = batch_counts(items)
+        for item in order:
+            if item not in self.items:
+                player.events.emit("not_in_store", item=item)
+                return False
+        total = sum(self.items[item] * count for item, count in order.items())
+        if not player.inventory.has_room_for(order):
+            player.events.emit("inventory_full", item=", ".join(item for item in order if item not in player.inventory))
+            return False
+        if player.gold < total:
+            player.events.emit("not_enough_gold")
+            return False
+        for item, count in order.items():
+            player.inventory.add(item, count)
+        player.gold -= total
+        player.events.emit("purchased_batch", items=order, count=sum(order.values()), total=total, gold=player.gold)
+        return True
+
+    def sell_items(self, items, player):
+        order = batch_counts(items)
+        registry = item_registry()
+        total = 0
+        for item, count in order.items():
+            if player.inventory.count(item) < count:
+                player.events.emit("item_missing", item=item)
+                return False
+            # Items sell for half their purchase price
+            sell_price = int(registry.price(item) * 0.5)
+            if sell_price <= 0:
+                player.events.emit("cannot_sell", item=item)
+                return False
+            total += sell_price * count
+        for item, count in order.items():
+            player.inventory.discard(item, count)
+        player.gold += total
+        player.events.emit("sold_batch", items=order, count=sum(order.values()), price=total, gold=player.gold)
+        return True
+
+
+def batch_counts(items):
+    # {item: count} from a dict or an iterable of names
+    if isinstance(items, dict):
+        order = dict(items)
+    else:
+        order = {}
+        for item in items:
+            order[item] = order.get(item, 0) + 1
+    for item, count in order.items():
+        if not isinstance(count, int) or isinstance(count, bool) or count <= 0:
+            raise ValueError(f"Invalid count for {item}: {count!r}")
+    return order
 
 class Blacksmith:
     def combine(self, player):
         if len(player.inventory) < 2:
-            print("You need at least two weapons to combine.")
+            player.events.emit("need_two_items")
             return
-        
+
         # Pick two weapons to combine
-        print("\nAvailable items in inventory:")
-        for idx, item in enumerate(player.inventory):
-            print(f"{idx + 1}. {item}")
-        
+        player.events.emit("blacksmith_items", items=list(player.inventory))
+        if recipe_book().craftable(player.inventory):
+            self.show_recipes(player)
+
         try:
             choice1 = int(input("\nChoose the first item to combine: ")) - 1
             choice2 = int(input("Choose the second item to combine: ")) - 1
         except ValueError:
-            print("Invalid input.")
+            player.events.emit("error", message="Invalid input.")
             return
 
-        # Remove the original items and add a hybrid weapon
-        item1 = player.inventory.pop(choice1)
-        item2 = player.inventory.pop(choice2)
-        hybrid_weapon = f"Hybrid of {item1} and {item2}"
-        player.inventory.append(hybrid_weapon)
-        print(f"\n{item1} and {item2} were combined to create {hybrid_weapon}!")
+        self.combine_items(player, choice1, choice2)
+
+    def combine_items(self, player, choice1, choice2):
+        # choice1 and choice2 index the inventory as listed, both before anything is removed
+        items = list(player.inventory)
+        if not (0 <= choice1 < len(items) and 0 <= choice2 < len(items)) or choice1 == choice2:
+            player.events.emit("error", message="Invalid input.")
+            return
+        item1, item2 = items[choice1], items[choice2]
+        registry = item_registry()
+        first, second = registry.id_of(item1), registry.id_of(item2)
+        result_id = recipe_book().craft(first, second)
+        result = registry.name(result_id)
+        # Remove the original items and add what they make
+        player.inventory.discard_id(first)
+        player.inventory.discard_id(second)
+        if not player.inventory.add_id(result_id):
+            player.inventory.add_id(first)
+            player.inventory.add_id(second)
+            player.events.emit("inventory_full", item=result)
+            return
+        player.events.emit("combined", first=item1, second=item2, result=result)
+
+    def show_recipes(self, player):
+        # Recipes the player holds both inputs for
+        crafts = recipe_book().craftable(player.inventory)
+        player.events.emit("craftable", recipes=[{"first": a, "second": b, "result": c} for a, b, c in crafts])
+
+MAIN_MENU = [
+    "Explore",
+    "Show Status",
+    "Inventory",
+    "Display Skill Tree",
+    "Upgrade Skills",
+    "Save Game",
+    "Load Game",
+    "Store",
+    "Blacksmith",
+    "Equip Gear",
+    "Use Item",
+    "Exit",
+]
+
+# Battle Coliseum escalation: every challenger is tougher and pays more than the last
+COLISEUM_BASE_HEALTH = 30
+COLISEUM_BASE_ATTACK = 10
+COLISEUM_UNIQUE_ITEM_CHANCE = 0.2
+
+# Every COLISEUM_SWARM_EVERY-th battle is against a swarm of grunts instead
+# of one challenger, COLISEUM_SWARM_SIZE of them per COLISEUM_SWARM_EVERY battles
+COLISEUM_SWARM_EVERY = 10
+COLISEUM_SWARM_SIZE = 50
+COLISEUM_SWARM_HEALTH = 10
+
+def coliseum_challenger(battle):
+    # (health, attack_power, gold reward) of challenger number `battle`; works on NumPy arrays too
+    health = COLISEUM_BASE_HEALTH + (battle * 10)  # Increases health by 10 for each battle
+    attack_power = COLISEUM_BASE_ATTACK + (battle * 2)
+    gold_reward = 100 + (battle * 50)  # Rewards increase with each battle
+    return health, attack_power, gold_reward
+
+# Combat menu choices and the action each one stands for
+COMBAT_ACTIONS = {"1": "attack", "2": "item", "3": "skill", "4": "flee"}
 
 class Game:
-    def __init__(self, player):
+    def __init__(self, player, events=None, saves=None, rng=None):
         self.player = player
+        if events is not None:
+            player.events = events
+        self.events = player.events
         self.world = World()
         self.store = Store()
         self.blacksmith = Blacksmith()
+        self.saves = saves if saves is not None else SaveDirectory()
+        # All of this game's randomness comes from here; replaying rng.seed replays the game
+        self.rng = rng if rng is not None else RandomStream()
         self.skills = player.skill_tree.skills
         self.gold = player.gold
 
+    def narrate(self, text):
+        self.events.emit("narration", text=text)
+
+    def loot(self, item_name):
+        added = self.player.inventory.add(item_name)
+        if not added:
+            self.events.emit("inventory_full", item=item_name)
+        return added
+
     def start(self):
-        print("\n=== Welcome to the Dark Fantasy World ===")
+        self.narrate("\n=== Welcome to the Dark Fantasy World ===")
+        # Shown on every start, so any bug report can be replayed with --seed
+        self.events.emit("seed", seed=self.rng.seed)
         self.player.show_status()
         while True:
             self.show_menu()
 
     def display_skills(self):
-        print("\n=== Skill Tree ===")
-        for skill, data in self.skills.items():
-            # Ensure that the correct structure is used
-            print(f"{skill}: Level {data['level']}/{data['max_level']} - {data['description']}")
-        print()
+        # Ensure that the correct structure is used
+        self.player.skill_tree.display_skills(self.events)
 
     def show_menu(self):
-        print("\n=== Main Menu ===")
-        print("1. Explore")
-        print("2. Show Status")
-        print("3. Inventory")
-        print("4. Display Skill Tree")
-        print("5. Upgrade Skills")
-        print("6. Save Game")
-        print("7. Load Game")
-        print("8. Store")
-        print("9. Blacksmith")
-        print("10. Equip Gear")
-        print("11. Use Item")
-        print("12. Exit")
+        self.events.emit("menu", title="\n=== Main Menu ===", options=MAIN_MENU)
 
         choice = input("\nWhat would you like to do? (1-12): ")
 
@@ -538,24 +1460,22 @@ class Game:
         elif choice == '7':
             self.load_game()
         if choice == "8":
-            print("\n1. Buy Items\n2. Sell Items")
+            self.narrate("\n1. Buy Items\n2. Sell Items")
             sub_choice = input("Do you want to buy or sell? (1 for Buy, 2 for Sell): ")
             if sub_choice == "1":
-                self.store.show_items()
+                self.store.show_items(self.events)
                 item = input("Enter the name of the item to buy (or 'exit' to leave): ")
                 if item.lower() != 'exit':
                     self.store.buy_item(item, self.player)
             elif sub_choice == "2":
-                print("\n=== Inventory ===")
-                for item in self.player.inventory:
-                    print(item)
+                self.events.emit("sell_list", items=list(self.player.inventory))
                 item_to_sell = input("Enter the name of the item to sell (or 'exit' to leave): ")
                 if item_to_sell.lower() != 'exit':
                     self.store.sell_item(item_to_sell, self.player)
             else:
-                print("Invalid option.")
+                self.events.emit("error", message="Invalid option.")
         elif choice == "9":
-                print("\nYou visit the blacksmith.")
+                self.narrate("\nYou visit the blacksmith.")
                 self.blacksmith.combine(self.player)
         elif choice == "10":
                 item = input("\nEnter the name of the item to equip: ")
@@ -564,319 +1484,367 @@ class Game:
                 item = input("\nEnter the name of the item to use: ")
                 self.player.use_item(item)
         elif choice == '12':
-            print("Thank you for playing!")
-            exit()
+            self.quit()
+
+    def quit(self):
+        self.narrate("Thank you for playing!")
+        # Write out anything a write-behind saver still has queued
+        close = getattr(self.saves, "close", None)
+        if close is not None:
+            close()
+        flush = getattr(self.events, "flush", None)
+        if flush is not None:
+            flush()
+        exit()
 
     def explore(self):
-        self.world.show_locations()
+        self.world.show_locations(self.events)
         choice = input("Where would you like to go? ")
-        if choice in self.world.locations:
-            self.player.move(choice)
-            if choice == "Senaria":
-                self.senaria_event()
-            if choice == "Dark Amazon":
-                self.forest_event()
-            elif choice == "Senaria Dungeon":
-                self.dungeon_event()
-            elif choice == "Decaria Mountains":
-                self.mountain_event()
-            elif choice == "Crystal Caverns":
-                self.cavern_event()
-            elif choice == "Forgotten Swamp":
-                self.swamp_event()
-            elif choice == "Battle Coliseum":
-                self.coliseum_event()
-        else:
-            print("Invalid location.")
+        event = self.travel(choice)
+        if event is not None:
+            self.run_event(event)
+
+    def travel(self, location):
+        # Move the player and return the location's event, if it has one
+        if location not in self.world.locations:
+            self.events.emit("error", message="Invalid location.")
+            return None
+        self.player.move(location)
+        handlers = {
+            "Senaria": self.senaria_event,
+            "Battle Coliseum": self.coliseum_event,
+        }
+        handler = handlers.get(location)
+        if handler:
+            return handler()
+        if encounter_table(location) is not None:
+            return self.encounter_event(location)
+        return None
+
+    # Location events are generators so that they never block on input
+    # themselves. They yield an NPC when a conversation starts, an Enemy when
+    # a fight starts (and are sent back the combat result) and a string when
+    # they need an answer to a question. run_event drives them from the
+    # terminal; the session engine drives them from submitted commands.
+    def run_event(self, event):
+        answer = None
+        while True:
+            try:
+                step = event.send(answer)
+            except StopIteration:
+                return
+            if isinstance(step, NPC):
+                step.talk(self.events, self.player)
+                answer = None
+            elif isinstance(step, Enemy):
+                answer = self.combat(step)
+            else:
+                answer = input(step)
 
     def senaria_event(self):
-        print("You make it sefely to Senaria. The Only true safehaven in these lands.")
-
-        print("\nYou meet some townsfolk and spark a conversation.")
-        senaria_npcs[0].talk()
-
-    def forest_event(self):
-        print("You enter the Dark Amazon and hear eerie noises...")
-        
-        # Introduce the NPC interaction
-        print("\nYou encounter an NPC:")
-        dark_amazon_npcs[0].talk()
-
-        # After NPC interaction, continue with the rest of the event
-        roll = random.random()
-
-        if roll < 0.3:
-            print("A wild beast appears!")
-            enemy = Enemy("Beast", 30, 10)
-            self.combat(enemy)
-        elif 0.3 <= roll < 0.6:
-            print("A group of forest bandits ambushes you!")
-            enemy = Enemy("Forest Bandit", 35, 12)
-            self.combat(enemy)
-        else:
-            print("You find rare herbs and add them to your inventory.")
-            self.player.inventory.append("Rare Herbs")
-
-    def dungeon_event(self):
-        print("The dungeon is cold and full of danger...")
-        
-        print("\nYou encounter an NPC:")
-
-        senaria_dungeon_npcs[0].talk()
-        
-        roll = random.random()
-
-        if roll < 0.3:
-            print("A skeleton warrior charges at you!")
-            enemy = Enemy("Skeleton", 40, 12)
-            self.combat(enemy)
-        elif 0.3 <= roll < 0.6:
-            print("You encounter a deadly trap!")
-            trap_damage = random.randint(10, 20)
-            self.player.health -= trap_damage
-            print(f"A trap goes off! You take {trap_damage} damage.")
-        elif 0.6 <= roll < 0.8:
-            print("You discover a treasure chest filled with gold!")
-            gold_amount = random.randint(100, 300)
-            self.player.gold += gold_amount
-            print(f"You gained {gold_amount} gold. Current gold: {self.player.gold}")
+        self.narrate("You make it sefely to Senaria. The Only true safehaven in these lands.")
+
+        self.narrate("\nYou meet some townsfolk and spark a conversation.")
+        yield location_npcs("Senaria")[0]
+
+    def encounter_event(self, location):
+        # Exploration zones: meet the local NPC, then draw one outcome from the zone's encounter table
+        table = encounter_table(location)
+        self.narrate(table.intro)
+
+        self.narrate("\nYou encounter an NPC:")
+        yield location_npcs(location)[0]
+
+        outcome = table.draw(self.rng)
+        self.narrate(outcome["narration"])
+        if outcome["kind"] == "enemy" and "count" in outcome:
+            yield EnemyGroup.spawn(enemy_archetype(outcome["enemy"]), self.rng.randint(*outcome["count"]))
+        elif outcome["kind"] == "enemy":
+            enemy = enemy_pool.acquire(enemy_archetype(outcome["enemy"]))
+            yield enemy
+            enemy_pool.release(enemy)
         else:
-            print("You find a magical scroll and add it to your inventory.")
-            self.player.inventory.append("Magic Scroll")
-
-
-    def mountain_event(self):
-        print("You enter the Misty Mountains, the air is thick with fog...")
-        
-        print("\nYou encounter an NPC:")
-        decaria_mountains_npcs[0].talk()
-        
-        roll = random.random()
-
-        if roll < 0.3:
-                print("A troll emerges from the mist!")
-                enemy = Enemy("Troll", 50, 15)
-                self.combat(enemy)
-        elif 0.3 <= roll < 0.5:
-                print("You hear the roar of a dragon in the distance. It's coming your way!")
-                enemy = Enemy("Dragon", 80, 25)
-                self.combat(enemy)
-        elif 0.5 <= roll < 0.7:
-                print("You stumble upon an ancient warrior's grave and find enchanted armor!")
-                self.player.inventory.append("Enchanted Armor")
-        else:
-                print("You find a rare herb growing in the mist.")
-                self.player.inventory.append("Rare Herb")
-
-    def cavern_event(self):
-            print("The Crystal Caverns glitter with gems, but danger lurks in the shadows...")
-            
-            print("\nYou encounter an NPC:")
-            crystal_caverns_npcs[0].talk()
-            
-            roll = random.random()
-
-            if roll < 0.3:
-                print("An elemental creature attacks!")
-                enemy = Enemy("Crystal Elemental", 60, 20)
-                self.combat(enemy)
-            elif 0.3 <= roll < 0.6:
-                print("You are ambushed by a crystal spider!")
-                enemy = Enemy("Crystal Spider", 55, 18)
-                self.combat(enemy)
-            elif 0.6 <= roll < 0.8:
-                print("You find a shimmering gemstone that boosts your mana!")
-                self.player.mana += 10
-                print(f"Your mana increases by 10. Current mana: {self.player.mana}")
-            else:
-                print("You find a sparkling gemstone.")
-                self.player.inventory.append("Gemstone")
-
-    def swamp_event(self):
-        print("The Forgotten Swamp is murky and filled with poisonous creatures...")
-        
-        print("\nYou encounter an NPC:")
-        forgotten_swamp_npcs[0].talk()
-
-        roll = random.random()
-
-        if roll < 0.3:
-            print("A swamp serpent strikes!")
-            enemy = Enemy("Swamp Serpent", 40, 14)
-            self.combat(enemy)
-        elif 0.3 <= roll < 0.6:
-            print("A swamp hag appears and tries to curse you!")
-            enemy = Enemy("Swamp Hag", 45, 16)
-            self.combat(enemy)
-        elif 0.6 <= roll < 0.8:
-            print("You find a hidden swamp treasure!")
-            self.player.inventory.append("Swamp Treasure")
-        else:
-            print("You find an ancient relic buried in the mud.")
-            self.player.inventory.append("Ancient Relic")
+            self.outcome_handlers[outcome["kind"]](self, outcome)
+
+    def find_loot(self, outcome):
+        self.loot(outcome["item"])
+
+    def spring_trap(self, outcome):
+        trap_damage = self.rng.randint(*outcome["damage"])
+        self.player.health -= trap_damage
+        self.events.emit("trap", damage=trap_damage)
+
+    def find_gold(self, outcome):
+        gold_amount = self.rng.randint(*outcome["amount"])
+        self.player.gold += gold_amount
+        self.events.emit("gold_found", amount=gold_amount, gold=self.player.gold)
+
+    # Non-combat encounter outcomes by kind
+    outcome_handlers = {
+        "loot": find_loot,
+        "trap": spring_trap,
+        "gold": find_gold,
+    }
 
     def coliseum_event(self):
-        print("\nYou enter the Battle Coliseum. An endless series of fights awaits you!")
-        
+        self.narrate("\nYou enter the Battle Coliseum. An endless series of fights awaits you!")
+
         battle_count = 0
-        enemy_base_health = 30
-        enemy_base_attack = 10
-        base_attack_power = 1
 
         # Player chooses to keep fighting or leave
         while True:
             battle_count += 1
-            print(f"\n=== Battle {battle_count} ===")
-            
-            enemy_health = enemy_base_health + (battle_count * 10)  # Increases health by 10 for each battle
-            enemy_attack = enemy_base_attack + (battle_count * 2)
-            attack_power = base_attack_power + (battle_count * 2)
-            enemy = Enemy(f"Coliseum Challenger {battle_count}", enemy_health, enemy_attack, attack_power)
-            
-            print(f"A fierce {enemy.name} appears with {enemy.health} health and {enemy.attack_power} attack power!")
-
-            # Run combat and check for defeat
-            if not self.combat(enemy):  # If combat returns False, the player was defeated
-                print("You have been defeated in the Battle Coliseum!")
+            self.events.emit("battle", battle=battle_count)
+
+            enemy_health, enemy_attack, gold_reward = coliseum_challenger(battle_count)
+            if battle_count % COLISEUM_SWARM_EVERY == 0:
+                grunt = swarm_archetype(battle_count)
+                count = COLISEUM_SWARM_SIZE * battle_count // COLISEUM_SWARM_EVERY
+                self.events.emit("swarm", count=count, enemy=grunt.name, health=grunt.health)
+                won = yield EnemyGroup.spawn(grunt, count)
+            else:
+                enemy = enemy_pool.acquire(coliseum_archetype(battle_count))
+
+                self.events.emit("challenger", enemy=enemy.name, health=enemy.health, attack_power=enemy.attack_power)
+
+                # Run combat and check for defeat
+                won = yield enemy
+                enemy_pool.release(enemy)
+            if not won:  # If combat returns False, the player was defeated
+                self.events.emit("coliseum_defeat")
                 break
 
             # Victory rewards
-            gold_reward = 100 + (battle_count * 50)  # Rewards increase with each battle
-            print(f"Victory! You earned {gold_reward} gold.")
+            self.events.emit("victory_reward", gold=gold_reward)
             self.player.gold += gold_reward
-            
+
             # Chance to win a unique item after every battle
-            unique_item_chance = random.random()
-            if unique_item_chance < 0.2:  # 20% chance for a unique item
+            unique_item_chance = self.rng.random()
+            if unique_item_chance < COLISEUM_UNIQUE_ITEM_CHANCE:
                 unique_item = f"Unique Item {battle_count}"
-                print(f"You have obtained a {unique_item}!")
-                self.player.inventory.append(unique_item)
-            
+                self.events.emit("unique_item", item=unique_item)
+                self.loot(unique_item)
+
             # Ask if player wants to continue
-            choice = input("Do you want to fight the next challenger? (yes/no): ").lower()
+            choice = (yield "Do you want to fight the next challenger? (yes/no): ").lower()
             if choice != "yes":
-                print(f"You leave the Battle Coliseum after {battle_count} victories, carrying your rewards.")
+                self.events.emit("coliseum_leave", battles=battle_count)
                 break
 
+    def auto_coliseum(self, battles, leave_below=None):
+        # Resolve up to `battles` coliseum fights at once (basic attacks only)
+        # and apply the outcome to the player
+        from simulation import simulate_coliseum
+
+        result = simulate_coliseum(self.player, battles, seed=self.rng.generator, leave_below=leave_below)
+        player = self.player
+        player.health = result.health
+        player.gold += result.gold
+        player.exp = result.exp
+        player.level = result.level
+        player.skill_points = result.skill_points
+        for item in result.loot:
+            self.loot(item)
+        self.events.emit("coliseum_auto", battles=result.battles_won, gold=result.gold, loot=result.loot,
+                         fell_in=result.fell_in, health=player.health)
+        return result
+
+    def start_combat(self, enemy):
+        if isinstance(enemy, EnemyGroup):
+            self.events.emit("group_start", count=len(enemy), enemy=enemy.name)
+        else:
+            self.events.emit("combat_start", enemy=enemy.name)
+
     def combat(self, enemy):
-        print(f"\nYou are fighting a {enemy.name}!")
+        self.start_combat(enemy)
         while self.player.health > 0 and enemy.is_alive():
-            print("\nCombat Actions: [1] Attack [2] Use Item [3] Use Skills [4] Flee")
+            self.events.emit("combat_actions")
             combat_choice = input("Choose your action: ")
 
-            if combat_choice == "1":
-                self.player.attack(enemy)
-                if enemy.is_alive():
-                    enemy.attack(self.player)  # Enemy attacks using its attack_power
-            elif combat_choice == "2":
-                item = input("\nEnter the name of the item to use: ")
-                self.player.use_item(item)
-                if enemy.is_alive():
-                    enemy.attack(self.player)
-            elif combat_choice == "3":
-                skill_name = input("\nSelect a skill to use: ").title()
-                self.player.use_skill(skill_name, enemy)
-                if enemy.is_alive():
-                    enemy.attack(self.player)
-            elif combat_choice == "4":
-                print("You fled the battle!")
-                return True  # Fleeing is not a defeat, so return True
-
-            # After enemy's turn, check if the player is still alive
-            if self.player.health <= 0:
-                print("You were defeated!")
-                return False  # Return False only when the player's health is 0
+            action = COMBAT_ACTIONS.get(combat_choice)
+            argument = None
+            if action == "item":
+                argument = input("\nEnter the name of the item to use: ")
+            elif action == "skill":
+                argument = input("\nSelect a skill to use: ").title()
+
+            result = self.combat_turn(enemy, action, argument)
+            if result is not None:
+                return result
+
+    def combat_turn(self, enemy, action, argument=None):
+        # Play one round of combat. Returns True once the enemy is defeated or
+        # the player fled, False if the player was defeated and None while the
+        # fight goes on.
+        if isinstance(enemy, EnemyGroup):
+            return self.group_turn(enemy, action, argument)
+        if action == "attack":
+            self.player.attack(enemy)
+            if enemy.is_alive():
+                enemy.attack(self.player, self.rng)  # Enemy attacks using its attack_power
+        elif action == "item":
+            self.player.use_item(argument)
+            if enemy.is_alive():
+                enemy.attack(self.player, self.rng)
+        elif action == "skill":
+            self.player.use_skill(argument, enemy)
+            if enemy.is_alive():
+                enemy.attack(self.player, self.rng)
+        elif action == "flee":
+            self.events.emit("fled")
+            return True  # Fleeing is not a defeat, so return True
+
+        # After enemy's turn, check if the player is still alive
+        if self.player.health <= 0:
+            self.events.emit("defeated")
+            return False  # Return False only when the player's health is 0
 
         # If the enemy is defeated, return True
         if enemy.health <= 0:
-            print(f"You defeated the {enemy.name}!")
-            self.player.gain_exp(random.randint(50, 150))
+            self.events.emit("enemy_defeated", enemy=enemy.name)
+            self.player.gain_exp(self.rng.randint(50, 150))
+            for item, chance in enemy.archetype.drops:
+                if self.rng.random() < chance:
+                    self.loot(item)
+            return True
+        return None
+
+    def group_turn(self, group, action, argument=None):
+        # combat_turn against an EnemyGroup: the player acts, every member
+        # still standing answers, and each member that fell this turn gives
+        # its own experience and drops. Won once the whole group is down.
+        player = self.player
+        if action == "flee":
+            self.events.emit("fled")
             return True
+        if action == "attack":
+            player.attack(group)
+        elif action == "item":
+            player.use_item(argument)
+        elif action == "skill":
+            player.use_skill(argument, group)
+        fallen = group.fallen()
+        if action in ("attack", "item", "skill") and group.is_alive():
+            group.attack(player, self.rng)
+
+        if player.health <= 0:
+            self.events.emit("defeated")
+            return False
+
+        if len(fallen):
+            self.events.emit("enemies_defeated", count=len(fallen), standing=group.standing)
+            player.gain_exp(sum(self.rng.randint(50, 150) for _ in fallen))
+            for index in fallen.tolist():
+                for item, chance in group.members[index].drops:
+                    if self.rng.random() < chance:
+                        self.loot(item)
+        if not group.is_alive():
+            self.events.emit("group_defeated")
+            return True
+        return None
 
     def level_up(self):
         self.player.level += 1
         self.player.exp = 0
         self.player.health += 100
         self.player.skill_points += 2  # Earn skill points on level up
-        print(f"\nYou leveled up! You are now Level {self.player.level}.")
-        print(f"You have earned 2 skill points. Total Skill Points: {self.player.skill_points}\n")
+        self.events.emit("level_up_bonus", level=self.player.level, skill_points=self.player.skill_points)
 
     def upgrade_skills(self):
-        self.player.skill_tree.display_skills()
+        self.player.skill_tree.display_skills(self.events)
         skill_name = input("Which skill would you like to upgrade? ").title()
         self.player.upgrade_skill(skill_name)
 
     def show_inventory(self):
-        print("\n=== Inventory ===")
-        if self.player.inventory:
-            for item in self.player.inventory:
-                print(f"- {item}")
-        else:
-            print("Your inventory is empty.")
-        print()
-
-    def save_game(self):
-        player_data = {
-            "name": self.player.name,
-            "gold": self.player.gold,
-            "health": self.player.health,
-            "inventory": self.player.inventory,
-            "location": self.player.location,
-            "level": self.player.level,
-            "exp": self.player.exp,
-            "skill_points": self.player.skill_points,
-            "skills": {skill: data["level"] for skill, data in self.player.skill_tree.skills.items()}
-        }
+        self.events.emit("inventory", items=list(self.player.inventory))
+
+    def save_game(self, slot="default"):
+        # Appends what changed since the last save to the slot's journal
+        self.saves.slot(slot).save(self.player)
+        self.events.emit("game_saved")
+
+    def load_game(self, slot="default"):
+        save_slot = self.saves.slot(slot)
+        player_data = save_slot.load()
+        if player_data is None and slot == "default":
+            player_data = self.load_legacy_save()
+        if player_data is None:
+            self.events.emit("no_save")
+            return
 
-        with open('save_game.json', 'w') as save_file:
-            json.dump(player_data, save_file)
-        print("\nGame saved successfully!\n")
+        self.player.name = player_data["name"]
+        self.player.gold = player_data["gold"]
+        self.player.health = player_data["health"]
+        self.player.inventory = Inventory.load(player_data["inventory"], self.player.inventory.capacity,
+                                               player_data.get("hybrids"))
+        self.player.location = player_data["location"]
+        self.player.level = player_data["level"]
+        self.player.exp = player_data["exp"]
+        self.player.skill_points = player_data["skill_points"]
+
+        # Load skills
+        for skill, level in player_data["skills"].items():
+            self.player.skill_tree.set_level(skill, level)
+        save_slot.attach(self.player)
+
+        self.events.emit("game_loaded")
+        self.player.show_status()
 
-    def load_game(self):
+    def load_legacy_save(self):
+        # Saves from before save slots were a single save_game.json
         try:
             with open('save_game.json', 'r') as save_file:
-                player_data = json.load(save_file)
-                self.player.name = player_data["name"]
-                self.player.gold = player_data["gold"]
-                self.player.health = player_data["health"]
-                self.player.inventory = player_data["inventory"]
-                self.player.location = player_data["location"]
-                self.player.level = player_data["level"]
-                self.player.exp = player_data["exp"]
-                self.player.skill_points = player_data["skill_points"]
-
-                # Load skills
-                for skill, level in player_data["skills"].items():
-                    self.player.skill_tree.skills[skill]["level"] = level
-
-            print("\nGame loaded successfully!\n")
-            self.player.show_status()
+                return json.load(save_file)
         except FileNotFoundError:
-            print("\nNo saved game found!\n")
+            return None
 
 
-def create_character():
-    print("=== Character Creation ===")
+def create_character(events=console):
+    tables = content.load("races")
+    races, sub_races = tables["races"], tables["sub_races"]
+    events.emit("narration", text="=== Character Creation ===")
     name = input("Enter your character's name: ")
 
     # Select Race
-    print("\nSelect your race:")
-    for idx, race in enumerate(races.keys(), 1):
-        print(f"{idx}. {race}")
+    events.emit("menu", title="\nSelect your race:", options=list(races.keys()))
     race_choice = int(input("\nChoose a race (1-4): ")) - 1
     race = list(races.keys())[race_choice]
 
     # Select Sub-Race
-    print("\nSelect your sub-race:")
-    for idx, sub_race in enumerate(sub_races.keys(), 1):
-        print(f"{idx}. {sub_race}")
+    events.emit("menu", title="\nSelect your sub-race:", options=list(sub_races.keys()))
     sub_race_choice = int(input("\nChoose a sub-race (1-6): ")) - 1
     sub_race = list(sub_races.keys())[sub_race_choice]
 
     return Player(name, race, sub_race)
 
-# Initialize game
-player = create_character()
-game = Game(player)
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Play Helbrand in the terminal.")
+    parser.add_argument("--save-dir", default=SAVE_DIR, help="Directory for save slots")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="Save on a background thread, merging saves made close together")
+    parser.add_argument("--seed", type=int, help="Seed for the game's random stream, to replay a game exactly")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Record timings and counters, written to PATH on exit (.json for JSON, else Prometheus)")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        import metrics
+
+        metrics.enable(sys.modules[__name__])
+        atexit.register(metrics.write, args.metrics)
+
+    saves = SaveDirectory(args.save_dir)
+    if args.write_behind:
+        from write_behind import WriteBehindSaver
+        saves = WriteBehindSaver(saves)
+
+    # Initialize game
+    player = create_character()
+    game = Game(player, saves=saves, rng=RandomStream(args.seed))
+
+    game.start()
 
-game.start()
+if __name__ == "__main__":
+    main()
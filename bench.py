@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import Helbrand
+from Helbrand import (Enemy, EnemyGroup, Game, Inventory, Player, SkillTree, create_character, render_event,
+                      swarm_archetype)
+from enemies import enemy_archetype
+from journal import SaveDirectory
+from rng import RandomStream
+
+# Benchmarks for the terminal game's hot paths. Each benchmark drives the
+# real code through ScriptedIO, which answers input() prompts from a script
+# and renders every event the way the console would (without printing), so
+# nothing is faked below the input/output boundary.
+#
+#   python bench.py              run everything and compare with the baseline
+#   python bench.py --update     run and store the results as the new baseline
+#   python bench.py combat save  run only some benchmarks
+#
+# Throughput is recorded relative to a fixed pure-Python calibration loop
+# run alongside, so a baseline recorded on one machine still means
+# something on another. A run fails (exit status 1) when a benchmark's
+# relative throughput drops, or its peak memory grows, by more than the
+# threshold stored with the baseline (memory gets MEMORY_SLACK_KIB on top).
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+DEFAULT_THRESHOLD = 0.25
+
+# Peak memory may also grow by this much before it counts as a regression;
+# small peaks move by a few KiB with where a round falls in the RNG's refills
+MEMORY_SLACK_KIB = 64
+
+COMBAT_PROMPT = "Choose your action: "
+NEXT_CHALLENGER_PROMPT = "Do you want to fight the next challenger? (yes/no): "
+SKILL_PROMPT = "\nSelect a skill to use: "
+
+
+class ScriptedIO:
+    # Terminal stand-in. script is a list of answers given in order, or a
+    # {prompt: [answers]} mapping; either way the answers repeat once used up.
+    def __init__(self, script):
+        self.script = script
+        self.positions = {}
+        self.events = 0
+        self.rendered = 0  # Characters of output the events would have printed
+
+    def input(self, prompt=""):
+        answers = self.script if isinstance(self.script, list) else self.script.get(prompt)
+        if not answers:
+            raise RuntimeError(f"No scripted answer for prompt {prompt!r}")
+        key = None if isinstance(self.script, list) else prompt
+        position = self.positions.get(key, 0)
+        self.positions[key] = position + 1
+        return answers[position % len(answers)]
+
+    def emit(self, kind, **data):
+        self.events += 1
+        self.rendered += len(render_event(kind, data))
+
+    def __enter__(self):
+        # The game reads the terminal through its module-level input()
+        self.terminal_input = Helbrand.input
+        Helbrand.input = self.input
+        return self
+
+    def __exit__(self, *exc_info):
+        Helbrand.input = self.terminal_input
+
+
+def new_game(io, saves=None):
+    player = Player("Bench", "Elves", "Werewolf")
+    return Game(player, events=io, saves=saves, rng=RandomStream(1))
+
+
+# Benchmarks. Each one sets up, then returns a function that runs one round
+# and returns how many operations the round did.
+
+def bench_create_character():
+    io = ScriptedIO(["Bench", "1", "1"])
+
+    def run():
+        with io:
+            for _ in range(100):
+                create_character(io)
+        return 100
+    return run
+
+
+def bench_combat():
+    io = ScriptedIO({COMBAT_PROMPT: ["1"]})
+    game = new_game(io)
+    troll = enemy_archetype("Troll")
+
+    def run():
+        with io:
+            for _ in range(100):
+                game.player.health = 10 ** 6
+                game.combat(Enemy.spawn(troll))
+        return 100
+    return run
+
+
+def bench_coliseum():
+    # Nine battles per visit, attacking every turn; the tenth would be a swarm (see bench_swarm)
+    io = ScriptedIO({COMBAT_PROMPT: ["1"], NEXT_CHALLENGER_PROMPT: ["yes"] * 8 + ["no"]})
+    game = new_game(io)
+
+    def run():
+        with io:
+            for _ in range(10):
+                game.player.health = 10 ** 6
+                game.run_event(game.coliseum_event())
+        return 90
+    return run
+
+
+def bench_swarm():
+    # A hundred-strong coliseum swarm, cleared with Fireball
+    io = ScriptedIO({COMBAT_PROMPT: ["3"], SKILL_PROMPT: ["Fireball"]})
+    game = new_game(io)
+    game.player.skill_tree.set_level("Fireball", 1)
+    grunt = swarm_archetype(20)
+
+    def run():
+        with io:
+            for _ in range(100):
+                game.player.health = 10 ** 6
+                game.combat(EnemyGroup.spawn(grunt, 100))
+        return 100
+    return run
+
+
+def bench_upgrade_skill():
+    # Every skill from a fresh tree, in an order that meets the dependencies
+    book = SkillTree().book
+    order = [book.names[index] for index in book.order]
+    io = ScriptedIO(order)
+    game = new_game(io)
+
+    def run():
+        with io:
+            for _ in range(20):
+                game.player.skill_tree = SkillTree()
+                game.player.skill_points = len(order)
+                for _ in order:
+                    game.upgrade_skills()
+        return 20 * len(order)
+    return run
+
+
+def bench_store():
+    # Buy a Health Potion and sell it back through the main menu
+    io = ScriptedIO(["8", "1", "Health Potion", "8", "2", "Health Potion"])
+    game = new_game(io)
+
+    def run():
+        with io:
+            for _ in range(100):
+                game.player.gold = 1000
+                game.show_menu()
+                game.show_menu()
+        return 200
+    return run
+
+
+def bench_blacksmith():
+    io = ScriptedIO(["1", "2"])
+    game = new_game(io)
+
+    def run():
+        with io:
+            for _ in range(100):
+                game.player.inventory = Inventory(["Iron Sword", "Steel Sword"])
+                game.blacksmith.combine(game.player)
+        return 100
+    return run
+
+
+def bench_save_load():
+    # Journaled saves without fsync, so the numbers measure the game rather than the disk
+    directory = tempfile.mkdtemp(prefix="helbrand-bench-")
+    io = ScriptedIO([])
+    game = new_game(io, SaveDirectory(directory, fsync=False))
+    game.player.inventory.extend(["Health Potion"] * 5 + ["Iron Sword", "Gemstone"])
+
+    def run():
+        for _ in range(50):
+            game.player.gold += 1
+            game.save_game()
+            game.load_game()
+        return 100
+    run.cleanup = lambda: shutil.rmtree(directory, ignore_errors=True)
+    return run
+
+
+BENCHMARKS = {
+    "create_character": bench_create_character,
+    "combat": bench_combat,
+    "coliseum": bench_coliseum,
+    "swarm": bench_swarm,
+    "upgrade_skill": bench_upgrade_skill,
+    "store": bench_store,
+    "blacksmith": bench_blacksmith,
+    "save_load": bench_save_load,
+}
+
+
+def calibrate(duration):
+    # Operations per second of a fixed pure-Python workload on this machine
+    def run():
+        table = {}
+        for i in range(1000):
+            table[i % 97] = table.get(i % 97, 0) + i
+        return 1000
+    return throughput(run, duration)
+
+
+def throughput(run, duration, rounds=3):
+    # Best of `rounds` runs of at least `duration` seconds each, in ops/sec
+    run()  # Warm-up
+    best = 0.0
+    for _ in range(rounds):
+        ops = 0
+        started = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < duration:
+            ops += run()
+            elapsed = time.perf_counter() - started
+        best = max(best, ops / elapsed)
+    return best
+
+
+def peak_memory(run):
+    # Peak KiB allocated during one round
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(names, duration):
+    calibration = calibrate(duration)
+    results = {}
+    for name in names:
+        run = BENCHMARKS[name]()
+        try:
+            ops_per_sec = throughput(run, duration)
+            results[name] = {
+                "ops_per_sec": round(ops_per_sec, 1),
+                "relative": round(ops_per_sec / calibration, 6),
+                "peak_kib": round(peak_memory(run), 1),
+            }
+        finally:
+            cleanup = getattr(run, "cleanup", None)
+            if cleanup is not None:
+                cleanup()
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Lines describing every regression beyond the threshold
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result["relative"] < expected["relative"] * (1 - threshold):
+            change = result["relative"] / expected["relative"] - 1
+            failures.append(f"{name}: throughput {change:+.0%} against the baseline")
+        if result["peak_kib"] > expected["peak_kib"] * (1 + threshold) + MEMORY_SLACK_KIB:
+            change = result["peak_kib"] / expected["peak_kib"] - 1
+            failures.append(f"{name}: peak memory {change:+.0%} against the baseline")
+    return failures
+
+
+def load_baseline(path):
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {"threshold": DEFAULT_THRESHOLD, "benchmarks": {}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Helbrand's hot paths against a stored baseline.")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK",
+                        help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file")
+    parser.add_argument("--update", action="store_true", help="Store this run's results as the baseline")
+    parser.add_argument("--threshold", type=float,
+                        help="Allowed regression as a fraction (default: the baseline's, else 0.25)")
+    parser.add_argument("--duration", type=float, default=0.2, help="Seconds per timing round")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    names = args.benchmarks or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    baseline = load_baseline(args.baseline)
+    threshold = args.threshold if args.threshold is not None else baseline.get("threshold", DEFAULT_THRESHOLD)
+    results = run_benchmarks(names, args.duration)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            expected = baseline["benchmarks"].get(name)
+            versus = ""
+            if expected is not None:
+                versus = f"  ({result['relative'] / expected['relative'] - 1:+.0%} vs baseline)"
+            print(f"{name:18} {result['ops_per_sec']:>12,.0f} ops/s  {result['peak_kib']:>9,.1f} KiB peak{versus}")
+
+    if args.update:
+        baseline["threshold"] = threshold
+        baseline["benchmarks"].update(results)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    failures = compare(results, baseline["benchmarks"], threshold)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import marshal
+import os
+
+# Content registry. Game data (races, skills, store stock, locations, NPCs,
+# ...) lives in JSON files under data/, one file per subsystem. The first
+# time a subsystem is needed its file is parsed, run through the
+# subsystem's compiler and written to data/.cache as marshal data tagged
+# with a hash of the source and the compiler that ran. Later processes load
+# the compiled form straight from the cache, and only for the subsystems
+# they touch.
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Bump whenever a compiler changes so stale caches get rebuilt
+CACHE_VERSION = 5
+
+COMPILERS = {}
+
+
+def compiler(name):
+    # Register a function that turns a subsystem's parsed JSON into its compiled form
+    def register(function):
+        COMPILERS[name] = function
+        # Anything loaded before the compiler was known is raw data
+        registry.loaded.pop(name, None)
+        return function
+    return register
+
+
+class ContentError(Exception):
+    pass
+
+
+class ContentRegistry:
+    def __init__(self, directory=CONTENT_DIR, cache_directory=None):
+        self.directory = directory
+        self.cache_directory = cache_directory or os.path.join(directory, ".cache")
+        self.loaded = {}
+
+    def load(self, name):
+        if name not in self.loaded:
+            self.loaded[name] = self.compile(name)
+        return self.loaded[name]
+
+    def source_path(self, name):
+        return os.path.join(self.directory, f"{name}.json")
+
+    def cache_path(self, name):
+        return os.path.join(self.cache_directory, f"{name}.bin")
+
+    def compile(self, name):
+        path = self.source_path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise ContentError(f"No content file for '{name}' in {self.directory}")
+        stamp = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+        compile_function = COMPILERS.get(name)
+        # A cache is only good for the same compiler: data cached by a process
+        # that loaded it before importing the compiler was never compiled
+        compiled_by = compile_function.__qualname__ if compile_function is not None else None
+
+        cached = self.read_cache(name)
+        if cached is not None and cached[0].get("compiler") != compiled_by:
+            cached = None
+        if cached is not None:
+            header, data_offset = cached
+            # Same file on disk as last time: trust the cache without hashing
+            if header["stamp"] == stamp:
+                return self.read_cached_data(name, data_offset)
+
+        # Only pay for the parser and hash imports when something has to be rebuilt
+        import json
+
+        with open(path, "rb") as source_file:
+            source = source_file.read()
+        digest = self.digest(source)
+        if cached is not None and cached[0]["digest"] == digest:
+            # Touched but unchanged: refresh the stamp, keep the compiled data
+            data = self.read_cached_data(name, cached[1])
+        else:
+            data = json.loads(source)
+            if compile_function is not None:
+                data = compile_function(data)
+        self.write_cache(name, {"stamp": stamp, "digest": digest, "compiler": compiled_by}, data)
+        return data
+
+    def digest(self, source):
+        import hashlib
+
+        return hashlib.blake2b(source, digest_size=16, person=b"helbrand-v%d" % CACHE_VERSION).hexdigest()
+
+    def read_cache(self, name):
+        try:
+            with open(self.cache_path(name), "rb") as cache_file:
+                header = marshal.load(cache_file)
+                return header, cache_file.tell()
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def read_cached_data(self, name, offset):
+        with open(self.cache_path(name), "rb") as cache_file:
+            cache_file.seek(offset)
+            return marshal.load(cache_file)
+
+    def write_cache(self, name, header, data):
+        path = self.cache_path(name)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            with open(temp_path, "wb") as cache_file:
+                marshal.dump(header, cache_file)
+                marshal.dump(data, cache_file)
+            os.replace(temp_path, path)
+        except (OSError, ValueError):
+            # Read-only installs still work, they just compile on every start
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def clear(self):
+        self.loaded.clear()
+
+
+registry = ContentRegistry()
+
+
+def load(name):
+    return registry.load(name)
@@ -0,0 +1,72 @@
+import content
+from items import item_registry
+
+# Blacksmith recipes. data/recipes.json lists pairs of items that combine
+# into a specific item; any other pair makes a generic hybrid (see
+# ItemRegistry.hybrid). The recipe graph is kept both ways: inputs -> output
+# for combining, and ingredient -> recipes using it, so listing what an
+# inventory can craft only looks at the recipes of the items it holds
+# instead of at every pair of stacks.
+
+
+@content.compiler("recipes")
+def compile_recipes(data):
+    seen = set()
+    for recipe in data["recipes"]:
+        if len(recipe["inputs"]) != 2:
+            raise content.ContentError(f"Recipe for {recipe['output']!r} needs exactly two inputs")
+        inputs = tuple(sorted(recipe["inputs"]))
+        if inputs in seen:
+            raise content.ContentError(f"More than one recipe combines {inputs[0]!r} and {inputs[1]!r}")
+        seen.add(inputs)
+    return data
+
+
+def recipe_key(first, second):
+    # Recipes don't care about input order
+    return (first, second) if first <= second else (second, first)
+
+
+class RecipeBook:
+    def __init__(self, recipes):
+        self.registry = item_registry()
+        self.outputs = {}  # recipe_key(first id, second id) -> output id
+        self.uses = {}  # Ingredient id -> [(other ingredient id, output id)]
+        for recipe in recipes:
+            ids = [self.registry.id_of(item) for item in recipe["inputs"] + [recipe["output"]]]
+            if None in ids:
+                raise content.ContentError(f"Recipe for {recipe['output']!r} uses an item missing from data/items.json")
+            first, second, output = ids
+            self.outputs[recipe_key(first, second)] = output
+            self.uses.setdefault(first, []).append((second, output))
+            if second != first:
+                self.uses.setdefault(second, []).append((first, output))
+
+    def craft(self, first, second):
+        # Id of the item that combining the two item ids makes
+        output = self.outputs.get(recipe_key(first, second))
+        if output is None:
+            output = self.registry.hybrid(first, second)
+        return output
+
+    def craftable(self, inventory):
+        # (first, second, output) names for every recipe the inventory holds both inputs of
+        names = self.registry.names
+        found = []
+        for item_id, count in inventory.counts.items():
+            for other, output in self.uses.get(item_id, ()):
+                # Each recipe is listed under both inputs; report it from the lower id only
+                if other < item_id or inventory.count_id(other) < (2 if other == item_id else 1):
+                    continue
+                found.append((names[item_id], names[other], names[output]))
+        return found
+
+
+recipes = None
+
+
+def recipe_book():
+    global recipes
+    if recipes is None:
+        recipes = RecipeBook(content.load("recipes")["recipes"])
+    return recipes
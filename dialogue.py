@@ -0,0 +1,333 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from collections import OrderedDict
+
+import content
+
+# NPC dialogue graphs. data/dialogue.json maps NPC names to graphs of nodes:
+#
+#   "Elder Rowan": {"start": "greet", "nodes": {
+#       "greet": {"line": "Welcome!", "choices": [
+#           {"text": "Tell me about the dungeon.", "next": "dungeon"},
+#           {"text": "I seek the Helbrand.", "next": "helbrand", "if": {"min_level": 3}},
+#           {"text": "Farewell."}]},
+#       ...}}
+#
+# Entering a node has the NPC say its line (if any) and offers the choices
+# whose conditions the player meets; a choice without "next", or a node
+# without choices, ends the conversation. A plain list of lines is also
+# accepted: the player picks one and the NPC says it.
+#
+# The JSON is compiled to data/.cache/dialogue.bin, rebuilt whenever the
+# source changes: fixed-size node, choice and condition records that point
+# at each other by index, and one string table where every distinct text in
+# the corpus is stored once. DialogueStore maps the file and decodes nodes
+# only when a conversation reaches them, keeping the most recently used in
+# an LRU cache, so memory follows the dialogue being spoken rather than the
+# size of the corpus. A read-only install keeps the compiled bytes in memory
+# instead.
+
+MAGIC = b"HBDLG001"
+VERSION = 1
+
+# magic, version, NPC, node, choice, condition and string counts, source mtime and size
+HEADER = struct.Struct("<8sIIIIIIqQ")
+NPC_RECORD = struct.Struct("<II")  # name string, start node
+NODE_RECORD = struct.Struct("<III")  # line string, first choice, choice count
+CHOICE_RECORD = struct.Struct("<IIII")  # text string, next node, first condition, condition count
+CONDITION_RECORD = struct.Struct("<II")  # condition name string, JSON argument string
+OFFSET = struct.Struct("<I")
+
+NONE = 0xFFFFFFFF  # No line / no next node
+
+# Decoded nodes kept in memory per store
+DEFAULT_CACHE_NODES = 4096
+
+CONDITIONS = {}
+
+
+def condition(name):
+    # Register a dialogue condition: function(player, argument) -> bool
+    def register(function):
+        CONDITIONS[name] = function
+        return function
+    return register
+
+
+@condition("min_level")
+def min_level(player, level):
+    return player.level >= level
+
+
+@condition("min_gold")
+def min_gold(player, gold):
+    return player.gold >= gold
+
+
+@condition("has_item")
+def has_item(player, item):
+    return player.inventory.count(item) > 0
+
+
+@condition("race")
+def is_race(player, race):
+    return player.race == race
+
+
+@condition("sub_race")
+def is_sub_race(player, sub_race):
+    return player.sub_race == sub_race
+
+
+@condition("skill")
+def has_skill(player, requirement):
+    skill, level = requirement
+    return player.skill_tree.level(skill) >= level
+
+
+def flat_graph(lines):
+    # Graph form of a plain list of lines
+    nodes = {"start": {"choices": [{"text": line, "next": str(i)} for i, line in enumerate(lines)]}}
+    for i, line in enumerate(lines):
+        nodes[str(i)] = {"line": line}
+    return {"start": "start", "nodes": nodes}
+
+
+def compile_dialogue(data, stamp):
+    # The compiled file's bytes
+    strings = {}  # Text -> string index, so each distinct text is stored once
+
+    def string(text):
+        return strings.setdefault(text, len(strings))
+
+    npcs, nodes, choices, conditions = [], [], [], []
+    for npc_name, graph in data["dialogues"].items():
+        if isinstance(graph, list):
+            graph = flat_graph(graph)
+        ids = {node_id: len(nodes) + i for i, node_id in enumerate(graph["nodes"])}
+        if graph["start"] not in ids:
+            raise content.ContentError(f"Dialogue of {npc_name!r} starts at unknown node {graph['start']!r}")
+        npcs.append((string(npc_name), ids[graph["start"]]))
+        for node_id, node in graph["nodes"].items():
+            first_choice = len(choices)
+            for choice in node.get("choices", ()):
+                target = choice.get("next")
+                if target is not None and target not in ids:
+                    raise content.ContentError(
+                        f"Dialogue of {npc_name!r}: {node_id!r} leads to unknown node {target!r}")
+                first_condition = len(conditions)
+                for name, argument in choice.get("if", {}).items():
+                    if name not in CONDITIONS:
+                        raise content.ContentError(f"Dialogue of {npc_name!r}: unknown condition {name!r}")
+                    conditions.append((string(name), string(json.dumps(argument))))
+                choices.append((string(choice["text"]), NONE if target is None else ids[target], first_condition,
+                                len(conditions) - first_condition))
+            line = node.get("line")
+            nodes.append((NONE if line is None else string(line), first_choice, len(choices) - first_choice))
+
+    encoded = [text.encode() for text in strings]
+    output = bytearray(HEADER.pack(MAGIC, VERSION, len(npcs), len(nodes), len(choices), len(conditions),
+                                   len(encoded), *stamp))
+    for records, record in ((npcs, NPC_RECORD), (nodes, NODE_RECORD), (choices, CHOICE_RECORD),
+                            (conditions, CONDITION_RECORD)):
+        for fields in records:
+            output += record.pack(*fields)
+    offset = 0
+    for text in encoded:
+        output += OFFSET.pack(offset)
+        offset += len(text)
+    output += OFFSET.pack(offset)
+    output += b"".join(encoded)
+    return bytes(output)
+
+
+def write_compiled(path, compiled):
+    # Returns False if path can't be written (e.g. a read-only install)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(temp_path, "wb") as compiled_file:
+            compiled_file.write(compiled)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+class DialogueNode:
+    __slots__ = ("line", "choices")
+
+    def __init__(self, line, choices):
+        self.line = line
+        self.choices = choices  # (text, next node or None, ((condition, argument), ...)) tuples
+
+
+class DialogueStore:
+    def __init__(self, data, name="dialogue", cache_nodes=DEFAULT_CACHE_NODES):
+        # data is a compiled dialogue file: a read-only mmap of one, or its bytes
+        self.map = data
+        (magic, version, npc_count, node_count, choice_count, condition_count, string_count,
+         *stamp) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise content.ContentError(f"{name} is not a compatible dialogue file")
+        self.stamp = tuple(stamp)
+        self.node_count = node_count
+        npc_offset = HEADER.size
+        self.node_offset = npc_offset + npc_count * NPC_RECORD.size
+        self.choice_offset = self.node_offset + node_count * NODE_RECORD.size
+        self.condition_offset = self.choice_offset + choice_count * CHOICE_RECORD.size
+        self.string_offset = self.condition_offset + condition_count * CONDITION_RECORD.size
+        self.text_offset = self.string_offset + (string_count + 1) * OFFSET.size
+        self.nodes = OrderedDict()  # Node index -> DialogueNode, least recently used first
+        self.cache_nodes = cache_nodes
+        # Only the NPC table is read up front
+        self.starts = {}
+        for i in range(npc_count):
+            name, start = NPC_RECORD.unpack_from(self.map, npc_offset + i * NPC_RECORD.size)
+            self.starts[self.string(name)] = start
+
+    @classmethod
+    def open(cls, path, cache_nodes=DEFAULT_CACHE_NODES):
+        with open(path, "rb") as compiled_file:
+            data = mmap.mmap(compiled_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(data, path, cache_nodes)
+        except Exception:
+            data.close()
+            raise
+
+    def close(self):
+        self.nodes.clear()
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+    def string(self, index):
+        start, end = struct.unpack_from("<II", self.map, self.string_offset + index * OFFSET.size)
+        # Interned, so a line shared by many nodes is one object however many of them are cached
+        return sys.intern(self.map[self.text_offset + start:self.text_offset + end].decode())
+
+    def start(self, npc_name):
+        # Start node of an NPC's dialogue, None if the NPC has none
+        return self.starts.get(npc_name)
+
+    def node(self, index):
+        nodes = self.nodes
+        node = nodes.get(index)
+        if node is not None:
+            nodes.move_to_end(index)
+            return node
+        line, first, count = NODE_RECORD.unpack_from(self.map, self.node_offset + index * NODE_RECORD.size)
+        node = DialogueNode(None if line == NONE else self.string(line),
+                            tuple(self.choice(first + i) for i in range(count)))
+        nodes[index] = node
+        if len(nodes) > self.cache_nodes:
+            nodes.popitem(last=False)
+        return node
+
+    def choice(self, index):
+        offset = self.choice_offset + index * CHOICE_RECORD.size
+        text, target, first, count = CHOICE_RECORD.unpack_from(self.map, offset)
+        conditions = []
+        for i in range(first, first + count):
+            name, argument = CONDITION_RECORD.unpack_from(self.map, self.condition_offset + i * CONDITION_RECORD.size)
+            conditions.append((self.string(name), json.loads(self.string(argument))))
+        return self.string(text), None if target == NONE else target, tuple(conditions)
+
+
+class FlatDialogue:
+    # In-memory dialogue of an NPC made with a list of lines (see flat_graph)
+    def __init__(self, lines):
+        self.nodes = [DialogueNode(None, tuple((line, i, ()) for i, line in enumerate(lines, 1)))]
+        self.nodes += [DialogueNode(line, ()) for line in lines]
+
+    def node(self, index):
+        return self.nodes[index]
+
+
+def allowed(choice, player):
+    # Choices with conditions are only offered to a player who meets them all
+    conditions = choice[2]
+    if not conditions:
+        return True
+    return player is not None and all(CONDITIONS[name](player, argument) for name, argument in conditions)
+
+
+class Conversation:
+    # One player's place in an NPC's dialogue. NPCs are shared between
+    # sessions; only the conversation knows which choices are on offer.
+    __slots__ = ("npc", "dialogue", "player", "events", "choices")
+
+    def __init__(self, npc, dialogue, start, player, events):
+        self.npc = npc
+        self.dialogue = dialogue
+        self.player = player
+        self.events = events
+        self.choices = ()
+        self.enter(start)
+
+    @property
+    def options(self):
+        return [choice[0] for choice in self.choices]
+
+    def enter(self, index):
+        node = self.dialogue.node(index)
+        if node.line is not None:
+            self.events.emit("npc_says", npc=self.npc.name, line=node.line)
+        self.choices = [choice for choice in node.choices if allowed(choice, self.player)]
+        if self.choices:
+            self.events.emit("npc_options", npc=self.npc.name, role=self.npc.role, options=self.options)
+
+    def choose(self, number):
+        # Pick the number-th choice on offer (from 1); anything else ends the conversation
+        choices = self.choices
+        self.choices = ()
+        if not 1 <= number <= len(choices):
+            self.events.emit("npc_confused", npc=self.npc.name)
+            return
+        target = choices[number - 1][1]
+        if target is not None:
+            self.enter(target)
+
+
+def source_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def open_store(source_path, path, cache_nodes=DEFAULT_CACHE_NODES):
+    # Store for source_path, compiled to path first unless it is already up to date
+    stamp = source_stamp(source_path)
+    try:
+        store = DialogueStore.open(path, cache_nodes)
+        if store.stamp == stamp:
+            return store
+        store.close()
+    except (OSError, ValueError, struct.error, content.ContentError):
+        pass
+    with open(source_path, "rb") as source_file:
+        data = json.loads(source_file.read())
+    compiled = compile_dialogue(data, stamp)
+    if write_compiled(path, compiled):
+        return DialogueStore.open(path, cache_nodes)
+    # Read-only install: serve the compiled bytes from memory
+    return DialogueStore(compiled, path, cache_nodes)
+
+
+store = None
+
+
+def dialogue_store():
+    global store
+    if store is None:
+        registry = content.registry
+        store = open_store(registry.source_path("dialogue"), os.path.join(registry.cache_directory, "dialogue.bin"))
+    return store
@@ -0,0 +1,110 @@
+import content
+from enemies import enemy_archetype
+
+# Encounter tables. What can happen after the NPC in each exploration zone
+# lives in data/encounters.json as weighted outcomes (an enemy archetype
+# from data/enemies.json, or a group of them when the outcome gives a
+# [low, high] "count", loot, a trap, gold, ...). The content compiler
+# turns every zone's weights into Vose alias tables, so drawing an outcome
+# costs one uniform and one comparison whatever the number of outcomes,
+# and draw_many() draws whole batches at once with NumPy for simulations.
+
+# Outcome kinds the game knows how to play (see Game.encounter_event)
+OUTCOME_KINDS = ("enemy", "loot", "trap", "gold")
+
+
+def alias_table(weights):
+    # Vose's alias method: returns (probability, alias) lists of len(weights)
+    count = len(weights)
+    total = float(sum(weights))
+    if count == 0 or total <= 0:
+        raise content.ContentError("An encounter table needs at least one outcome with a positive weight")
+    scaled = [weight * count / total for weight in weights]
+    probability = [1.0] * count
+    alias = list(range(count))
+    small = [i for i, value in enumerate(scaled) if value < 1.0]
+    large = [i for i, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        low = small.pop()
+        high = large.pop()
+        probability[low] = scaled[low]
+        alias[low] = high
+        scaled[high] = (scaled[high] + scaled[low]) - 1.0
+        if scaled[high] < 1.0:
+            small.append(high)
+        else:
+            large.append(high)
+    # Whatever is left over is 1.0 up to rounding
+    return probability, alias
+
+
+@content.compiler("encounters")
+def compile_encounters(data):
+    for location, table in data["locations"].items():
+        for outcome in table["outcomes"]:
+            if outcome["kind"] not in OUTCOME_KINDS:
+                raise content.ContentError(f"Unknown encounter outcome {outcome['kind']!r} in {location}")
+            if outcome["weight"] < 0:
+                raise content.ContentError(f"Negative encounter weight in {location}")
+            count = outcome.get("count")
+            if count is not None and not 1 <= count[0] <= count[1]:
+                raise content.ContentError(f"Invalid enemy count {count!r} in {location}")
+        table["probability"], table["alias"] = alias_table([outcome["weight"] for outcome in table["outcomes"]])
+    return data
+
+
+class EncounterTable:
+    def __init__(self, location, table):
+        self.location = location
+        self.intro = table["intro"]
+        self.outcomes = table["outcomes"]
+        self.probability = table["probability"]
+        self.alias = table["alias"]
+        self.arrays = None
+        # Fail on load rather than mid-exploration if an outcome names an unknown enemy
+        for outcome in self.outcomes:
+            if outcome["kind"] == "enemy":
+                enemy_archetype(outcome["enemy"])
+
+    def __len__(self):
+        return len(self.outcomes)
+
+    def draw_index(self, rng):
+        # rng is anything with random(): the random module, random.Random, ...
+        scaled = rng.random() * len(self.probability)
+        index = min(int(scaled), len(self.probability) - 1)
+        if scaled - index < self.probability[index]:
+            return index
+        return self.alias[index]
+
+    def draw(self, rng):
+        return self.outcomes[self.draw_index(rng)]
+
+    def draw_many(self, count, rng):
+        # Outcome indexes of count encounters drawn with a NumPy Generator
+        import numpy as np
+
+        if self.arrays is None:
+            self.arrays = (np.array(self.probability), np.array(self.alias, dtype=np.intp))
+        probability, alias = self.arrays
+        scaled = rng.random(count) * len(probability)
+        index = np.minimum(scaled.astype(np.intp), len(probability) - 1)
+        return np.where(scaled - index < probability[index], index, alias[index])
+
+    def weights(self):
+        total = float(sum(outcome["weight"] for outcome in self.outcomes))
+        return [outcome["weight"] / total for outcome in self.outcomes]
+
+
+tables = {}
+
+
+def encounter_table(location):
+    if location not in tables:
+        table = content.load("encounters")["locations"].get(location)
+        tables[location] = EncounterTable(location, table) if table is not None else None
+    return tables[location]
+
+
+def encounter_locations():
+    return list(content.load("encounters")["locations"])
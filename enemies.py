@@ -0,0 +1,88 @@
+import content
+
+# Enemy archetypes. Everything that is the same for every enemy of a type
+# (name, starting health, attack range, drop table) is an EnemyArchetype,
+# created once and shared; an Enemy in a fight only carries its archetype
+# and current health. Regular enemies come from data/enemies.json, scaled
+# ones (coliseum challengers, ad-hoc Enemy(name, health, attack_power)
+# calls) are made on first use and cached by their stats.
+
+
+@content.compiler("enemies")
+def compile_enemies(data):
+    for name, enemy in data["enemies"].items():
+        low, high = enemy["attack"]
+        if not 0 <= low <= high:
+            raise content.ContentError(f"Enemy {name!r} has an invalid attack range {enemy['attack']!r}")
+        for item, chance in enemy.get("drops", []):
+            if not 0 <= chance <= 1:
+                raise content.ContentError(f"Enemy {name!r} drops {item!r} with an invalid chance {chance!r}")
+    return data
+
+
+class EnemyArchetype:
+    __slots__ = ("id", "name", "health", "attack_min", "attack_max", "drops")
+
+    def __init__(self, id, name, health, attack_min, attack_max, drops=()):
+        self.id = id
+        self.name = name
+        self.health = health
+        self.attack_min = attack_min
+        self.attack_max = attack_max
+        self.drops = tuple((item, chance) for item, chance in drops)
+
+    def __repr__(self):
+        return f"EnemyArchetype({self.name!r}, {self.health}, {self.attack_min}-{self.attack_max})"
+
+
+class EnemyRegistry:
+    def __init__(self, enemies):
+        self.archetypes = []  # Indexed by archetype id
+        self.by_name = {}
+        self.variants = {}
+        for name, enemy in enemies.items():
+            low, high = enemy["attack"]
+            self.by_name[name] = self.add(name, enemy["health"], low, high, enemy.get("drops", ()))
+
+    def add(self, name, health, attack_min, attack_max, drops=()):
+        archetype = EnemyArchetype(len(self.archetypes), name, health, attack_min, attack_max, drops)
+        self.archetypes.append(archetype)
+        return archetype
+
+    def get(self, name):
+        archetype = self.by_name.get(name)
+        if archetype is None:
+            raise KeyError(f"Unknown enemy: {name}")
+        return archetype
+
+    def variant(self, name, health, attack_power):
+        # Archetype for an enemy given by its stats, e.g. Enemy("Troll", 50, 15).
+        # Attacks roll 5..attack_power like they always have.
+        key = (name, health, attack_power)
+        archetype = self.variants.get(key)
+        if archetype is None:
+            known = self.by_name.get(name)
+            if known is not None and (known.health, known.attack_min, known.attack_max) == (health, 5, attack_power):
+                archetype = known
+            else:
+                archetype = self.add(name, health, 5, attack_power)
+            self.variants[key] = archetype
+        return archetype
+
+    def regular(self):
+        # The archetypes defined in data/enemies.json, in file order
+        return list(self.by_name.values())
+
+
+registry = None
+
+
+def enemy_registry():
+    global registry
+    if registry is None:
+        registry = EnemyRegistry(content.load("enemies")["enemies"])
+    return registry
+
+
+def enemy_archetype(name):
+    return enemy_registry().get(name)
@@ -0,0 +1,373 @@
+from Helbrand import Player, Game, NPC, Enemy, EnemyGroup, Inventory, batch_counts, races, sub_races, render_event
+from items import TYPES
+from rng import RandomStream
+
+# Command/event engine for hosting many games in one process. A GameSession
+# never blocks: submit() takes one command (a dict such as
+# {"action": "buy", "item": "Health Potion"}), runs it to completion and
+# returns the events it produced as plain dicts, e.g.
+# {"type": "purchased", "item": "Health Potion", "gold": 950}.
+# Use Helbrand.render_event(event["type"], event) to turn one into text.
+
+IDLE = "idle"
+DIALOGUE = "dialogue"
+COMBAT = "combat"
+QUESTION = "question"
+CLOSED = "closed"
+
+
+# Player fields a handoff carries besides inventory and skills
+HANDOFF_FIELDS = ("health", "strength", "defense", "magic", "agility", "gold", "location", "level", "exp",
+                  "skill_points", "equipped_weapon", "equipped_armor")
+
+
+class SessionError(Exception):
+    pass
+
+
+class EventLog:
+    # Event sink that keeps events until the session hands them out
+    def __init__(self):
+        self.events = []
+
+    def emit(self, kind, **data):
+        data["type"] = kind
+        self.events.append(data)
+
+    def drain(self):
+        events = self.events
+        self.events = []
+        return events
+
+
+def format_events(events):
+    return "\n".join(render_event(event["type"], event) for event in events)
+
+
+class GameSession:
+    def __init__(self, name, race, sub_race, saves=None, seed=None, record=False):
+        if race not in races:
+            raise SessionError(f"Unknown race: {race}")
+        if sub_race not in sub_races:
+            raise SessionError(f"Unknown sub-race: {sub_race}")
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+            raise SessionError(f"Invalid seed: {seed!r}")
+        self.events = EventLog()
+        self.player = Player(name, race, sub_race)
+        self.rng = RandomStream(seed)
+        self.game = Game(self.player, self.events, saves, self.rng)
+        self.header = {"name": name, "race": race, "sub_race": sub_race, "seed": self.rng.seed}
+        self.commands = [] if record else None  # Every submitted command, for replay()
+        # A shared per-player store (save_store.SaveStore) keys saves by character name
+        self.per_player = getattr(saves, "per_player", False)
+        self.default_slot = name if self.per_player else "default"
+        self.state = IDLE
+        self.event = None  # Location event generator in progress
+        self.npc = None
+        self.conversation = None
+        self.enemy = None
+        self.question = None
+        self.idle_commands = {
+            "status": self.show_status,
+            "inventory": self.show_inventory,
+            "skills": self.show_skills,
+            "upgrade": self.upgrade,
+            "plan": self.plan,
+            "locations": self.show_locations,
+            "explore": self.explore,
+            "coliseum": self.coliseum,
+            "store": self.show_store,
+            "buy": self.buy,
+            "sell": self.sell,
+            "combine": self.combine,
+            "recipes": self.recipes,
+            "equip": self.equip,
+            "use": self.use,
+            "save": self.save,
+            "load": self.load,
+            "quit": self.quit,
+        }
+
+    def submit(self, command):
+        if self.commands is not None:
+            self.commands.append(dict(command))
+        action = command.get("action")
+        try:
+            if self.state == CLOSED:
+                raise SessionError("Session is closed.")
+            if self.state == IDLE:
+                handler = self.idle_commands.get(action)
+                if handler is None:
+                    raise SessionError(f"Unknown action: {action}")
+                handler(command)
+            elif self.state == DIALOGUE:
+                self.talk(command)
+            elif self.state == COMBAT:
+                self.fight(command)
+            elif self.state == QUESTION:
+                self.answer(command)
+        except SessionError as error:
+            self.events.emit("error", message=str(error))
+        return self.events.drain()
+
+    def reset(self):
+        # Abandon whatever location event is in progress
+        if self.event is not None:
+            self.event.close()
+        self.event = self.npc = self.conversation = self.enemy = self.question = None
+        if self.state != CLOSED:
+            self.state = IDLE
+
+    def snapshot(self):
+        snapshot = {"state": self.state}
+        if self.state == DIALOGUE:
+            snapshot["npc"] = self.npc.name
+            snapshot["options"] = self.conversation.options
+        elif self.state == COMBAT:
+            snapshot["enemy"] = {"name": self.enemy.name, "health": self.enemy.health}
+            if isinstance(self.enemy, EnemyGroup):
+                snapshot["enemy"]["standing"] = self.enemy.standing
+            snapshot["health"] = self.player.health
+        elif self.state == QUESTION:
+            snapshot["question"] = self.question
+        return snapshot
+
+    @property
+    def seed(self):
+        return self.rng.seed
+
+    def handoff(self):
+        # Everything restore() needs to resume this session somewhere else
+        # (e.g. another process, see shards.py) as plain data. Only idle
+        # sessions can move: a location event in progress is a live generator.
+        if self.state != IDLE:
+            raise SessionError("Only an idle session can be handed off.")
+        player = self.player
+        inventory = player.inventory.to_save()
+        return {
+            "header": dict(self.header),
+            "player": {field: getattr(player, field) for field in HANDOFF_FIELDS},
+            "inventory": inventory,
+            "hybrids": player.inventory.registry.hybrid_records(inventory),
+            "skills": player.skill_tree.level_map(),
+            "rng": self.rng.state(),
+            "commands": self.commands,
+        }
+
+    def recording(self):
+        # Seed plus command log: everything replay() needs to rerun this session
+        if self.commands is None:
+            raise SessionError("This session was not started with record=True.")
+        return dict(self.header, commands=list(self.commands))
+
+    def field(self, command, key):
+        if key not in command:
+            raise SessionError(f"Missing '{key}' for {command.get('action')}.")
+        return command[key]
+
+    # Idle commands
+
+    def show_status(self, command):
+        self.player.show_status()
+
+    def show_inventory(self, command):
+        self.game.show_inventory()
+
+    def show_skills(self, command):
+        self.game.display_skills()
+
+    def upgrade(self, command):
+        self.player.upgrade_skill(str(self.field(command, "skill")).title())
+
+    def plan(self, command):
+        try:
+            level = int(command.get("level", 1))
+        except (TypeError, ValueError):
+            raise SessionError("Invalid skill level.")
+        self.player.skill_tree.show_plan(str(self.field(command, "skill")).title(), level, self.events)
+
+    def show_locations(self, command):
+        self.game.world.show_locations(self.events)
+
+    def explore(self, command):
+        event = self.game.travel(self.field(command, "location"))
+        if event is not None:
+            self.event = event
+            self.advance(None)
+
+    def coliseum(self, command):
+        # Auto-resolve a run of coliseum battles instead of fighting them one command at a time
+        try:
+            battles = int(command.get("battles", 1))
+            leave_below = command.get("leave_below")
+            leave_below = None if leave_below is None else int(leave_below)
+        except (TypeError, ValueError):
+            raise SessionError("Invalid coliseum options.")
+        if not 1 <= battles <= 100000:
+            raise SessionError("Battles must be between 1 and 100000.")
+        self.player.move("Battle Coliseum")
+        self.game.auto_coliseum(battles, leave_below)
+
+    def show_store(self, command):
+        # Optional category, min_price/max_price and offset/limit page through the catalog by price
+        category = command.get("category")
+        if category is not None and category not in TYPES:
+            raise SessionError(f"Unknown item category: {category}")
+        try:
+            bounds = [None if command.get(key) is None else int(command[key])
+                      for key in ("min_price", "max_price", "limit")]
+            offset = int(command.get("offset", 0))
+        except (TypeError, ValueError):
+            raise SessionError("Invalid store query.")
+        if offset < 0 or (bounds[2] is not None and bounds[2] < 0):
+            raise SessionError("Invalid store query.")
+        self.game.store.show_items(self.events, category, bounds[0], bounds[1], offset, bounds[2])
+
+    def buy(self, command):
+        # {"item": name} buys one, {"items": {name: count}} or a list of names buys a whole batch
+        if "items" in command:
+            self.game.store.buy_items(self.batch(command), self.player)
+        else:
+            self.game.store.buy_item(self.field(command, "item"), self.player)
+
+    def sell(self, command):
+        if "items" in command:
+            self.game.store.sell_items(self.batch(command), self.player)
+        else:
+            self.game.store.sell_item(self.field(command, "item"), self.player)
+
+    def batch(self, command):
+        items = command["items"]
+        if not isinstance(items, (dict, list)):
+            raise SessionError("Items must be a list of names or a {name: count} object.")
+        try:
+            return batch_counts(items)
+        except (TypeError, ValueError):
+            raise SessionError("Invalid item counts.")
+
+    def combine(self, command):
+        if len(self.player.inventory) < 2:
+            self.events.emit("need_two_items")
+            return
+        try:
+            first = int(self.field(command, "first")) - 1
+            second = int(self.field(command, "second")) - 1
+        except (TypeError, ValueError):
+            raise SessionError("Invalid input.")
+        size = len(self.player.inventory)
+        if not 0 <= first < size or not 0 <= second < size or first == second:
+            raise SessionError("Invalid input.")
+        self.game.blacksmith.combine_items(self.player, first, second)
+
+    def recipes(self, command):
+        self.game.blacksmith.show_recipes(self.player)
+
+    def equip(self, command):
+        self.player.equip_item(self.field(command, "item"))
+
+    def use(self, command):
+        self.player.use_item(self.field(command, "item"))
+
+    def save(self, command):
+        self.game.save_game(self.slot_name(command))
+
+    def load(self, command):
+        self.game.load_game(self.slot_name(command))
+
+    def slot_name(self, command):
+        slot = str(command.get("slot", self.default_slot))
+        if not slot or slot.startswith(".") or "/" in slot or "\\" in slot:
+            raise SessionError(f"Invalid save slot name: {slot!r}")
+        # Slots of a per-player backend are other players' characters
+        if self.per_player and slot != self.default_slot:
+            raise SessionError(f"You can only save and load your own character ({self.default_slot!r}).")
+        return slot
+
+    def quit(self, command):
+        self.events.emit("narration", text="Thank you for playing!")
+        self.state = CLOSED
+
+    # Commands while a location event is waiting on the player
+
+    def talk(self, command):
+        if command.get("action") != "talk":
+            raise SessionError(f"{self.npc.name} is waiting for you to answer (action 'talk').")
+        try:
+            option = int(self.field(command, "option"))
+        except (TypeError, ValueError):
+            raise SessionError("Invalid dialogue option.")
+        self.conversation.choose(option)
+        if not self.conversation.choices:
+            self.advance(None)
+
+    def fight(self, command):
+        action = command.get("action")
+        if action not in ("attack", "item", "skill", "flee"):
+            raise SessionError(f"You are fighting a {self.enemy.name}! Use attack, item, skill or flee.")
+        argument = None
+        if action == "item":
+            argument = self.field(command, "item")
+        elif action == "skill":
+            argument = str(self.field(command, "skill")).title()
+        result = self.game.combat_turn(self.enemy, action, argument)
+        if result is not None:
+            self.advance(result)
+
+    def answer(self, command):
+        if command.get("action") != "answer":
+            raise SessionError(f"Please answer first (action 'answer'): {self.question}")
+        self.advance(str(self.field(command, "text")))
+
+    def advance(self, value):
+        # Resume the location event until it needs the player again or ends
+        self.npc = self.conversation = self.enemy = self.question = None
+        try:
+            step = self.event.send(value)
+            # An NPC with nothing to offer this player doesn't stop the event
+            while isinstance(step, NPC):
+                conversation = step.converse(self.player, self.events)
+                if conversation.choices:
+                    break
+                step = self.event.send(None)
+        except StopIteration:
+            self.event = None
+            self.state = IDLE
+            return
+        if isinstance(step, NPC):
+            self.state = DIALOGUE
+            self.npc = step
+            self.conversation = conversation
+        elif isinstance(step, Enemy):
+            self.state = COMBAT
+            self.enemy = step
+            self.game.start_combat(step)
+        else:
+            self.state = QUESTION
+            self.question = step
+            self.events.emit("narration", text=step)
+
+
+def restore(handoff, saves=None):
+    # Rebuild a session from GameSession.handoff()
+    header = handoff["header"]
+    session = GameSession(header["name"], header["race"], header["sub_race"], saves, header["seed"])
+    player = session.player
+    for field, value in handoff["player"].items():
+        setattr(player, field, value)
+    player.inventory = Inventory.load(handoff["inventory"], player.inventory.capacity, handoff["hybrids"])
+    for skill, level in handoff["skills"].items():
+        player.skill_tree.set_level(skill, level)
+    session.rng = session.game.rng = RandomStream.from_state(handoff["rng"])
+    if handoff["commands"] is not None:
+        session.commands = list(handoff["commands"])
+    return session
+
+
+def replay(recording, saves=None):
+    # Rerun a recorded session from its seed; returns the session and every event it produced
+    session = GameSession(recording["name"], recording["race"], recording["sub_race"], saves,
+                          recording["seed"], record=True)
+    events = []
+    for command in recording["commands"]:
+        events.extend(session.submit(command))
+    return session, events
@@ -0,0 +1,282 @@
+import content
+
+# Item registry. Every item has an integer id and its type, equipment slot,
+# price and stat modifiers sit in plain lists indexed by that id, so the
+# equip/use/bonus/price paths are one dict lookup to find the id and then
+# list reads. Items from data/items.json keep the id given there, which is
+# also what saves store. Items made during play (Blacksmith hybrids, coliseum
+# prizes) get ids for the lifetime of the process only; hybrids are saved as
+# records of their parents' keys (see hybrid_records) and the others by name.
+
+# Item types
+WEAPON = "weapon"
+ARMOR = "armor"
+CONSUMABLE = "consumable"
+MATERIAL = "material"
+
+TYPES = (WEAPON, ARMOR, CONSUMABLE, MATERIAL)
+
+# Equipment slot each type goes into (None: can't be equipped)
+TYPE_SLOTS = {WEAPON: "weapon", ARMOR: "armor", CONSUMABLE: None, MATERIAL: None}
+
+# Modifiers with their own lookup table
+STAT_MODIFIERS = ("strength", "defense", "heal")
+
+HYBRID_PREFIX = "Hybrid of "
+
+# Hybrids nested deeper than this inside a hybrid's name are named "Hybrid #<id>"
+HYBRID_NAME_DEPTH = 2
+
+# Longest hybrid name, and deepest nesting of hybrids in it, rebuilt from an old save
+MAX_HYBRID_NAME = 1000
+MAX_HYBRID_DEPTH = 8
+
+
+@content.compiler("items")
+def compile_items(data):
+    ids = set()
+    for name, item in data["items"].items():
+        if name.isdigit():
+            raise content.ContentError(f"Item name {name!r} can't be a number, saves use numbers for item ids")
+        if not isinstance(item.get("id"), int) or item["id"] <= 0 or item["id"] in ids:
+            raise content.ContentError(f"Item {name!r} needs its own positive integer id")
+        if item["type"] not in TYPES:
+            raise content.ContentError(f"Item {name!r} has unknown type {item['type']!r}")
+        ids.add(item["id"])
+    return data
+
+
+class ItemRegistry:
+    def __init__(self, items):
+        size = max((item["id"] for item in items.values()), default=0) + 1
+        self.ids = {}
+        self.names = [None] * size
+        self.types = [None] * size
+        self.slots = [None] * size
+        self.prices = [0] * size
+        self.modifiers = [None] * size
+        self.stats = {stat: [0] * size for stat in STAT_MODIFIERS}
+        self.stable = size  # Ids below this come from data/items.json
+        self.crafted = {}  # (first id, second id) -> hybrid id
+        self.parents = {}  # Hybrid id -> (first id, second id)
+        self.depths = {}  # Hybrid id -> how deeply hybrids nest in it (1: made of plain items)
+        for name, item in items.items():
+            self.set(item["id"], name, item["type"], item.get("price", 0), item.get("modifiers", {}),
+                     item.get("slot", TYPE_SLOTS[item["type"]]))
+
+    def set(self, item_id, name, item_type, price, modifiers, slot):
+        self.ids[name] = item_id
+        self.names[item_id] = name
+        self.types[item_id] = item_type
+        self.slots[item_id] = slot
+        self.prices[item_id] = price
+        self.modifiers[item_id] = dict(modifiers)
+        for stat, values in self.stats.items():
+            values[item_id] = modifiers.get(stat, 0)
+
+    def add(self, name, item_type=MATERIAL, price=0, modifiers=None, slot=None):
+        # Register an item that only exists at runtime
+        item_id = len(self.names)
+        self.names.append(None)
+        self.types.append(None)
+        self.slots.append(None)
+        self.prices.append(0)
+        self.modifiers.append(None)
+        for values in self.stats.values():
+            values.append(0)
+        self.set(item_id, name, item_type, price, modifiers or {}, slot if slot is not None else TYPE_SLOTS[item_type])
+        return item_id
+
+    # Lookups
+
+    def id_of(self, name):
+        # None for names that were never registered (typos, unknown input).
+        # Names come straight from clients, so this never registers anything.
+        return self.ids.get(name)
+
+    def intern(self, name):
+        # Id for name, registering unknown names as plain materials
+        item_id = self.id_of(name)
+        if item_id is None:
+            item_id = self.add(name)
+        return item_id
+
+    def name(self, item_id):
+        return self.names[item_id]
+
+    def type_of(self, name):
+        # Unknown names are what intern() would make of them: materials
+        item_id = self.id_of(name)
+        return MATERIAL if item_id is None else self.types[item_id]
+
+    def price(self, name):
+        item_id = self.id_of(name)
+        return 0 if item_id is None else self.prices[item_id]
+
+    def stat(self, name, stat):
+        item_id = self.id_of(name)
+        return 0 if item_id is None else self.stats[stat][item_id]
+
+    # Blacksmith hybrids: crafted records that only reference their parents'
+    # ids. Stats are worked out once, when the hybrid is first made.
+
+    def hybrid(self, first_id, second_id):
+        # Combined item: equips like the more useful of its parts (weapon, then
+        # armor) and carries the sum of both parts' modifiers. Hybrids can't
+        # be sold back to the store.
+        parents = (first_id, second_id)
+        item_id = self.crafted.get(parents)
+        if item_id is None:
+            types = {self.types[part] for part in parents}
+            item_type = next(item_type for item_type in TYPES if item_type in types)
+            modifiers = {}
+            for part in parents:
+                for stat, value in self.modifiers[part].items():
+                    modifiers[stat] = modifiers.get(stat, 0) + value
+            name = f"{HYBRID_PREFIX}{self.part_name(first_id)} and {self.part_name(second_id)}"
+            item_id = self.add(name, item_type, 0, modifiers)
+            self.crafted[parents] = item_id
+            self.parents[item_id] = parents
+            self.depths[item_id] = 1 + max(self.depths.get(part, 0) for part in parents)
+        return item_id
+
+    def part_name(self, item_id):
+        # How a hybrid's name refers to one of its parts, so names stay short however often hybrids are re-crafted
+        if self.depths.get(item_id, 0) < HYBRID_NAME_DEPTH:
+            return self.names[item_id]
+        return f"Hybrid #{item_id}"
+
+    def parse_hybrid(self, name):
+        # Rebuild a hybrid from its name (saves made before hybrids were saved
+        # by parent ids). The parts may be hybrids themselves, so every " and "
+        # is a possible split. Splits are memoized and the name's length and
+        # nesting are capped, so even a hostile save parses in bounded time,
+        # and nothing is registered unless the whole name resolves.
+        if len(name) > MAX_HYBRID_NAME:
+            return None
+        memo = {}
+
+        def parse(text, depth):
+            # Item id, (first, second) parts or None
+            if (text, depth) in memo:
+                return memo[text, depth]
+            parts = self.ids.get(text)
+            if parts is None and depth < MAX_HYBRID_DEPTH and text.startswith(HYBRID_PREFIX):
+                rest = text[len(HYBRID_PREFIX):]
+                start = rest.find(" and ")
+                while start != -1 and parts is None:
+                    first = parse(rest[:start], depth + 1)
+                    second = None if first is None else parse(rest[start + 5:], depth + 1)
+                    if second is not None:
+                        parts = (first, second)
+                    start = rest.find(" and ", start + 1)
+            memo[text, depth] = parts
+            return parts
+
+        def build(parts):
+            if isinstance(parts, int):
+                return parts
+            return self.hybrid(build(parts[0]), build(parts[1]))
+
+        parts = parse(name, 0)
+        return None if parts is None else build(parts)
+
+    # Save format: stable ids as strings, hybrids as "h<id>" (described by
+    # the save's hybrid records), other runtime items by name
+
+    def save_key(self, item_id):
+        if item_id < self.stable:
+            return str(item_id)
+        if item_id in self.parents:
+            return f"h{item_id}"
+        return self.names[item_id]
+
+    def hybrid_id(self, key):
+        # Id of the hybrid a save key of this process names, else None
+        if key[:1] == "h" and key[1:].isdigit() and int(key[1:]) in self.parents:
+            return int(key[1:])
+        return None
+
+    def hybrid_records(self, keys):
+        # {save key: [first parent key, second parent key]} for every hybrid
+        # among the save keys and its ancestors. One short record per hybrid,
+        # so a save grows with the number of hybrids, not their nesting.
+        records = {}
+        pending = [self.hybrid_id(key) for key in keys]
+        while pending:
+            item_id = pending.pop()
+            if item_id is None or f"h{item_id}" in records:
+                continue
+            first, second = self.parents[item_id]
+            records[f"h{item_id}"] = [self.save_key(first), self.save_key(second)]
+            pending += [part for part in (first, second) if part in self.parents]
+        return records
+
+    def load_hybrids(self, records):
+        # {save key: item id} for a save's hybrid records, whose parents are
+        # item keys or other records of the same save
+        ids = {}
+        for key in records:
+            path = [key]
+            while path:
+                current = path[-1]
+                if current in ids:
+                    path.pop()
+                    continue
+                parents = records[current]
+                missing = [part for part in parents if part in records and part not in ids]
+                if missing:
+                    if missing[0] in path:
+                        raise KeyError(f"Hybrid {current} in save is made from itself")
+                    path.append(missing[0])
+                    continue
+                first, second = (ids[part] if part in records else self.from_save_key(part) for part in parents)
+                ids[current] = self.hybrid(first, second)
+                path.pop()
+        return ids
+
+    def from_save_key(self, key, hybrids=None):
+        # hybrids: the save's records as resolved by load_hybrids()
+        if hybrids and key in hybrids:
+            return hybrids[key]
+        if key.isdigit():
+            item_id = int(key)
+            if item_id < self.stable and self.names[item_id] is not None:
+                return item_id
+            raise KeyError(f"Unknown item id in save: {key}")
+        if key.startswith("(") and key.endswith(")"):
+            # Hybrid saved as "(<first>+<second>)" before hybrid records; split
+            # at the "+" outside any nested parentheses
+            depth = 0
+            for index, char in enumerate(key[1:-1], 1):
+                if char == "(":
+                    depth += 1
+                elif char == ")":
+                    depth -= 1
+                elif char == "+" and depth == 0:
+                    return self.hybrid(self.from_save_key(key[1:index]), self.from_save_key(key[index + 1:-1]))
+        if key not in self.ids and key.startswith(HYBRID_PREFIX):
+            item_id = self.parse_hybrid(key)
+            if item_id is not None:
+                return item_id
+        return self.intern(key)
+
+    def canonical(self, saved_items, records=None):
+        # Same {save key: count} mapping in this process's keys, with names
+        # of stable items turned into ids
+        hybrids = self.load_hybrids(records) if records else None
+        items = {}
+        for key, count in saved_items.items():
+            key = self.save_key(self.from_save_key(key, hybrids))
+            items[key] = items.get(key, 0) + count
+        return items
+
+
+registry = None
+
+
+def item_registry():
+    global registry
+    if registry is None:
+        registry = ItemRegistry(content.load("items")["items"])
+    return registry
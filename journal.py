@@ -0,0 +1,326 @@
+import json
+import os
+
+from items import item_registry
+
+# Journaled save slots. Each slot is a snapshot file plus an append-only
+# journal of the changes made since that snapshot:
+#
+#   saves/<slot>.snapshot.json   full player state, tagged with a sequence number
+#   saves/<slot>.journal         one JSON line per save holding only what changed
+#
+# A save appends a single short line (gold, health, location, ... that
+# changed, inventory stacks whose count changed, skills whose level
+# changed), so its cost depends on what happened since the last save rather
+# than on the size of the inventory. Every compact_every entries the slot
+# writes a fresh snapshot with an atomic replace and starts an empty
+# journal. Loading reads the snapshot and replays the newer journal lines;
+# a torn last line from a crash mid-append is ignored and trimmed.
+# Inventory stacks are keyed by item id (see items.py); saves made before
+# the item registry, keyed by name, load the same way. A snapshot or journal
+# line holding Blacksmith hybrids also carries their records ("hybrids"),
+# since hybrid ids only last as long as the process.
+
+SAVE_DIR = "saves"
+
+SNAPSHOT_FORMAT = 3
+
+# Plain player fields that are saved as-is
+FIELDS = ("name", "gold", "health", "location", "level", "exp", "skill_points")
+
+
+def fsync_directory(directory):
+    if hasattr(os, "O_DIRECTORY"):
+        descriptor = os.open(directory or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+
+def fsync_path(path):
+    with open(path, "rb") as synced_file:
+        os.fsync(synced_file.fileno())
+
+
+def write_atomic(path, data, fsync=True):
+    # Write to a temporary file and swap it in, so readers only ever see a complete file
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as temp_file:
+        temp_file.write(data)
+        temp_file.flush()
+        if fsync:
+            os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+    if fsync:
+        fsync_directory(os.path.dirname(path))
+
+
+class SaveSlot:
+    def __init__(self, directory, name, compact_every=100, fsync=True):
+        self.directory = directory
+        self.name = name
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.snapshot_path = os.path.join(directory, f"{name}.snapshot.json")
+        self.journal_path = os.path.join(directory, f"{name}.journal")
+        self.state = None  # Player state as of the last write or load
+        self.inventory = None  # Inventory object the last capture or load was synced with
+        self.synced = False
+        self.unsynced_snapshot = False
+        self.seq = 0
+        self.entries = 0  # Journal entries written since the last snapshot
+        self.journal = None
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path)
+
+    # Saving. save() is capture() followed by write(): capture copies what
+    # needs saving out of the player on the caller's thread, write does the
+    # file I/O and may run later on another thread (see write_behind.py).
+
+    def save(self, player):
+        self.write(self.capture(player))
+
+    def capture(self, player):
+        inventory = player.inventory
+        # Without a saved state to diff against (first save, a load that didn't
+        # come from this slot, inventory replaced or its changes taken by
+        # another slot) the capture is a full one
+        full = (self.state is None or not self.synced or self.inventory is not inventory
+                or inventory.changes_owner is not self)
+        changes = inventory.take_changes(self)
+        self.inventory = inventory
+        self.synced = True
+        if full:
+            items = inventory.to_save()
+        else:
+            save_key = inventory.registry.save_key
+            items = {save_key(item_id): inventory.count_id(item_id) for item_id in changes}
+        return {
+            "fields": {field: getattr(player, field) for field in FIELDS},
+            "items": items,
+            "skills": player.skill_tree.level_map(),
+            "full": full,
+        }
+
+    def write(self, capture):
+        # Returns the number of bytes written
+        if capture["full"]:
+            return self.snapshot(capture)
+        entry = self.diff(capture)
+        if not entry:
+            return 0
+        self.seq += 1
+        entry["seq"] = self.seq
+        written = self.append(entry)
+        self.entries += 1
+        if self.entries >= self.compact_every:
+            self.seq += 1
+            written += self.write_snapshot()
+        return written
+
+    def diff(self, capture):
+        entry = {}
+        changed = {field: value for field, value in capture["fields"].items() if value != self.state[field]}
+        if changed:
+            entry["set"] = changed
+            self.state.update(changed)
+
+        items = {}
+        saved_items = self.state["inventory"]
+        for item, count in capture["items"].items():
+            if count != saved_items.get(item, 0):
+                items[item] = count
+                if count:
+                    saved_items[item] = count
+                else:
+                    del saved_items[item]
+        if items:
+            entry["items"] = items
+            hybrids = item_registry().hybrid_records(items)
+            if hybrids:
+                entry["hybrids"] = hybrids
+
+        skills = {}
+        saved_skills = self.state["skills"]
+        for skill, level in capture["skills"].items():
+            if saved_skills.get(skill) != level:
+                skills[skill] = level
+                saved_skills[skill] = level
+        if skills:
+            entry["skills"] = skills
+        return entry
+
+    def append(self, entry):
+        if self.journal is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.journal = open(self.journal_path, "a")
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        self.journal.write(line)
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        return len(line)
+
+    def snapshot(self, capture):
+        # Write the full state and start a fresh journal
+        if self.state is None:
+            # Nothing read or written through this slot yet (e.g. a session that
+            # moved here from another process): carry on from the sequence
+            # numbers on disk, so older journal lines never replay over this
+            saved = self.read()
+            if saved is not None:
+                self.seq = saved[1]
+        self.state = dict(capture["fields"])
+        self.state["inventory"] = {item: count for item, count in capture["items"].items() if count}
+        self.state["skills"] = dict(capture["skills"])
+        self.seq += 1
+        return self.write_snapshot()
+
+    def write_snapshot(self):
+        os.makedirs(self.directory, exist_ok=True)
+        hybrids = item_registry().hybrid_records(self.state["inventory"])
+        data = json.dumps(dict(self.state, seq=self.seq, format=SNAPSHOT_FORMAT, hybrids=hybrids))
+        # The snapshot records the last sequence number it includes, so a
+        # crash before the journal is reset only leaves entries replay skips.
+        write_atomic(self.snapshot_path, data, self.fsync)
+        self.close()
+        with open(self.journal_path, "w"):
+            pass
+        self.entries = 0
+        self.unsynced_snapshot = not self.fsync
+        return len(data)
+
+    def sync_target(self):
+        return self
+
+    def sync(self):
+        # Make everything written so far durable (used when fsync is batched)
+        if self.journal is not None:
+            os.fsync(self.journal.fileno())
+        if self.unsynced_snapshot:
+            fsync_path(self.snapshot_path)
+            fsync_path(self.journal_path)
+            fsync_directory(self.directory)
+            self.unsynced_snapshot = False
+
+    # Loading
+
+    def load(self):
+        saved = self.read()
+        if saved is None:
+            return None
+        self.state, self.seq, self.entries = saved
+        self.inventory = None
+        self.synced = False
+        player_data = json.loads(json.dumps(self.state))  # Callers get their own copy
+        player_data["hybrids"] = item_registry().hybrid_records(player_data["inventory"])
+        return player_data
+
+    def read(self):
+        # Rebuild the saved state: latest snapshot plus newer journal entries.
+        # Returns (state, last sequence number, journal entries) or None.
+        try:
+            with open(self.snapshot_path) as snapshot_file:
+                state = json.load(snapshot_file)
+        except FileNotFoundError:
+            return None
+        seq = state.pop("seq", 0)
+        state.pop("format", None)
+        registry = item_registry()
+        state["inventory"] = registry.canonical(state["inventory"], state.pop("hybrids", None))
+        entries = 0
+        good_size = 0
+        try:
+            with open(self.journal_path, "rb") as journal_file:
+                for line in journal_file:
+                    # A torn write at the tail ends replay; everything before it is good
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    good_size += len(line)
+                    if entry["seq"] <= seq:
+                        continue
+                    state.update(entry.get("set", {}))
+                    hybrids = registry.load_hybrids(entry["hybrids"]) if "hybrids" in entry else None
+                    for item, count in entry.get("items", {}).items():
+                        item = registry.save_key(registry.from_save_key(item, hybrids))
+                        if count:
+                            state["inventory"][item] = count
+                        else:
+                            state["inventory"].pop(item, None)
+                    state["skills"].update(entry.get("skills", {}))
+                    seq = entry["seq"]
+                    entries += 1
+            if good_size != os.path.getsize(self.journal_path):
+                self.close()
+                os.truncate(self.journal_path, good_size)
+        except FileNotFoundError:
+            pass
+        return state, seq, entries
+
+    def attach(self, player):
+        # Mark the player's current state as matching this slot (after a load)
+        self.inventory = player.inventory
+        player.inventory.take_changes(self)
+        self.synced = True
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def delete(self):
+        self.close()
+        for path in (self.snapshot_path, self.journal_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.state = None
+        self.inventory = None
+        self.synced = False
+
+
+class SaveDirectory:
+    # Named save slots kept side by side in one directory. A per-player
+    # directory (one shared by a server's sessions) keys slots by character
+    # name, like save_store.SaveStore.
+    def __init__(self, directory=SAVE_DIR, per_player=False, **slot_options):
+        self.directory = directory
+        self.per_player = per_player
+        self.slot_options = slot_options
+        self.slots = {}
+
+    def slot(self, name="default"):
+        if not name or name.startswith(".") or "/" in name or os.sep in name:
+            raise ValueError(f"Invalid save slot name: {name!r}")
+        if name not in self.slots:
+            self.slots[name] = SaveSlot(self.directory, name, **self.slot_options)
+        return self.slots[name]
+
+    def list_slots(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        suffix = ".snapshot.json"
+        return sorted(name[:-len(suffix)] for name in names if name.endswith(suffix))
+
+    def delete(self, name):
+        self.slot(name).delete()
+        del self.slots[name]
+
+    def release(self, name):
+        # Close and forget a slot, e.g. when its player moves to another process
+        slot = self.slots.pop(name, None)
+        if slot is not None:
+            slot.close()
+
+    def close(self):
+        for slot in self.slots.values():
+            slot.close()
@@ -0,0 +1,251 @@
+import functools
+import inspect
+import time
+from bisect import bisect_left
+
+# Opt-in instrumentation. Nothing here runs until enable() is called: it
+# wraps the hot methods (combat turns, location events and encounter
+# outcomes, store trades, saves and loads) in place, and disable() puts the
+# originals back, so a game that never enables metrics pays nothing.
+# Counters are read off the same method boundaries (a combat_turn result, a
+# loot() result, the bytes a save slot's write() reports).
+#
+#   import metrics
+#   metrics.enable()
+#   ...play...
+#   metrics.write("metrics.prom")   # Prometheus text format
+#   metrics.write("metrics.json")   # JSON snapshot
+
+# Latency histogram bucket upper bounds, in seconds
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0)
+
+COUNTERS = {
+    "fights": "Fights finished, whatever the outcome",
+    "victories": "Fights the player won",
+    "flees": "Fights the player fled",
+    "deaths": "Fights the player lost",
+    "items_looted": "Items added to an inventory as loot",
+    "save_bytes": "Bytes written by save slots",
+}
+
+# Methods to time, by module and class
+TIMED = {
+    "Helbrand": {
+        "Game": ("combat_turn", "auto_coliseum", "senaria_event", "encounter_event", "coliseum_event",
+                 "find_loot", "spring_trap", "find_gold", "save_game", "load_game"),
+        "Store": ("buy_item", "sell_item", "buy_items", "sell_items"),
+        "Blacksmith": ("combine_items",),
+    },
+    "journal": {"SaveSlot": ("write", "load")},
+    "save_store": {"StoreSlot": ("write", "load")},
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+
+counters = dict.fromkeys(COUNTERS, 0)
+histograms = {}  # "Class.method" -> Histogram
+originals = []  # (owner, name, original) for every patched attribute, for disable()
+
+
+def reset():
+    for name in counters:
+        counters[name] = 0
+    for histogram in histograms.values():
+        histogram.__init__()
+
+
+# Wrappers
+
+def timed(function, name):
+    histogram = histograms.setdefault(name, Histogram())
+    if inspect.isgeneratorfunction(function):
+        return timed_generator(function, histogram)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+    return wrapper
+
+
+def timed_generator(function, histogram):
+    # Location events wait on the player between steps; only time spent inside the generator counts
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        generator = function(*args, **kwargs)
+        elapsed = 0.0
+        start = time.perf_counter()
+        try:
+            step = next(generator)
+            while True:
+                elapsed += time.perf_counter() - start
+                sent = yield step
+                start = time.perf_counter()
+                step = generator.send(sent)
+        except StopIteration as stop:
+            elapsed += time.perf_counter() - start
+            return stop.value
+        finally:
+            generator.close()
+            histogram.observe(elapsed)
+    return wrapper
+
+
+def counting_combat_turn(function):
+    @functools.wraps(function)
+    def wrapper(self, enemy, action, argument=None):
+        result = function(self, enemy, action, argument)
+        if result is not None:
+            counters["fights"] += 1
+            if result is False:
+                counters["deaths"] += 1
+            elif action == "flee":
+                counters["flees"] += 1
+            else:
+                counters["victories"] += 1
+        return result
+    return wrapper
+
+
+def counting_auto_coliseum(function):
+    @functools.wraps(function)
+    def wrapper(self, battles, leave_below=None):
+        result = function(self, battles, leave_below)
+        lost = result.fell_in is not None
+        counters["fights"] += result.battles_won + lost
+        counters["victories"] += result.battles_won
+        counters["deaths"] += lost
+        return result
+    return wrapper
+
+
+def counting_loot(function):
+    @functools.wraps(function)
+    def wrapper(self, item_name):
+        added = function(self, item_name)
+        if added:
+            counters["items_looted"] += 1
+        return added
+    return wrapper
+
+
+def counting_write(function):
+    @functools.wraps(function)
+    def wrapper(self, capture):
+        written = function(self, capture)
+        counters["save_bytes"] += written or 0
+        return written
+    return wrapper
+
+
+def patch(owner, name, wrapper):
+    original = owner.__dict__[name]
+    originals.append((owner, name, original))
+    setattr(owner, name, wrapper)
+    return original
+
+
+def enable(helbrand=None):
+    # Wrap every instrumented method; calling it again does nothing. Pass
+    # the game module when it runs as __main__ (python Helbrand.py).
+    if originals:
+        return
+    import importlib
+
+    if helbrand is None:
+        helbrand = importlib.import_module("Helbrand")
+    for module_name, classes in TIMED.items():
+        module = helbrand if module_name == "Helbrand" else importlib.import_module(module_name)
+        for class_name, methods in classes.items():
+            owner = getattr(module, class_name)
+            for method in methods:
+                original = owner.__dict__[method]
+                wrapper = timed(original, f"{class_name}.{method}")
+                if method == "combat_turn":
+                    wrapper = counting_combat_turn(wrapper)
+                elif method == "auto_coliseum":
+                    wrapper = counting_auto_coliseum(wrapper)
+                elif method == "write":
+                    wrapper = counting_write(wrapper)
+                patch(owner, method, wrapper)
+
+    game = helbrand.Game
+    patch(game, "loot", counting_loot(game.__dict__["loot"]))
+    # Encounter outcomes are dispatched through a table built with the class, so wrap its entries too
+    handlers = dict(game.outcome_handlers)
+    for kind, handler in handlers.items():
+        handlers[kind] = game.__dict__[handler.__name__]
+    patch(game, "outcome_handlers", handlers)
+
+
+def disable():
+    while originals:
+        owner, name, original = originals.pop()
+        setattr(owner, name, original)
+
+
+def enabled():
+    return bool(originals)
+
+
+# Export
+
+def snapshot():
+    return {
+        "counters": dict(counters),
+        "latency": {
+            name: {
+                "count": histogram.count,
+                "sum": histogram.total,
+                "buckets": dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"], histogram.counts)),
+            }
+            for name, histogram in sorted(histograms.items())
+        },
+    }
+
+
+def prometheus_text():
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines.append(f"# HELP helbrand_{name}_total {help_text}")
+        lines.append(f"# TYPE helbrand_{name}_total counter")
+        lines.append(f"helbrand_{name}_total {counters[name]}")
+    lines.append("# HELP helbrand_call_seconds Time spent in instrumented game methods")
+    lines.append("# TYPE helbrand_call_seconds histogram")
+    for name, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket in zip([repr(bound) for bound in BUCKETS] + ["+Inf"], histogram.counts):
+            cumulative += bucket
+            lines.append(f'helbrand_call_seconds_bucket{{function="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'helbrand_call_seconds_sum{{function="{name}"}} {histogram.total!r}')
+        lines.append(f'helbrand_call_seconds_count{{function="{name}"}} {histogram.count}')
+    return "\n".join(lines) + "\n"
+
+
+def write(path):
+    # JSON snapshot for paths ending in .json, Prometheus text format otherwise
+    from journal import write_atomic
+
+    if path.endswith(".json"):
+        import json
+
+        write_atomic(path, json.dumps(snapshot(), indent=2), fsync=False)
+    else:
+        write_atomic(path, prometheus_text(), fsync=False)
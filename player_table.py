@@ -0,0 +1,130 @@
+import numpy as np
+
+import content
+from Helbrand import Player, SkillBook
+
+# Struct-of-arrays player store for very large populations (simulations,
+# servers with many resident characters). Each stat is one NumPy column and
+# skill levels are a (players x skills) uint8 matrix, so a row costs a few
+# dozen bytes instead of a full Player object. Rows convert to and from
+# Player when a single character needs the regular game code.
+
+STAT_COLUMNS = {
+    "health": np.int32,
+    "strength": np.int32,
+    "defense": np.int32,
+    "magic": np.int32,
+    "agility": np.int32,
+    "gold": np.int64,
+    "level": np.int32,
+    "exp": np.int64,
+    "skill_points": np.int32,
+}
+
+
+class PlayerTable:
+    def __init__(self, capacity=1024):
+        tables = content.load("races")
+        self.race_names = list(tables["races"])
+        self.sub_race_names = list(tables["sub_races"])
+        self.race_ids = {name: i for i, name in enumerate(self.race_names)}
+        self.sub_race_ids = {name: i for i, name in enumerate(self.sub_race_names)}
+        self.location_names = []
+        self.location_ids = {}
+        self.skill_book = SkillBook.get()
+
+        self.size = 0
+        self.names = []
+        self.columns = {column: np.zeros(capacity, dtype) for column, dtype in STAT_COLUMNS.items()}
+        self.race = np.zeros(capacity, np.uint8)
+        self.sub_race = np.zeros(capacity, np.uint8)
+        self.location = np.zeros(capacity, np.uint16)
+        self.skill_levels = np.zeros((capacity, len(self.skill_book.names)), np.uint8)
+
+    def __len__(self):
+        return self.size
+
+    def __getattr__(self, name):
+        # table.health, table.gold, ... give the live part of a stat column
+        columns = self.__dict__.get("columns")
+        if columns is not None and name in columns:
+            return columns[name][:self.size]
+        raise AttributeError(name)
+
+    @property
+    def capacity(self):
+        return len(self.race)
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        for column, values in self.columns.items():
+            self.columns[column] = self.grow(values, capacity)
+        self.race = self.grow(self.race, capacity)
+        self.sub_race = self.grow(self.sub_race, capacity)
+        self.location = self.grow(self.location, capacity)
+        self.skill_levels = self.grow(self.skill_levels, capacity)
+
+    def grow(self, values, capacity):
+        grown = np.zeros((capacity,) + values.shape[1:], values.dtype)
+        grown[:len(values)] = values
+        return grown
+
+    def location_id(self, location):
+        if location not in self.location_ids:
+            self.location_ids[location] = len(self.location_names)
+            self.location_names.append(location)
+        return self.location_ids[location]
+
+    def append(self, player):
+        self.reserve(self.size + 1)
+        row = self.size
+        self.write(row, player)
+        self.names.append(player.name)
+        self.size += 1
+        return row
+
+    def extend(self, players):
+        players = list(players)
+        self.reserve(self.size + len(players))
+        for player in players:
+            self.write(self.size, player)
+            self.names.append(player.name)
+            self.size += 1
+
+    def write(self, row, player):
+        for column, values in self.columns.items():
+            values[row] = getattr(player, column)
+        self.race[row] = self.race_ids[player.race]
+        self.sub_race[row] = self.sub_race_ids[player.sub_race]
+        self.location[row] = self.location_id(player.location)
+        self.skill_levels[row] = np.frombuffer(player.skill_tree.levels, np.uint8)
+
+    def to_player(self, row):
+        if not 0 <= row < self.size:
+            raise IndexError(row)
+        player = Player(self.names[row], self.race_names[self.race[row]], self.sub_race_names[self.sub_race[row]])
+        for column, values in self.columns.items():
+            setattr(player, column, int(values[row]))
+        player.location = self.location_names[self.location[row]]
+        player.skill_tree.levels[:] = self.skill_levels[row].tobytes()
+        player.skill_tree.refresh_unlocks()
+        return player
+
+    def skill_column(self, skill_name):
+        return self.skill_levels[:self.size, self.skill_book.index[skill_name]]
+
+    def rows_at(self, location):
+        location_id = self.location_ids.get(location)
+        if location_id is None:
+            return np.zeros(0, np.int64)
+        return np.flatnonzero(self.location[:self.size] == location_id)
+
+    @property
+    def nbytes(self):
+        # Bytes held by the numeric columns for the rows in use (names excluded)
+        per_row = sum(values.itemsize for values in self.columns.values())
+        per_row += self.race.itemsize + self.sub_race.itemsize + self.location.itemsize
+        per_row += self.skill_levels.shape[1] * self.skill_levels.itemsize
+        return per_row * self.size
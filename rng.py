@@ -0,0 +1,84 @@
+import random
+
+# Per-game random number streams. Every Game owns a RandomStream instead of
+# sharing the global random module, so sessions don't disturb each other
+# and a whole session can be replayed from its seed. The stream draws from
+# a NumPy Generator in blocks (uniforms and raw 63-bit integers) and hands
+# values out one at a time, so a single draw costs a list lookup. NumPy is
+# imported on first use so importing the game stays fast.
+
+
+class RandomStream:
+    def __init__(self, seed=None, block_size=256):
+        # Without an explicit seed, draw one from the random module so random.seed() still controls the run
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        import numpy as np
+
+        self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+        self.uniforms = []
+        self.uniform_index = 0
+        self.bits = []
+        self.bits_index = 0
+
+    def random(self):
+        # Uniform float in [0, 1), like random.random()
+        if self.uniform_index == len(self.uniforms):
+            self.uniforms = self.generator.random(self.block_size).tolist()
+            self.uniform_index = 0
+        value = self.uniforms[self.uniform_index]
+        self.uniform_index += 1
+        return value
+
+    def next_bits(self):
+        if self.bits_index == len(self.bits):
+            self.bits = self.generator.integers(0, 2 ** 63, self.block_size, dtype="int64").tolist()
+            self.bits_index = 0
+        value = self.bits[self.bits_index]
+        self.bits_index += 1
+        return value
+
+    def randint(self, low, high):
+        # Integer in [low, high] inclusive, like random.randint(). The modulo
+        # bias over a 63-bit draw is far below anything a game range can show.
+        if high < low:
+            raise ValueError(f"empty range for randint({low}, {high})")
+        return low + self.next_bits() % (high - low + 1)
+
+    def integers(self, low, high):
+        # Array of integers in [low, high] inclusive, one per element of the
+        # low/high arrays, drawn straight from the generator in one call
+        return self.generator.integers(low, high, endpoint=True)
+
+    def choice(self, sequence):
+        if not sequence:
+            raise IndexError("Cannot choose from an empty sequence")
+        return sequence[self.next_bits() % len(sequence)]
+
+    def state(self):
+        # Plain-data snapshot (generator state plus the unused part of each
+        # block) that from_state() resumes from, e.g. in another process
+        return {
+            "seed": self.seed,
+            "block_size": self.block_size,
+            "generator": self.generator.bit_generator.state,
+            "uniforms": self.uniforms[self.uniform_index:],
+            "bits": self.bits[self.bits_index:],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        stream = cls(state["seed"], state["block_size"])
+        stream.generator.bit_generator.state = state["generator"]
+        stream.uniforms = list(state["uniforms"])
+        stream.bits = list(state["bits"])
+        return stream
+
+    def spawn(self, count):
+        # Independent child streams, e.g. one per worker of a parallel run
+        import numpy as np
+
+        seeds = np.random.SeedSequence(self.seed).spawn(count)
+        return [RandomStream(int(child.generate_state(1, np.uint64)[0]), self.block_size) for child in seeds]
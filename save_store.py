@@ -0,0 +1,451 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from items import item_registry
+from journal import fsync_directory, fsync_path
+
+# Multi-player save store. Instead of one JSON file per character, every
+# character is a fixed-size record in one memory-mapped file, plus a heap
+# file for the variable-length parts (inventory, skills, long names):
+#
+#   <path>.records   header + array of fixed records (level, gold, exp,
+#                    health, skill points, location, race, name, ...)
+#   <path>.index     open-addressing hash table: name hash -> record number
+#   <path>.heap      append-only JSON blobs referenced by offset/length
+#
+# Hot fields (level, gold, location, ...) are read straight out of the
+# mapped records without touching the heap, and scan() returns whole
+# columns as NumPy arrays for bulk queries over every saved character
+# (copies, not views of the map, so the store can still grow).
+
+RECORD = np.dtype([
+    ("name_hash", "<u8"),
+    ("gold", "<i8"),
+    ("exp", "<i8"),
+    ("blob_offset", "<u8"),
+    ("name_offset", "<u8"),
+    ("blob_length", "<u4"),
+    ("level", "<i4"),
+    ("health", "<i4"),
+    ("skill_points", "<i4"),
+    ("name_length", "<u2"),
+    ("flags", "u1"),
+    ("reserved", "u1"),
+    ("name", "S48"),
+    ("location", "S48"),
+    ("race", "S24"),
+    ("sub_race", "S24"),
+])
+
+HEADER = struct.Struct("<8sIIQQ")  # magic, version, record size, records used, capacity
+HEADER_SIZE = 64
+MAGIC = b"HBSAVE01"
+VERSION = 1
+
+LIVE = 1
+EMPTY = 0
+TOMBSTONE = 0xFFFFFFFF
+
+HOT_FIELDS = ("level", "gold", "exp", "health", "skill_points")
+TEXT_FIELDS = ("location", "race", "sub_race")
+
+
+STORE_FILES = ("records", "index", "heap")
+
+
+def name_hash(name):
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "little")
+
+
+class SaveStoreError(Exception):
+    pass
+
+
+def close_map(mapped):
+    try:
+        mapped.close()
+    except BufferError:
+        # Something still holds a view into it; the map goes when that does
+        pass
+
+
+def finish_compaction(path):
+    # compact() writes the compacted store to <path>.compact.* and then
+    # creates <path>.compacted, the commit point. With the marker there the
+    # compacted files replace the store's (again, if a crash interrupted
+    # that); without it they are a half-written leftover and are removed.
+    temp_path = f"{path}.compact"
+    marker = f"{path}.compacted"
+    committed = os.path.exists(marker)
+    for suffix in STORE_FILES:
+        try:
+            if committed:
+                os.replace(f"{temp_path}.{suffix}", f"{path}.{suffix}")
+            else:
+                os.remove(f"{temp_path}.{suffix}")
+        except FileNotFoundError:
+            pass
+    if committed:
+        fsync_directory(os.path.dirname(path))
+        os.remove(marker)
+
+
+class SaveStore:
+    per_player = True  # Slots are keyed by player name
+
+    def __init__(self, path, initial_capacity=1024, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.slots = {}
+        self.open(initial_capacity)
+
+    def open(self, initial_capacity):
+        finish_compaction(self.path)
+        self.records_file = self.open_file(f"{self.path}.records")
+        self.index_file = self.open_file(f"{self.path}.index")
+        self.heap_file = self.open_file(f"{self.path}.heap")
+        self.heap_size = os.fstat(self.heap_file.fileno()).st_size
+
+        if os.fstat(self.records_file.fileno()).st_size == 0:
+            self.used = 0
+            self.capacity = 0
+            self.records_map = None
+            self.index_map = None
+            self.map_records(initial_capacity)
+            self.map_index(self.index_capacity_for(initial_capacity))
+        else:
+            self.records_map = mmap.mmap(self.records_file.fileno(), 0)
+            magic, version, record_size, self.used, self.capacity = HEADER.unpack_from(self.records_map)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.itemsize:
+                raise SaveStoreError(f"{self.path}.records is not a compatible save store")
+            self.records = np.frombuffer(self.records_map, RECORD, self.capacity, HEADER_SIZE)
+            self.index_map = mmap.mmap(self.index_file.fileno(), 0)
+            self.index = np.frombuffer(self.index_map, "<u4")
+        self.live = int(np.count_nonzero(self.records["flags"][:self.used] == LIVE))
+
+    def open_file(self, path):
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        return open(path, "r+b")
+
+    # Mapping and growth
+
+    def map_records(self, capacity):
+        # Growing the file keeps the records in it. The new map is in place
+        # before the old one is dropped, so the store stays usable even when
+        # the old map can't be closed yet.
+        self.records_file.truncate(HEADER_SIZE + capacity * RECORD.itemsize)
+        old_map = self.records_map
+        self.records_map = mmap.mmap(self.records_file.fileno(), 0)
+        self.capacity = capacity
+        self.records = np.frombuffer(self.records_map, RECORD, capacity, HEADER_SIZE)
+        self.write_header()
+        if old_map is not None:
+            close_map(old_map)
+
+    def release_records(self):
+        if self.records_map is not None:
+            self.records = None
+            close_map(self.records_map)
+            self.records_map = None
+
+    def index_capacity_for(self, records):
+        capacity = 16
+        while capacity < records * 2:
+            capacity *= 2
+        return capacity
+
+    def map_index(self, capacity):
+        if self.index_map is not None:
+            self.index = None
+            self.index_map.close()
+        self.index_file.truncate(0)
+        self.index_file.truncate(capacity * 4)
+        self.index_map = mmap.mmap(self.index_file.fileno(), 0)
+        self.index = np.frombuffer(self.index_map, "<u4")
+        # Rebuild from the live records
+        for record_number in np.flatnonzero(self.records["flags"][:self.used] == LIVE):
+            self.index_insert(int(self.records[record_number]["name_hash"]), int(record_number))
+
+    def write_header(self):
+        HEADER.pack_into(self.records_map, 0, MAGIC, VERSION, RECORD.itemsize, self.used, self.capacity)
+
+    # Index
+
+    def probe(self, hashed):
+        mask = len(self.index) - 1
+        position = hashed & mask
+        while True:
+            yield position
+            position = (position + 1) & mask
+
+    def index_insert(self, hashed, record_number):
+        for position in self.probe(hashed):
+            if self.index[position] in (EMPTY, TOMBSTONE):
+                self.index[position] = record_number + 1
+                return
+
+    def find(self, name):
+        # Returns (index position, record number) or (None, None)
+        hashed = name_hash(name)
+        for position in self.probe(hashed):
+            entry = int(self.index[position])
+            if entry == EMPTY:
+                return None, None
+            if entry == TOMBSTONE:
+                continue
+            record_number = entry - 1
+            record = self.records[record_number]
+            if int(record["name_hash"]) == hashed and self.record_name(record_number) == name:
+                return position, record_number
+
+    # Heap
+
+    def heap_append(self, data):
+        offset = self.heap_size
+        os.pwrite(self.heap_file.fileno(), data, offset)
+        self.heap_size += len(data)
+        return offset
+
+    def heap_read(self, offset, length):
+        return os.pread(self.heap_file.fileno(), length, offset)
+
+    def record_name(self, record_number):
+        record = self.records[record_number]
+        length = int(record["name_length"])
+        if length <= RECORD["name"].itemsize:
+            return bytes(record["name"]).decode()
+        return self.heap_read(int(record["name_offset"]), length).decode()
+
+    # Public API
+
+    def __len__(self):
+        return self.live
+
+    def __contains__(self, name):
+        return self.find(name)[1] is not None
+
+    def names(self):
+        for record_number in np.flatnonzero(self.records["flags"][:self.used] == LIVE):
+            yield self.record_name(int(record_number))
+
+    def save_state(self, name, state, blob=True):
+        # state has the player_data layout used by Game.save_game/load_game.
+        # With blob=False only the fixed fields are rewritten. The new record
+        # is built on the side and copied over the old one in one go, after
+        # its blob is in the heap (and on disk, with fsync), so a record never
+        # points at a blob that isn't there.
+        position, record_number = self.find(name)
+        if record_number is None:
+            if not blob:
+                raise SaveStoreError(f"No saved inventory for new player {name!r}")
+            record = np.zeros(1, RECORD)
+            encoded = name.encode()
+            record["name_hash"] = name_hash(name)
+            record["name_length"] = len(encoded)
+            if len(encoded) <= RECORD["name"].itemsize:
+                record["name"] = encoded
+            else:
+                record["name_offset"] = self.heap_append(encoded)
+            record["flags"] = LIVE
+        else:
+            record = self.records[record_number:record_number + 1].copy()
+
+        for field in HOT_FIELDS:
+            record[field] = state[field]
+        for field in TEXT_FIELDS:
+            value = state.get(field) or ""
+            encoded = value.encode()
+            if len(encoded) > RECORD[field].itemsize:
+                raise SaveStoreError(f"{field} {value!r} is too long for the save store")
+            record[field] = encoded
+        if blob:
+            data = json.dumps({"inventory": state["inventory"], "skills": state["skills"],
+                               "hybrids": state.get("hybrids", {})}, separators=(",", ":")).encode()
+            record["blob_offset"] = self.heap_append(data)
+            record["blob_length"] = len(data)
+            if self.fsync:
+                os.fsync(self.heap_file.fileno())
+
+        if record_number is None:
+            # Deleted records keep their tombstones until compact(), so size by records used
+            if (self.used + 1) * 2 > len(self.index):
+                self.map_index(self.index_capacity_for(self.used + 1))
+            if self.used >= self.capacity:
+                self.map_records(max(self.capacity * 2, 16))
+            # Written before anything refers to it: the index entry, then the header's record count
+            record_number = self.used
+            self.records[record_number:record_number + 1] = record
+            self.index_insert(int(record["name_hash"][0]), record_number)
+            self.used += 1
+            self.live += 1
+            self.write_header()
+        else:
+            self.records[record_number:record_number + 1] = record
+        return record_number
+
+    def load_state(self, name):
+        record_number = self.find(name)[1]
+        if record_number is None:
+            return None
+        record = self.records[record_number]
+        state = {"name": name}
+        for field in HOT_FIELDS:
+            state[field] = int(record[field])
+        for field in TEXT_FIELDS:
+            state[field] = bytes(record[field]).decode()
+        state.update(json.loads(self.heap_read(int(record["blob_offset"]), int(record["blob_length"]))))
+        return state
+
+    def hot(self, name):
+        # Level, gold, location and friends straight from the mapped record
+        record_number = self.find(name)[1]
+        if record_number is None:
+            return None
+        record = self.records[record_number]
+        hot = {field: int(record[field]) for field in HOT_FIELDS}
+        hot["location"] = bytes(record["location"]).decode()
+        return hot
+
+    def scan(self, *fields):
+        # Columns of every live record, e.g. store.scan("level", "gold"). They
+        # are copies: a view would pin the map and stop the store from growing.
+        live = self.records["flags"][:self.used] == LIVE
+        if live.all():
+            return {field: self.records[field][:self.used].copy() for field in fields}
+        return {field: self.records[field][:self.used][live] for field in fields}
+
+    def delete(self, name):
+        position, record_number = self.find(name)
+        if record_number is None:
+            return False
+        self.records[record_number]["flags"] = EMPTY
+        self.index[position] = TOMBSTONE
+        self.live -= 1
+        self.slots.pop(name, None)
+        return True
+
+    def compact(self):
+        # Rewrite the heap and records without dead blobs or deleted players.
+        # The compacted store is written beside this one and swapped in;
+        # finish_compaction() explains how a crash part way is recovered.
+        temp_path = f"{self.path}.compact"
+        compacted = SaveStore(temp_path, max(self.capacity, 16), fsync=False)
+        for name in self.names():
+            compacted.save_state(name, self.load_state(name))
+        compacted.close()
+        for suffix in STORE_FILES:
+            fsync_path(f"{temp_path}.{suffix}")
+        self.close()
+        with open(f"{self.path}.compacted", "wb") as marker:
+            os.fsync(marker.fileno())
+        fsync_directory(os.path.dirname(self.path))
+        self.open(max(self.capacity, 16))
+
+    def slot(self, name):
+        # Save-slot interface used by Game.save_game/load_game, keyed by name
+        if name not in self.slots:
+            self.slots[name] = StoreSlot(self, name)
+        return self.slots[name]
+
+    def list_slots(self):
+        return sorted(self.names())
+
+    def sync(self):
+        self.flush()
+
+    def flush(self):
+        self.write_header()
+        self.records_map.flush()
+        self.index_map.flush()
+        os.fsync(self.heap_file.fileno())
+
+    def close(self):
+        self.flush()
+        self.release_records()
+        self.index = None
+        close_map(self.index_map)
+        self.index_map = None
+        for open_file in (self.records_file, self.index_file, self.heap_file):
+            open_file.close()
+
+
+class StoreSlot:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.fsync = store.fsync
+        self.inventory = None
+        self.skills = None
+        self.synced = False
+
+    # Same capture/write split as journal.SaveSlot
+
+    def save(self, player):
+        self.write(self.capture(player))
+        if self.fsync:
+            self.store.sync()
+
+    def capture(self, player):
+        fields = {
+            "gold": player.gold,
+            "health": player.health,
+            "location": player.location,
+            "level": player.level,
+            "exp": player.exp,
+            "skill_points": player.skill_points,
+            "race": player.race,
+            "sub_race": player.sub_race,
+        }
+        skills = player.skill_tree.level_map()
+        inventory = player.inventory
+        # Only rewrite the variable-length part when the inventory or skills changed
+        full = (not self.synced or self.inventory is not inventory or inventory.changes_owner is not self
+                or bool(inventory.changes) or skills != self.skills)
+        inventory.take_changes(self)
+        self.inventory = inventory
+        self.skills = skills
+        self.synced = True
+        return {"fields": fields, "items": inventory.to_save() if full else {}, "skills": skills, "full": full}
+
+    def write(self, capture):
+        state = dict(capture["fields"])
+        if capture["full"]:
+            state["inventory"] = {item: count for item, count in capture["items"].items() if count}
+            state["skills"] = capture["skills"]
+            state["hybrids"] = item_registry().hybrid_records(state["inventory"])
+        record_number = self.store.save_state(self.name, state, capture["full"])
+        # Bytes written: the fixed record plus the new heap blob, if any
+        written = RECORD.itemsize
+        if capture["full"]:
+            written += int(self.store.records[record_number]["blob_length"])
+        return written
+
+    def load(self):
+        state = self.store.load_state(self.name)
+        self.synced = False
+        if state is not None:
+            self.skills = dict(state["skills"])
+        return state
+
+    def attach(self, player):
+        self.inventory = player.inventory
+        player.inventory.take_changes(self)
+        self.synced = True
+
+    def exists(self):
+        return self.name in self.store
+
+    def sync_target(self):
+        return self.store
+
+    def close(self):
+        pass
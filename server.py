@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import atexit
+import itertools
+import json
+import time
+
+from engine import GameSession, SessionError, CLOSED
+from journal import SAVE_DIR, SaveDirectory
+
+# Asyncio session server: every connection gets its own GameSession and all
+# of them share one event loop. The wire protocol is one JSON object per
+# line in each direction. A connection starts with
+#   {"action": "create", "name": "Ayla", "race": "Elves", "sub_race": "Succubus"}
+# and then sends engine commands such as {"action": "explore", "location": "Dark Amazon"}.
+# Every command is answered with {"session": id, "state": {...}, "events": [...]}.
+# "create" may carry a "seed"; its reply always includes the seed in use.
+
+
+class SessionServer:
+    def __init__(self, saves=None):
+        # One save backend shared by every session, keyed by character name
+        # (e.g. a save_store.SaveStore), so sessions never write the same slot
+        self.saves = saves if saves is not None else SaveDirectory(per_player=True)
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        self.server = None
+
+    # In-process API, also used by the TCP handler
+
+    def open_session(self, name, race, sub_race, seed=None, session_id=None):
+        if session_id is None:
+            session_id = next(self.ids)
+        self.sessions[session_id] = GameSession(name, race, sub_race, self.saves, seed)
+        return session_id
+
+    def is_open(self, session_id):
+        return session_id in self.sessions
+
+    def close_session(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    def submit(self, session_id, command):
+        session = self.sessions[session_id]
+        try:
+            events = session.submit(command)
+        except Exception as error:
+            # A broken location event must not take the whole server down
+            session.reset()
+            events = session.events.drain()
+            events.append({"type": "error", "message": f"Internal error: {error!r}"})
+        reply = {"session": session_id, "state": session.snapshot(), "events": events}
+        if session.state == CLOSED:
+            self.close_session(session_id)
+        return reply
+
+    # TCP front end. create() and forward() are where a subclass can send
+    # the work elsewhere (see shards.ShardedSessionServer).
+
+    async def create(self, command):
+        session_id = self.open_session(command.get("name", "Hero"), command.get("race"), command.get("sub_race"),
+                                       command.get("seed"))
+        session = self.sessions[session_id]
+        # The seed goes back to the client so a bug report can replay the session
+        return session_id, {"session": session_id, "seed": session.seed, "state": session.snapshot(), "events": []}
+
+    async def forward(self, session_id, command):
+        return self.submit(session_id, command)
+
+    async def handle(self, reader, writer):
+        session_id = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    command = json.loads(line)
+                    if session_id is None:
+                        if command.get("action") != "create":
+                            raise SessionError("Create a character first (action 'create').")
+                        session_id, reply = await self.create(command)
+                    else:
+                        reply = await self.forward(session_id, command)
+                except (ValueError, SessionError) as error:
+                    reply = {"session": session_id, "events": [{"type": "error", "message": str(error)}]}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+                if session_id is not None and not self.is_open(session_id):
+                    break
+        finally:
+            if session_id is not None:
+                self.close_session(session_id)
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8765):
+        self.server = await asyncio.start_server(self.handle, host, port, limit=2 ** 20, backlog=4096)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class SessionClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765):
+        reader, writer = await asyncio.open_connection(host, port, limit=2 ** 20)
+        return cls(reader, writer)
+
+    async def send(self, command):
+        self.writer.write(json.dumps(command).encode() + b"\n")
+        await self.writer.drain()
+        line = await self.reader.readline()
+        return json.loads(line)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def play_scripted(client, name):
+    # Small session used by the load check: shop, gear up and clear the forest
+    await client.send({"action": "create", "name": name, "race": "Half-Orc", "sub_race": "Werewolf"})
+    for command in (
+        {"action": "buy", "item": "Iron Sword"},
+        {"action": "buy", "item": "Health Potion"},
+        {"action": "equip", "item": "Iron Sword"},
+        {"action": "status"},
+    ):
+        await client.send(command)
+    reply = await client.send({"action": "explore", "location": "Dark Amazon"})
+    while reply["state"]["state"] != "idle":
+        state = reply["state"]["state"]
+        if state == "dialogue":
+            reply = await client.send({"action": "talk", "option": 1})
+        elif state == "combat":
+            reply = await client.send({"action": "attack"})
+        else:
+            reply = await client.send({"action": "answer", "text": "no"})
+    await client.send({"action": "quit"})
+
+
+async def load_check(clients, shards=0, by="player"):
+    if shards:
+        from shards import ShardRouter, ShardedSessionServer
+        server = ShardedSessionServer(ShardRouter(shards, by))
+    else:
+        server = SessionServer()
+    await server.start(port=0)
+    connections = await asyncio.gather(*(SessionClient.connect(port=server.port) for _ in range(clients)))
+    started = time.perf_counter()
+    await asyncio.gather(*(play_scripted(client, f"Bot {i}") for i, client in enumerate(connections)))
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*(client.close() for client in connections))
+    await server.stop()
+    placement = ""
+    if shards:
+        server.router.stop()
+        placement = f" on {shards} shards by {by}, {server.router.migrations} migrations"
+    print(f"{clients} concurrent sessions played in {elapsed:.2f}s ({clients / elapsed:.0f} sessions/s){placement}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host Helbrand game sessions over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--save-dir", default=SAVE_DIR,
+                        help="Directory for save slots, one per character (unless --save-store is given)")
+    parser.add_argument("--save-store", metavar="PATH",
+                        help="Keep every player's save in one memory-mapped store at PATH")
+    parser.add_argument("--load-check", type=int, metavar="CLIENTS",
+                        help="Run CLIENTS scripted local clients against a throwaway server and exit")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Record timings and counters, written to PATH on exit (.json for JSON, else Prometheus)")
+    parser.add_argument("--shards", type=int, default=0, metavar="N",
+                        help="Run sessions in N worker processes (0: in this process)")
+    parser.add_argument("--shard-by", choices=("player", "zone"), default="player",
+                        help="Place sessions on shards by player, or by the zone they are in")
+    args = parser.parse_args(argv)
+    if args.shards < 0:
+        parser.error("--shards must be 0 or more")
+    # Both only see this process; with shards the sessions run in the workers
+    if args.shards and args.save_store:
+        parser.error("--save-store can't be combined with --shards")
+    if args.shards and args.metrics:
+        parser.error("--metrics can't be combined with --shards")
+
+    if args.metrics:
+        import metrics
+
+        metrics.enable()
+        atexit.register(metrics.write, args.metrics)
+
+    if args.load_check:
+        asyncio.run(load_check(args.load_check, args.shards, args.shard_by))
+        return
+
+    async def serve():
+        if args.save_store:
+            from save_store import SaveStore
+            saves = SaveStore(args.save_store)
+        else:
+            saves = SaveDirectory(args.save_dir, per_player=True)
+        if args.shards:
+            from shards import ShardRouter, ShardedSessionServer
+            server = ShardedSessionServer(ShardRouter(args.shards, args.shard_by, args.save_dir))
+        else:
+            server = SessionServer(saves)
+        await server.start(args.host, args.port)
+        print(f"Serving Helbrand sessions on {args.host}:{server.port}")
+        await server.server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
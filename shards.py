@@ -0,0 +1,240 @@
+import asyncio
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import threading
+
+import content
+from engine import CLOSED, IDLE, SessionError, restore
+from journal import SAVE_DIR, SaveDirectory
+from server import SessionServer
+
+# Sessions sharded across worker processes, so a busy server uses every
+# core instead of one event loop's. Each shard is a process running its own
+# SessionServer; the TCP front end (ShardedSessionServer) only parses lines
+# and forwards commands to the shard that owns the session, over a pipe.
+#
+# Sessions are placed by player (session id modulo the shard count) or by
+# zone: every exploration zone belongs to one shard, and a session moves to
+# its zone's shard as soon as it is idle there. Moving is a handoff: the old
+# shard turns the session into plain data (GameSession.handoff()) and the
+# new one rebuilds it (engine.restore()), RNG position included, so a
+# moved session plays out exactly as if it had stayed put.
+#
+#   python server.py --shards 4 --shard-by zone
+#
+# Every shard saves its own sessions into one shared per-player save
+# directory (journal.SaveDirectory, slots keyed by character name). A
+# character can only be in play once, so each slot has a single writer; a
+# session's slot is released by the shard it leaves.
+#
+# Shards are long-lived processes rather than a ProcessPoolExecutor: a pool
+# hands each task to whichever worker is free, and sessions have to stay
+# with the process that holds them.
+
+PLACEMENTS = ("player", "zone")
+
+
+def shard_main(connection, save_dir):
+    # Worker loop. Requests are (request id, action, session id, payload)
+    # and get (request id, result, error) back, in order; "close" has no reply.
+    server = SessionServer(SaveDirectory(save_dir, per_player=True))
+    while True:
+        try:
+            request_id, action, session_id, payload = connection.recv()
+        except EOFError:
+            break
+        if action == "stop":
+            break
+        if action == "close":
+            server.close_session(session_id)
+            continue
+        result = error = None
+        try:
+            if action == "open":
+                server.open_session(*payload, session_id=session_id)
+                session = server.sessions[session_id]
+                result = {"session": session_id, "seed": session.seed, "state": session.snapshot(), "events": []}
+            elif action == "submit":
+                reply = server.submit(session_id, payload)
+                # The session's location goes back too while it is idle, for placement by zone
+                session = server.sessions.get(session_id)
+                movable = session is not None and session.state == IDLE
+                result = (reply, session.player.location if movable else None)
+            elif action == "handoff":
+                session = server.sessions[session_id]
+                result = session.handoff()
+                del server.sessions[session_id]
+                # The adopting shard writes the player's saves from now on
+                server.saves.release(session.default_slot)
+            elif action == "adopt":
+                server.sessions[session_id] = restore(payload, server.saves)
+        except SessionError as exception:
+            error = ("session", str(exception))
+        except Exception as exception:
+            error = ("internal", repr(exception))
+        connection.send((request_id, result, error))
+    connection.close()
+
+
+class Shard:
+    def __init__(self, context, save_dir):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=shard_main, args=(child, save_dir), daemon=True)
+        self.process.start()
+        child.close()
+        self.pending = {}  # Request id -> concurrent.futures.Future
+        self.ids = itertools.count()
+        self.lock = threading.Lock()  # One request at a time on the pipe
+        self.reader = None
+
+    def start_reader(self):
+        self.reader = threading.Thread(target=self.read_replies, daemon=True)
+        self.reader.start()
+
+    def request(self, action, session_id, payload=None):
+        future = concurrent.futures.Future()
+        with self.lock:
+            request_id = next(self.ids)
+            self.pending[request_id] = future
+            self.connection.send((request_id, action, session_id, payload))
+        return asyncio.wrap_future(future)
+
+    def send(self, action, session_id):
+        # Request without a reply
+        with self.lock:
+            self.connection.send((None, action, session_id, None))
+
+    def read_replies(self):
+        while True:
+            try:
+                request_id, result, error = self.connection.recv()
+            except (EOFError, OSError):
+                break
+            future = self.pending.pop(request_id)
+            if error is None:
+                future.set_result(result)
+            elif error[0] == "session":
+                future.set_exception(SessionError(error[1]))
+            else:
+                future.set_exception(RuntimeError(f"Shard error: {error[1]}"))
+        for future in self.pending.values():
+            future.set_exception(RuntimeError("Shard process exited"))
+        self.pending.clear()
+
+    def stop(self):
+        with self.lock:
+            try:
+                self.connection.send((None, "stop", None, None))
+            except OSError:
+                pass
+        self.process.join(5)
+        self.connection.close()
+
+
+def zone_shards(count):
+    # Shard index of every location a session can be in
+    locations = ["Town"] + sorted(content.load("world")["locations"])
+    return {location: index % count for index, location in enumerate(locations)}
+
+
+class ShardRouter:
+    def __init__(self, shards=None, by="player", save_dir=SAVE_DIR):
+        if by not in PLACEMENTS:
+            raise ValueError(f"Unknown placement: {by!r} (one of {', '.join(PLACEMENTS)})")
+        count = shards or os.cpu_count() or 1
+        # spawn: the router runs reader threads, which don't survive a fork
+        context = multiprocessing.get_context("spawn")
+        self.shards = [Shard(context, save_dir) for _ in range(count)]
+        for shard in self.shards:
+            shard.start_reader()
+        self.by = by
+        self.zones = zone_shards(count) if by == "zone" else None
+        self.placement = {}  # Session id -> shard index
+        self.players = {}  # Session id -> character name
+        self.ids = itertools.count(1)
+        self.migrations = 0
+
+    def home(self, session_id, location):
+        if self.zones is None:
+            return (session_id - 1) % len(self.shards)
+        return self.zones.get(location, 0)
+
+    async def open(self, name, race, sub_race, seed=None):
+        # Saves are keyed by character name and every shard writes its own
+        # sessions' saves, so a name may only be in play once at a time
+        if name in self.players.values():
+            raise SessionError(f"{name} is already being played.")
+        session_id = next(self.ids)
+        index = self.home(session_id, "Town")
+        self.players[session_id] = name
+        try:
+            reply = await self.shards[index].request("open", session_id, (name, race, sub_race, seed))
+        except Exception:
+            del self.players[session_id]
+            raise
+        self.placement[session_id] = index
+        return session_id, reply
+
+    async def submit(self, session_id, command):
+        index = self.placement[session_id]
+        reply, location = await self.shards[index].request("submit", session_id, command)
+        if reply["state"]["state"] == CLOSED:
+            # The shard has already dropped it
+            del self.placement[session_id]
+            del self.players[session_id]
+        elif location is not None and self.zones is not None:
+            target = self.home(session_id, location)
+            if target != index:
+                await self.migrate(session_id, index, target)
+        return reply
+
+    async def migrate(self, session_id, source, target):
+        handoff = await self.shards[source].request("handoff", session_id)
+        try:
+            await self.shards[target].request("adopt", session_id, handoff)
+        except Exception:
+            # The source shard has already dropped the session: take it back there
+            try:
+                await self.shards[source].request("adopt", session_id, handoff)
+            except Exception:
+                self.placement.pop(session_id, None)
+                self.players.pop(session_id, None)
+                raise SessionError("Your session was lost while moving between shards, please reconnect.")
+            return
+        self.placement[session_id] = target
+        self.migrations += 1
+
+    def is_open(self, session_id):
+        return session_id in self.placement
+
+    def close(self, session_id):
+        self.players.pop(session_id, None)
+        index = self.placement.pop(session_id, None)
+        if index is not None:
+            self.shards[index].send("close", session_id)
+
+    def stop(self):
+        for shard in self.shards:
+            shard.stop()
+
+
+class ShardedSessionServer(SessionServer):
+    # SessionServer whose sessions live in a ShardRouter's worker processes
+    def __init__(self, router):
+        super().__init__()
+        self.router = router
+
+    async def create(self, command):
+        return await self.router.open(command.get("name", "Hero"), command.get("race"), command.get("sub_race"),
+                                      command.get("seed"))
+
+    async def forward(self, session_id, command):
+        return await self.router.submit(session_id, command)
+
+    def is_open(self, session_id):
+        return self.router.is_open(session_id)
+
+    def close_session(self, session_id):
+        self.router.close(session_id)
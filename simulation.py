@@ -0,0 +1,489 @@
+import argparse
+import random
+
+import numpy as np
+
+from encounters import encounter_table
+from enemies import enemy_archetype, enemy_registry
+from items import item_registry
+from Helbrand import (COLISEUM_SWARM_EVERY, COLISEUM_SWARM_SIZE, COLISEUM_UNIQUE_ITEM_CHANCE, Player, Enemy,
+                      SkillBook, coliseum_challenger, low_health, races, sub_races, swarm_archetype)
+
+# Headless combat simulator. Fights follow the same rules as Game.combat
+# (player acts, the enemy answers if still alive, enemy damage is a
+# randint(5, attack_power) roll) but every fight in a batch is advanced at
+# once with NumPy arrays instead of one input() prompt per turn.
+
+# Enemies spawned by the exploration events: name -> (health, attack_power)
+ENCOUNTERS = {enemy.name: (enemy.health, enemy.attack_max) for enemy in enemy_registry().regular()}
+
+# Combat actions a policy can pick each turn
+ATTACK = 0
+POWER_STRIKE = 1
+BERSERK = 2
+FIREBALL = 3
+LIGHTNING_STRIKE = 4
+HEALTH_POTION = 5
+FLEE = 6
+
+SKILL_ACTIONS = {
+    "Power Strike": POWER_STRIKE,
+    "Berserk": BERSERK,
+    "Fireball": FIREBALL,
+    "Lightning Strike": LIGHTNING_STRIKE,
+}
+
+# Fight outcomes
+LOSS = 0
+WIN = 1
+FLED = 2
+TIMEOUT = 3
+
+OUTCOME_NAMES = {LOSS: "loss", WIN: "win", FLED: "fled", TIMEOUT: "timeout"}
+
+
+class CombatState:
+    # What a policy sees: the still-running fights of a batch, one entry each
+    def __init__(self, turn, player_health, enemy_health, potions, stats):
+        self.turn = turn
+        self.player_health = player_health
+        self.enemy_health = enemy_health
+        self.potions = potions
+        self.stats = stats
+
+    def __len__(self):
+        return len(self.player_health)
+
+    def skill_level(self, skill_name):
+        return self.stats.skill_levels.get(skill_name, 0)
+
+
+class CombatStats:
+    # Snapshot of everything about a Player that matters in combat
+    def __init__(self, player):
+        self.name = player.name
+        self.health = player.health
+        self.base_health = player.base_health()
+        self.strength = player.strength
+        self.magic = player.magic
+        self.weapon_bonus = player.get_weapon_bonus()
+        heal = item_registry().stats["heal"]
+        self.potions = sum(count for item_id, count in player.inventory.counts.items() if heal[item_id] > 0)
+        self.potion_heal = item_registry().stat("Health Potion", "heal")
+        self.skill_levels = player.skill_tree.level_map()
+        self.conditions = {}  # Action -> condition its skill effect needs to fire
+        self.area = set()  # Actions that hit every enemy of a group
+        self.damage = self.damage_table()
+
+    def damage_table(self):
+        # Damage dealt by each action, from the same compiled skill effects
+        # Player.use_skill uses. Skills that are not upgraded deal nothing.
+        table = np.zeros(FLEE + 1)
+        table[ATTACK] = self.strength + self.weapon_bonus
+        book = SkillBook.get()
+        for skill_name, action in SKILL_ACTIONS.items():
+            level = self.skill_levels.get(skill_name, 0)
+            if level > 0:
+                effect = book.effects[book.index[skill_name]]
+                table[action] = effect.damage(getattr(self, effect.stat), level)
+                if effect.condition is not None:
+                    self.conditions[action] = effect.condition
+                if effect.area:
+                    self.area.add(action)
+        return table
+
+
+# Player policies. Each one receives a CombatState and returns one action per fight.
+
+def always_attack(state):
+    return np.full(len(state), ATTACK)
+
+
+def fireball_when_available(state):
+    if state.skill_level("Fireball") > 0:
+        return np.full(len(state), FIREBALL)
+    return always_attack(state)
+
+
+def strongest_skill(state):
+    # Pick whichever available action hits hardest, saving Berserk for when it can trigger
+    table = state.stats.damage
+    best = max((ATTACK, POWER_STRIKE, FIREBALL, LIGHTNING_STRIKE), key=lambda action: table[action])
+    actions = np.full(len(state), best)
+    if table[BERSERK] > table[best]:
+        actions[low_health(state.player_health, state.stats.base_health)] = BERSERK
+    return actions
+
+
+def potion_when_low(threshold=30, fallback=always_attack):
+    def policy(state):
+        actions = fallback(state)
+        drink = (state.player_health < threshold) & (state.potions > 0)
+        actions[drink] = HEALTH_POTION
+        return actions
+    return policy
+
+
+POLICIES = {
+    "attack": always_attack,
+    "fireball": fireball_when_available,
+    "strongest": strongest_skill,
+    "potion": potion_when_low(),
+}
+
+
+class SimulationResult:
+    def __init__(self, enemy_name, outcome, turns, player_health, enemy_health):
+        self.enemy_name = enemy_name
+        self.outcome = outcome
+        self.turns = turns
+        self.player_health = player_health
+        self.enemy_health = enemy_health
+
+    def __len__(self):
+        return len(self.outcome)
+
+    @property
+    def win_rate(self):
+        return float(np.mean(self.outcome == WIN)) if len(self) else 0.0
+
+    def outcome_counts(self):
+        counts = np.bincount(self.outcome, minlength=len(OUTCOME_NAMES))
+        return {OUTCOME_NAMES[code]: int(count) for code, count in enumerate(counts)}
+
+    def turns_to_kill(self):
+        return self.turns[self.outcome == WIN]
+
+    def health_remaining(self):
+        return self.player_health[self.outcome == WIN]
+
+    def summary(self, percentiles=(5, 25, 50, 75, 95)):
+        summary = {
+            "enemy": self.enemy_name,
+            "fights": len(self),
+            "win_rate": self.win_rate,
+            "outcomes": self.outcome_counts(),
+        }
+        for key, values in (("turns_to_kill", self.turns_to_kill()), ("health_remaining", self.health_remaining())):
+            if len(values):
+                points = np.percentile(values, percentiles)
+                summary[key] = {
+                    "mean": float(np.mean(values)),
+                    "min": float(np.min(values)),
+                    "max": float(np.max(values)),
+                    "percentiles": {p: float(v) for p, v in zip(percentiles, points)},
+                }
+            else:
+                summary[key] = None
+        return summary
+
+    def distribution(self, values):
+        # Histogram of an integer-valued array as {value: count}
+        values = np.asarray(values, dtype=np.int64)
+        if not len(values):
+            return {}
+        low = int(values.min())
+        counts = np.bincount(values - low)
+        return {low + i: int(c) for i, c in enumerate(counts) if c}
+
+    def report(self):
+        summary = self.summary()
+        lines = [
+            f"=== {summary['fights']} fights vs {self.enemy_name} ===",
+            f"Win rate: {summary['win_rate']:.2%}",
+            "Outcomes: " + ", ".join(f"{name} {count}" for name, count in summary["outcomes"].items()),
+        ]
+        for key, label in (("turns_to_kill", "Turns to kill"), ("health_remaining", "HP remaining")):
+            stats = summary[key]
+            if stats is None:
+                lines.append(f"{label}: n/a")
+                continue
+            points = ", ".join(f"p{p}={v:g}" for p, v in stats["percentiles"].items())
+            lines.append(f"{label}: mean {stats['mean']:.2f} (min {stats['min']:g}, max {stats['max']:g}; {points})")
+        return "\n".join(lines)
+
+
+def make_rng(seed=None):
+    # Without an explicit seed, draw one from the random module so random.seed() still controls the run
+    if seed is None:
+        seed = random.getrandbits(64)
+    return np.random.default_rng(seed)
+
+
+def simulate(player, enemy, fights, policy=always_attack, max_turns=1000, seed=None):
+    stats = CombatStats(player)
+    rng = make_rng(seed)
+    damage = stats.damage
+
+    player_health = np.full(fights, stats.health, dtype=np.int64)
+    enemy_health = np.full(fights, float(enemy.health))
+    potions = np.full(fights, stats.potions, dtype=np.int64)
+    outcome = np.full(fights, TIMEOUT, dtype=np.int8)
+    turns = np.zeros(fights, dtype=np.int32)
+
+    # Indices of fights that are still running; finished ones drop out of the arrays
+    active = np.arange(fights)
+    # Game.combat never starts a round once the player is already down
+    if stats.health <= 0:
+        outcome[:] = LOSS
+        active = active[:0]
+
+    turn = 0
+    while len(active) and turn < max_turns:
+        turn += 1
+        hp = player_health[active]
+        ehp = enemy_health[active]
+        pots = potions[active]
+        actions = np.asarray(policy(CombatState(turn, hp, ehp, pots, stats)))
+
+        fled = actions == FLEE
+        hit = damage[actions]
+        # Skills whose condition isn't met (Berserk above 30% base health) waste the turn
+        for action, condition in stats.conditions.items():
+            hit = np.where((actions == action) & ~condition(hp, stats.base_health), 0.0, hit)
+        ehp = ehp - np.where(fled, 0.0, hit)
+
+        drink = (actions == HEALTH_POTION) & (pots > 0)
+        hp = hp + np.where(drink, stats.potion_heal, 0)
+        pots = pots - drink
+
+        enemy_alive = (ehp > 0) & ~fled
+        rolls = rng.integers(enemy.archetype.attack_min, enemy.archetype.attack_max, size=len(active), endpoint=True)
+        hp = hp - np.where(enemy_alive, rolls, 0)
+
+        player_health[active] = hp
+        enemy_health[active] = ehp
+        potions[active] = pots
+        turns[active] = turn
+
+        lost = hp <= 0
+        won = ~lost & ~fled & ~enemy_alive
+        outcome[active[fled]] = FLED
+        outcome[active[lost & ~fled]] = LOSS
+        outcome[active[won]] = WIN
+        active = active[enemy_alive & ~lost]
+
+    return SimulationResult(enemy.name, outcome, turns, player_health, enemy_health)
+
+
+def simulate_encounter(player, enemy_name, fights, policy=always_attack, **kwargs):
+    return simulate(player, Enemy.spawn(enemy_archetype(enemy_name)), fights, policy, **kwargs)
+
+
+def simulate_location(player, location, trips, policy=always_attack, seed=None, **kwargs):
+    # Draw trips encounters from the location's table in one go, then fight
+    # every enemy outcome as one batch. Returns {outcome index: count} for
+    # the whole draw and {enemy name: SimulationResult} for the fights.
+    table = encounter_table(location)
+    rng = make_rng(seed)
+    drawn = np.bincount(table.draw_many(trips, rng), minlength=len(table))
+    results = {}
+    for index, count in enumerate(drawn):
+        outcome = table.outcomes[index]
+        if outcome["kind"] == "enemy" and count:
+            enemy = Enemy.spawn(enemy_archetype(outcome["enemy"]))
+            results[enemy.name] = simulate(player, enemy, int(count), policy,
+                                           seed=int(rng.integers(2 ** 63)), **kwargs)
+    return {index: int(count) for index, count in enumerate(drawn)}, results
+
+
+class ColiseumResult:
+    def __init__(self, battles_won, fell_in, health, gold, loot, exp, level, skill_points):
+        self.battles_won = battles_won
+        self.fell_in = fell_in  # Battle number the player was defeated in, None if they walked out
+        self.health = health
+        self.gold = gold  # Gold earned, not the player's total
+        self.loot = loot
+        self.exp = exp
+        self.level = level
+        self.skill_points = skill_points
+
+    def report(self):
+        lines = [f"=== Battle Coliseum: {self.battles_won} victories ===",
+                 f"Gold earned: {self.gold}",
+                 f"Unique items: {len(self.loot)}",
+                 f"Level {self.level}, {self.exp} EXP, {self.skill_points} skill points",
+                 f"Health left: {self.health}"]
+        lines.append(f"Defeated in battle {self.fell_in}" if self.fell_in is not None else "Left the coliseum")
+        return "\n".join(lines)
+
+
+def swarm_strikes(count, health, damage, area, limit):
+    # Grunts of a coliseum swarm still standing to strike back after each of
+    # the player's turns but the last (Game.group_turn), cut off once `limit`
+    # strikes have been reached
+    if damage <= 0:
+        return np.full(limit // count + 1, count)
+    hits = int(np.ceil(health / damage - 1e-9))  # Player turns to bring a grunt down
+    # Every turn has at least one strike, so limit + 1 turns are always enough
+    if area:
+        standing = np.full(min(hits - 1, limit + 1), count)
+    else:
+        # Single-target hits go to one grunt at a time
+        standing = count - np.arange(1, min(count * hits, limit + 2)) // hits
+    return standing[:int(np.searchsorted(np.cumsum(standing), limit)) + 1]
+
+
+def simulate_coliseum(player, battles, action=ATTACK, seed=None, leave_below=None):
+    # One coliseum run of up to `battles` challengers, following Game.coliseum_event
+    # with the same action every turn. Health carries over from battle to
+    # battle, so the run is resolved as one stream of enemy hits: battle b
+    # takes ceil(health_b / damage) player hits and the enemy answers all but
+    # the last, then the cumulative damage shows where the player falls.
+    # Every COLISEUM_SWARM_EVERY-th battle is a swarm: its grunts share one
+    # health and attack, so the battle is the number of strikes the standing
+    # grunts make, turn after turn, until the last one falls (all at once to
+    # an area skill, one at a time otherwise).
+    # With leave_below the player walks out after the first win that leaves
+    # them under that much health.
+    if action not in (ATTACK, POWER_STRIKE, FIREBALL, LIGHTNING_STRIKE):
+        raise ValueError("Coliseum runs need an action that always hits (attack or an unconditional skill)")
+    stats = CombatStats(player)
+    rng = make_rng(seed)
+    damage = stats.damage[action]
+    area = action in stats.area
+    health = stats.health
+
+    numbers = np.arange(1, battles + 1)
+    enemy_health, enemy_attack, gold_reward = coliseum_challenger(numbers)
+    low = np.full(battles, 5)  # Smallest and largest enemy hit in each battle
+    high = enemy_attack
+    # A player can take at most this many hits of 5+ damage before going down
+    lethal = max(health, 0) // 5 + 1
+    if damage > 0:
+        # The small margin keeps float skill damage from rounding up an exact kill
+        hits = np.ceil(enemy_health / damage - 1e-9).astype(np.int64)
+        enemy_hits = np.minimum(hits - 1, lethal)
+    else:
+        enemy_hits = np.full(battles, lethal)
+    kills = np.ones(battles, dtype=np.int64)  # Enemies brought down in each battle
+    swarms = {}  # Battle index -> grunts striking on each turn of that battle
+    reach = max(health, 0) + 1  # Damage sure to bring the player down
+    floor = np.cumsum(enemy_hits * low)  # Least damage taken by the end of each battle
+    for index in range(COLISEUM_SWARM_EVERY - 1, battles, COLISEUM_SWARM_EVERY):
+        if floor[index - 1] >= reach:
+            # The player is down before this swarm; later battles are never fought
+            break
+        grunt = swarm_archetype(index + 1)
+        kills[index] = COLISEUM_SWARM_SIZE * (index + 1) // COLISEUM_SWARM_EVERY
+        swarms[index] = swarm_strikes(int(kills[index]), grunt.health, damage, area,
+                                      max(health, 0) // grunt.attack_min + 1)
+        floor[index:] -= enemy_hits[index] * low[index]
+        enemy_hits[index] = swarms[index].sum()
+        low[index], high[index] = grunt.attack_min, grunt.attack_max
+        floor[index:] += enemy_hits[index] * low[index]
+    ends = np.cumsum(enemy_hits)  # Enemy hits taken by the end of each battle
+
+    # Hits past the point where even the smallest rolls have taken all the
+    # player's health can't matter
+    hit_count = int(ends[-1]) if battles else 0
+    last = int(np.searchsorted(floor, reach))
+    if last < battles:
+        before = int(floor[last - 1]) if last else 0
+        hit_count = (int(ends[last - 1]) if last else 0) + -(-(reach - before) // int(low[last]))
+    battle_of_hit = np.searchsorted(ends, np.arange(hit_count), side="right")
+    taken = np.cumsum(rng.integers(low[battle_of_hit], high[battle_of_hit], endpoint=True))
+
+    fatal = int(np.searchsorted(taken, health))  # First hit that takes health to 0
+    fallen = 0  # Grunts brought down in a swarm battle the player then lost
+    if health <= 0 and battles:
+        # Already down: the first round is lost whatever happens in it
+        won, fell_in = 0, 1
+        final_health = health - (int(taken[0]) if ends[0] else 0)
+    elif fatal < hit_count:
+        won = int(battle_of_hit[fatal])
+        fell_in = won + 1
+        final_health = health - int(taken[fatal])
+        if won in swarms:
+            # The swarm's strikes land together: the rest of that turn's hit too
+            strike = fatal - (int(ends[won - 1]) if won else 0)
+            turn_ends = np.cumsum(swarms[won])
+            turn = int(np.searchsorted(turn_ends, strike, side="right"))
+            rest = int(turn_ends[turn]) - strike - 1
+            final_health -= int(rng.integers(low[won], high[won], rest, endpoint=True).sum())
+            # Game.group_turn only rewards the turns the player lived through
+            fallen = int(kills[won] - swarms[won][turn - 1]) if turn else 0
+    else:
+        won = battles
+        fell_in = None
+        final_health = None
+
+    # Health after each won battle, for leave_below
+    taken_by_end = np.concatenate(([0], taken))[np.minimum(ends[:won], hit_count)]
+    if leave_below is not None:
+        low_health_after = np.flatnonzero(health - taken_by_end < leave_below)
+        if len(low_health_after):
+            won = int(low_health_after[0]) + 1
+            fell_in = None
+            final_health = None
+    if final_health is None:
+        final_health = health - int(taken_by_end[won - 1]) if won else health
+
+    # Rewards for the won battles: gold, EXP with Player.check_level_up's one
+    # level per gain, unique items. Every kill rolls its EXP, grunts of a lost
+    # swarm battle included; kills made in the same turn (a swarm caught by
+    # an area skill) are one gain.
+    if fell_in is None:
+        fallen = 0
+    gold = int(gold_reward[:won].sum())
+    exp_gains = rng.integers(50, 150, int(kills[:won].sum()) + fallen, endpoint=True)
+    if area and won:
+        exp_gains = np.add.reduceat(exp_gains, np.cumsum(kills[:won]) - kills[:won])
+    unique = numbers[:won][rng.random(won) < COLISEUM_UNIQUE_ITEM_CHANCE]
+    exp, level, skill_points = player.exp, player.level, player.skill_points
+    for total in (exp + np.cumsum(exp_gains)).tolist():
+        if total >= level * 100:
+            level += 1
+            skill_points += 1
+    if won:
+        exp += int(exp_gains.sum())
+    loot = [f"Unique Item {number}" for number in unique.tolist()]
+    return ColiseumResult(won, fell_in, final_health, gold, loot, exp, level, skill_points)
+
+
+def build_player(race, sub_race, skills=None, inventory=None, weapon=None, armor=None):
+    player = Player("Simulant", race, sub_race)
+    for skill, level in (skills or {}).items():
+        player.skill_tree.set_level(skill, level)
+    player.inventory.extend(inventory or [])
+    if weapon:
+        player.equipped_weapon = weapon
+    if armor:
+        player.equipped_armor = armor
+    return player
+
+
+def parse_skills(values):
+    skills = {}
+    for value in values:
+        skill, _, level = value.partition("=")
+        skills[skill] = int(level or 1)
+    return skills
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run headless Monte Carlo fights.")
+    parser.add_argument("--race", default="Terrans", choices=list(races))
+    parser.add_argument("--sub-race", default="Angelic", choices=list(sub_races))
+    parser.add_argument("--enemy", action="append", choices=list(ENCOUNTERS),
+                        help="Enemy to fight (repeatable, defaults to every encounter)")
+    parser.add_argument("--policy", default="attack", choices=list(POLICIES))
+    parser.add_argument("--skill", action="append", default=[], help="Skill level, e.g. Fireball=1 (repeatable)")
+    parser.add_argument("--potions", type=int, default=0)
+    parser.add_argument("--weapon")
+    parser.add_argument("-n", "--fights", type=int, default=100000)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    player = build_player(args.race, args.sub_race, parse_skills(args.skill),
+                          ["Health Potion"] * args.potions, args.weapon)
+    rng = make_rng(args.seed)
+    for enemy_name in args.enemy or list(ENCOUNTERS):
+        result = simulate_encounter(player, enemy_name, args.fights, POLICIES[args.policy],
+                                    seed=int(rng.integers(2 ** 63)))
+        print(result.report())
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import content
+from enemies import EnemyArchetype, enemy_registry
+from Helbrand import Enemy, coliseum_archetype, races, sub_races
+from journal import write_atomic
+from simulation import POLICIES, WIN, build_player, simulate
+
+# Balance sweep: simulated fights for every (race, sub-race, skill build,
+# enemy) cell, spread over a process pool, written out as win-rate and
+# turns-to-kill matrices.
+#
+#   python sweep.py                      full sweep into sweep-results/
+#   python sweep.py --enemy Troll        one column
+#   python sweep.py --workers 1          no pool, everything in this process
+#
+# Every cell's result is cached under a hash of exactly the content it
+# reads (its race and sub-race stats, the skills its build uses, the
+# enemy's stats) plus the fight count and seed. A sweep only simulates the
+# cells whose hash it hasn't seen, so after tweaking one enemy only that
+# enemy's column runs again. A cell's seed comes from the same hash, so a
+# result doesn't depend on what else was in the sweep.
+
+# Bump whenever the simulation rules change so cached cells get recomputed
+SWEEP_VERSION = 1
+
+DEFAULT_OUTPUT = "sweep-results"
+
+# Skill builds: skill levels plus the simulation policy that plays them
+SKILL_BUILDS = {
+    "basic": ({}, "attack"),
+    "power_strike": ({"Strength": 2, "Power Strike": 3, "Berserk": 1}, "strongest"),
+    "fireball": ({"Magic": 2, "Fireball": 3}, "strongest"),
+    "lightning": ({"Magic": 2, "Fireball": 1, "Lightning Strike": 1}, "strongest"),
+}
+
+# Coliseum challengers swept alongside the regular enemies
+COLISEUM_BATTLES = (1, 3, 6, 9)
+
+
+def sweep_enemies():
+    # name -> archetype for every enemy a sweep can fight
+    enemies = {archetype.name: archetype for archetype in enemy_registry().regular()}
+    for battle in COLISEUM_BATTLES:
+        archetype = coliseum_archetype(battle)
+        enemies[archetype.name] = archetype
+    return enemies
+
+
+def cell_key(race, sub_race, build, archetype, fights, seed):
+    # Hash of everything a cell's result depends on
+    tables = content.load("races")
+    skills = content.load("skills")["skills"]
+    levels, policy = SKILL_BUILDS[build]
+    inputs = {
+        "version": SWEEP_VERSION,
+        "race": [race, tables["races"][race]],
+        "sub_race": [sub_race, tables["sub_races"][sub_race]],
+        "skills": {name: [level, skills[name]] for name, level in levels.items()},
+        "policy": policy,
+        "enemy": [archetype.name, archetype.health, archetype.attack_min, archetype.attack_max],
+        "fights": fights,
+        "seed": seed,
+    }
+    return hashlib.blake2b(json.dumps(inputs, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def run_row(race, sub_race, build, cells, fights):
+    # Worker task: one build against a list of (key, enemy stats) cells.
+    # Returns {key: (win rate, mean turns to kill or None)}.
+    levels, policy = SKILL_BUILDS[build]
+    player = build_player(race, sub_race, levels)
+    results = {}
+    for key, (name, health, attack_min, attack_max) in cells:
+        enemy = Enemy.spawn(EnemyArchetype(-1, name, health, attack_min, attack_max))
+        result = simulate(player, enemy, fights, POLICIES[policy], seed=int(key[:15], 16))
+        turns = result.turns[result.outcome == WIN]
+        results[key] = (result.win_rate, float(turns.mean()) if len(turns) else None)
+    return results
+
+
+def load_cache(path):
+    try:
+        with open(path) as cache_file:
+            return json.load(cache_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def sweep(race_names, sub_race_names, builds, enemy_names, fights, seed=0, workers=None, cache=None):
+    # Returns (win rate, turns to kill) arrays shaped (race, sub-race, build,
+    # enemy) and how many cells had to be simulated. cache is a {key: result}
+    # dict, updated in place.
+    cache = {} if cache is None else cache
+    enemies = sweep_enemies()
+    shape = (len(race_names), len(sub_race_names), len(builds), len(enemy_names))
+    keys = np.empty(shape, dtype=object)
+    rows = []  # (race, sub_race, build, [(key, enemy stats)]) for cells not in the cache
+    for i, race in enumerate(race_names):
+        for j, sub_race in enumerate(sub_race_names):
+            for k, build in enumerate(builds):
+                missing = []
+                for m, enemy_name in enumerate(enemy_names):
+                    archetype = enemies[enemy_name]
+                    key = keys[i, j, k, m] = cell_key(race, sub_race, build, archetype, fights, seed)
+                    if key not in cache:
+                        stats = (archetype.name, archetype.health, archetype.attack_min, archetype.attack_max)
+                        missing.append((key, stats))
+                if missing:
+                    rows.append((race, sub_race, build, missing))
+
+    computed = sum(len(row[3]) for row in rows)
+    if workers == 1 or len(rows) <= 1:
+        for race, sub_race, build, missing in rows:
+            cache.update(run_row(race, sub_race, build, missing, fights))
+    elif rows:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(run_row, race, sub_race, build, missing, fights)
+                       for race, sub_race, build, missing in rows]
+            for future in futures:
+                cache.update(future.result())
+
+    win_rate = np.empty(shape)
+    turns_to_kill = np.empty(shape)
+    for index, key in np.ndenumerate(keys):
+        rate, turns = cache[key]
+        win_rate[index] = rate
+        turns_to_kill[index] = np.nan if turns is None else turns
+    return win_rate, turns_to_kill, computed
+
+
+def write_matrix(path, matrix, race_names, sub_race_names, builds, enemy_names):
+    # One row per (race, sub-race, build), one column per enemy
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["race", "sub_race", "build"] + list(enemy_names))
+        for (i, j, k), row in np.ndenumerate(matrix[..., 0]):
+            values = matrix[i, j, k]
+            writer.writerow([race_names[i], sub_race_names[j], builds[k]]
+                            + ["" if np.isnan(value) else f"{value:.4f}" for value in values.tolist()])
+
+
+def report(win_rate, race_names, sub_race_names, builds, count=5):
+    # Strongest and weakest (race, sub-race, build) by win rate over every enemy
+    overall = win_rate.mean(axis=-1)
+    order = np.argsort(overall, axis=None)
+    labels = []
+    for flat in order.tolist():
+        i, j, k = np.unravel_index(flat, overall.shape)
+        labels.append(f"{race_names[i]} / {sub_race_names[j]} / {builds[k]}: {overall[i, j, k]:.2%}")
+    lines = ["Strongest builds:"] + [f"  {label}" for label in reversed(labels[-count:])]
+    lines += ["Weakest builds:"] + [f"  {label}" for label in labels[:count]]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    enemies = sweep_enemies()
+    parser = argparse.ArgumentParser(description="Sweep simulated fights over every build and enemy.")
+    parser.add_argument("--race", action="append", choices=list(races), help="Race to sweep (repeatable, default all)")
+    parser.add_argument("--sub-race", action="append", choices=list(sub_races),
+                        help="Sub-race to sweep (repeatable, default all)")
+    parser.add_argument("--build", action="append", choices=list(SKILL_BUILDS),
+                        help="Skill build to sweep (repeatable, default all)")
+    parser.add_argument("--enemy", action="append", choices=list(enemies),
+                        help="Enemy to sweep (repeatable, default all)")
+    parser.add_argument("-n", "--fights", type=int, default=10000, help="Fights per cell")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Output directory, also holds the cache")
+    parser.add_argument("--no-cache", action="store_true", help="Simulate every cell, ignoring cached results")
+    args = parser.parse_args(argv)
+
+    race_names = args.race or list(races)
+    sub_race_names = args.sub_race or list(sub_races)
+    builds = args.build or list(SKILL_BUILDS)
+    enemy_names = args.enemy or list(enemies)
+    os.makedirs(args.out, exist_ok=True)
+    cache_path = os.path.join(args.out, "cache.json")
+    cache = {} if args.no_cache else load_cache(cache_path)
+
+    started = time.perf_counter()
+    win_rate, turns_to_kill, computed = sweep(race_names, sub_race_names, builds, enemy_names, args.fights,
+                                              args.seed, args.workers, cache)
+    elapsed = time.perf_counter() - started
+    write_atomic(cache_path, json.dumps(cache), fsync=False)
+
+    axes = (race_names, sub_race_names, builds, enemy_names)
+    write_matrix(os.path.join(args.out, "win_rate.csv"), win_rate, *axes)
+    write_matrix(os.path.join(args.out, "turns_to_kill.csv"), turns_to_kill, *axes)
+    np.savez_compressed(os.path.join(args.out, "sweep.npz"), win_rate=win_rate, turns_to_kill=turns_to_kill,
+                        races=race_names, sub_races=sub_race_names, builds=builds, enemies=enemy_names)
+
+    print(f"{win_rate.size} cells ({computed} simulated, {win_rate.size - computed} cached) "
+          f"in {elapsed:.1f}s, written to {args.out}")
+    print(report(win_rate, race_names, sub_race_names, builds))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
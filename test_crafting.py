@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+
+from engine import GameSession
+from items import HYBRID_PREFIX, item_registry
+from journal import SaveDirectory
+
+# Loads a save in a fresh process, whose hybrid ids differ from the saving
+# one's, and prints what the game shows plus every stack's make-up
+LOAD_SCRIPT = """
+import json, sys
+from items import item_registry
+registry = item_registry()
+registry.hybrid(registry.id_of("Magic Staff"), registry.id_of("Gemstone"))
+from engine import GameSession
+from journal import SaveDirectory
+from test_crafting import stacks
+session = GameSession("Ann", "Elves", "Angelic", SaveDirectory(sys.argv[1], per_player=True))
+events = session.submit({"action": "load"})
+print(json.dumps([events, stacks(session)]))
+"""
+
+
+def stacks(session):
+    # [hybrid depth, type, modifiers, count] of every stack, the same in any process
+    registry = session.player.inventory.registry
+    return sorted([registry.depths.get(item_id, 0), registry.types[item_id],
+                   sorted(registry.modifiers[item_id].items()), count]
+                  for item_id, count in session.player.inventory.counts.items())
+
+
+def combine(session, first, second):
+    # Combine two items by name, through the numbered list the game shows
+    items = list(session.player.inventory)
+    first_index = items.index(first)
+    second_index = items.index(second, first_index + 1 if first == second else 0)
+    return session.submit({"action": "combine", "first": first_index + 1, "second": second_index + 1})
+
+
+def test_recipe_crafting():
+    session = GameSession("Ann", "Half-Orc", "Werewolf", seed=1)
+    session.submit({"action": "buy", "items": ["Gemstone", "Iron Sword"]})
+    events = session.submit({"action": "recipes"})
+    assert events == [{"type": "craftable",
+                       "recipes": [{"first": "Iron Sword", "second": "Gemstone", "result": "Gemstone Sword"}]}]
+
+    # Input order doesn't matter
+    events = combine(session, "Gemstone", "Iron Sword")
+    assert events == [{"type": "combined", "first": "Gemstone", "second": "Iron Sword", "result": "Gemstone Sword"}]
+    assert session.player.inventory.to_dict() == {"Gemstone Sword": 1}
+    assert session.submit({"action": "recipes"}) == [{"type": "craftable", "recipes": []}]
+
+    session.submit({"action": "equip", "item": "Gemstone Sword"})
+    status = session.submit({"action": "status"})[0]
+    assert status["weapon_bonus"] == item_registry().stat("Gemstone Sword", "strength")
+
+
+def test_hybrid_save_round_trip(tmp_path):
+    saves = str(tmp_path)
+    session = GameSession("Ann", "Elves", "Angelic", SaveDirectory(saves, per_player=True), seed=1)
+    session.submit({"action": "buy", "items": {"Iron Sword": 2, "Health Potion": 2, "Leather Armor": 1,
+                                               "Steel Sword": 1}})
+    session.submit({"action": "save"})
+    first = combine(session, "Iron Sword", "Health Potion")[0]["result"]
+    assert first == f"{HYBRID_PREFIX}Iron Sword and Health Potion"
+    second = combine(session, first, "Leather Armor")[0]["result"]
+    assert second == f"{HYBRID_PREFIX}{first} and Leather Armor"
+    # Parts nested deeper than HYBRID_NAME_DEPTH are named by id
+    third = combine(session, second, "Steel Sword")[0]["result"]
+    assert third.startswith(f"{HYBRID_PREFIX}Hybrid #")
+    combine(session, "Iron Sword", "Health Potion")
+    assert session.submit({"action": "save"})[0]["type"] == "game_saved"
+    status = session.submit({"action": "status"})[0]
+
+    output = subprocess.run([sys.executable, "-c", LOAD_SCRIPT, saves], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    events, loaded_stacks = json.loads(output)
+    assert [event["type"] for event in events] == ["game_loaded", "status"]
+    loaded = events[1]
+    # Names of shallow hybrids read the same in any process; deeper ones carry this process's ids
+    readable = [item for item in status["inventory"] if not item.startswith(f"{HYBRID_PREFIX}Hybrid #")]
+    assert [item for item in loaded["inventory"] if not item.startswith(f"{HYBRID_PREFIX}Hybrid #")] == readable
+    assert len(loaded["inventory"]) == len(status["inventory"])
+    assert loaded_stacks == json.loads(json.dumps(stacks(session)))
+    assert loaded["gold"] == status["gold"]
@@ -0,0 +1,90 @@
+import json
+
+import content
+import dialogue
+from engine import EventLog, GameSession
+from Helbrand import NPC, Player
+
+with open(content.registry.source_path("dialogue")) as dialogue_file:
+    ROWAN = json.load(dialogue_file)["dialogues"]["Elder Rowan"]
+
+
+def options(node, *hidden):
+    return [choice["text"] for choice in ROWAN["nodes"][node]["choices"] if choice["text"] not in hidden]
+
+
+def test_conditions_in_play():
+    helbrand = "I seek the Helbrand."
+    assert ROWAN["nodes"]["greet"]["choices"][1] == {"text": helbrand, "next": "helbrand", "if": {"min_level": 3}}
+
+    novice = GameSession("Ann", "Elves", "Angelic", seed=1)
+    novice.submit({"action": "explore", "location": "Senaria"})
+    assert novice.snapshot() == {"state": "dialogue", "npc": "Elder Rowan", "options": options("greet", helbrand)}
+
+    veteran = GameSession("Bo", "Elves", "Angelic", seed=1)
+    veteran.player.level = 3
+    veteran.player.inventory.add("Magic Scroll")
+    events = veteran.submit({"action": "explore", "location": "Senaria"})
+    assert [event["line"] for event in events if event["type"] == "npc_says"] == [ROWAN["nodes"]["greet"]["line"]]
+    assert veteran.snapshot()["options"] == options("greet")
+    events = veteran.submit({"action": "talk", "option": options("greet").index(helbrand) + 1})
+    assert events[0] == {"type": "npc_says", "npc": "Elder Rowan", "line": ROWAN["nodes"]["helbrand"]["line"]}
+    assert veteran.snapshot()["options"] == options("helbrand")
+
+    assert ROWAN["nodes"]["helbrand"]["choices"][1]["if"] == {"has_item": "Magic Scroll"}
+
+    # The NPC is shared: the novice's conversation still doesn't offer the choice
+    assert novice.snapshot()["options"] == options("greet", helbrand)
+    novice.submit({"action": "talk", "option": 99})
+    assert novice.state == "idle"
+
+
+def test_every_condition(tmp_path):
+    source = tmp_path / "dialogue.json"
+    choices = [
+        {"text": "gold", "if": {"min_gold": 1000}},
+        {"text": "rich", "if": {"min_gold": 1001}},
+        {"text": "potion", "if": {"has_item": "Health Potion"}},
+        {"text": "elf", "if": {"race": "Elves"}},
+        {"text": "orc", "if": {"race": "Half-Orc"}},
+        {"text": "angel", "if": {"sub_race": "Angelic"}},
+        {"text": "mage", "if": {"skill": ["Magic", 2]}},
+        {"text": "always"},
+    ]
+    source.write_text(json.dumps({"dialogues": {"Tester": {"start": "a", "nodes": {"a": {"choices": choices}}}}}))
+    store = dialogue.open_store(str(source), str(tmp_path / "dialogue.bin"))
+    player = Player("Ann", "Elves", "Angelic")
+    npc = NPC("Tester", "Test")
+
+    def offered():
+        return dialogue.Conversation(npc, store, store.start("Tester"), player, EventLog()).options
+
+    assert offered() == ["gold", "elf", "angel", "always"]
+    player.inventory.add("Health Potion")
+    player.skill_tree.set_level("Magic", 2)
+    player.gold -= 1
+    assert offered() == ["potion", "elf", "angel", "mage", "always"]
+    store.close()
+
+
+def test_node_cache_evicts_least_recently_used(tmp_path):
+    store = dialogue.open_store(content.registry.source_path("dialogue"), str(tmp_path / "dialogue.bin"),
+                                cache_nodes=2)
+    greet_index = store.start("Elder Rowan")
+    greet = store.node(greet_index)
+    assert greet.line == ROWAN["nodes"]["greet"]["line"]
+    dangers_index = greet.choices[0][1]
+    dangers = store.node(dangers_index)
+    assert dangers.line == ROWAN["nodes"]["dangers"]["line"]
+    assert store.node(greet_index) is greet  # A hit makes greet the most recently used
+
+    mountains_index = dangers.choices[0][1]
+    assert store.node(mountains_index).line == ROWAN["nodes"]["mountains"]["line"]
+    assert list(store.nodes) == [greet_index, mountains_index]
+    assert store.node(greet_index) is greet
+
+    # dangers was evicted: reaching it again decodes an equal, new node
+    again = store.node(dangers_index)
+    assert again is not dangers and (again.line, again.choices) == (dangers.line, dangers.choices)
+    assert list(store.nodes) == [greet_index, dangers_index]
+    store.close()
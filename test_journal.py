@@ -0,0 +1,26 @@
+import json
+
+from Helbrand import Game, NullEvents, Player
+from items import item_registry
+from journal import SaveDirectory
+
+
+def test_save_after_legacy_load(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    legacy = {"name": "Old", "gold": 77, "health": 90, "inventory": ["Health Potion", "Health Potion"],
+              "location": "Town", "level": 2, "exp": 5, "skill_points": 1, "skills": {}}
+    with open("save_game.json", "w") as save_file:
+        json.dump(legacy, save_file)
+
+    game = Game(Player("Ann", "Elves", "Angelic"), events=NullEvents(), saves=SaveDirectory("saves"))
+    game.load_game()
+    game.player.gold += 1
+    game.save_game()
+    game.player.gold += 1
+    game.save_game()
+
+    state = SaveDirectory("saves").slot().load()
+    assert state["name"] == "Old"
+    assert state["gold"] == 79
+    registry = item_registry()
+    assert state["inventory"] == {registry.save_key(registry.id_of("Health Potion")): 2}
@@ -0,0 +1,103 @@
+import asyncio
+
+from engine import GameSession, replay
+from journal import SaveDirectory
+from server import SessionClient, SessionServer
+
+REPLIES = {"dialogue": {"action": "talk", "option": 1}, "combat": {"action": "attack"}}
+
+
+async def play_until_idle(client, reply, answer="no"):
+    # Answer whatever the location event waits on; returns the idle reply and the states seen
+    states = []
+    while reply["state"]["state"] != "idle":
+        state = reply["state"]["state"]
+        states.append(state)
+        command = REPLIES.get(state, {"action": "answer", "text": answer})
+        reply = await client.send(command)
+    return reply, states
+
+
+def event_types(reply):
+    return [event["type"] for event in reply["events"]]
+
+
+def test_tcp_session(tmp_path):
+    async def session():
+        server = SessionServer(SaveDirectory(str(tmp_path), per_player=True))
+        await server.start(port=0)
+        client = await SessionClient.connect(port=server.port)
+        try:
+            reply = await client.send({"action": "explore", "location": "Dark Amazon"})
+            assert reply["session"] is None and event_types(reply) == ["error"]
+
+            reply = await client.send({"action": "create", "name": "Ayla", "race": "Half-Orc",
+                                       "sub_race": "Werewolf", "seed": 11})
+            assert reply["seed"] == 11 and reply["state"] == {"state": "idle"}
+
+            reply = await client.send({"action": "buy", "item": "Iron Sword"})
+            assert event_types(reply) == ["purchased"]
+            reply = await client.send({"action": "equip", "item": "Iron Sword"})
+            assert "error" not in event_types(reply)
+
+            # The coliseum asks whether to go on after every win
+            reply = await client.send({"action": "explore", "location": "Battle Coliseum"})
+            assert reply["state"]["state"] == "combat"
+            reply, states = await play_until_idle(client, reply)
+            assert states[-1] == "question"
+            assert reply["state"] == {"state": "idle"}
+
+            reply = await client.send({"action": "explore", "location": "Dark Amazon"})
+            assert reply["state"]["state"] == "dialogue"
+            assert reply["state"]["npc"] == "Mysterious Wanderer"
+            reply, states = await play_until_idle(client, reply)
+            assert states[0] == "dialogue"
+
+            before = (await client.send({"action": "status"}))["events"][0]
+            reply = await client.send({"action": "save"})
+            assert event_types(reply) == ["game_saved"]
+            reply = await client.send({"action": "buy", "item": "Health Potion"})
+            assert event_types(reply) == ["purchased"]
+            reply = await client.send({"action": "load"})
+            assert event_types(reply) == ["game_loaded", "status"]
+            assert reply["events"][1] == before
+
+            # Only the session's own character can be saved or loaded
+            reply = await client.send({"action": "load", "slot": "Someone Else"})
+            assert event_types(reply) == ["error"]
+
+            reply = await client.send({"action": "quit"})
+            assert reply["state"] == {"state": "closed"}
+            assert await client.reader.readline() == b""
+        finally:
+            await client.close()
+            await server.stop()
+        assert server.sessions == {}
+        assert SaveDirectory(str(tmp_path)).list_slots() == ["Ayla"]
+
+    asyncio.run(session())
+
+
+def test_replay_reproduces_session(tmp_path):
+    commands = [
+        {"action": "buy", "items": {"Health Potion": 2, "Iron Sword": 1}},
+        {"action": "equip", "item": "Iron Sword"},
+        {"action": "explore", "location": "Decaria Mountains"},
+    ]
+    session = GameSession("Bren", "Beast Race", "Vampire", SaveDirectory(str(tmp_path / "a"), per_player=True),
+                          seed=3, record=True)
+    events = []
+    for command in commands:
+        events.extend(session.submit(command))
+    while session.state != "idle":
+        command = {"dialogue": {"action": "talk", "option": 1}}.get(session.state, {"action": "attack"})
+        events.extend(session.submit(command))
+    for command in ({"action": "use", "item": "Health Potion"}, {"action": "save"}, {"action": "status"}):
+        events.extend(session.submit(command))
+    assert {"enemy_defeated", "level_up", "game_saved"} <= {event["type"] for event in events}
+
+    replayed, replayed_events = replay(session.recording(), SaveDirectory(str(tmp_path / "b"), per_player=True))
+    assert replayed_events == events
+    assert replayed.recording() == session.recording()
+    assert replayed.rng.state() == session.rng.state()
+    assert replayed.player.inventory.to_save() == session.player.inventory.to_save()
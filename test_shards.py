@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from engine import SessionError
+from shards import ShardRouter, zone_shards
+
+
+def fail_adopt(shard):
+    request = shard.request
+
+    def failing(action, session_id, payload=None):
+        if action == "adopt":
+            raise RuntimeError("Shard error: adopt failed")
+        return request(action, session_id, payload)
+    shard.request = failing
+
+
+def test_failed_adopt_keeps_session(tmp_path):
+    async def session():
+        router = ShardRouter(2, "zone", str(tmp_path))
+        try:
+            zones = zone_shards(2)
+            home, coliseum = zones["Town"], zones["Battle Coliseum"]
+            assert home != coliseum
+            session_id, reply = await router.open("Ayla", "Half-Orc", "Werewolf", 3)
+
+            # The target shard can't adopt the session: it goes back to where it was
+            fail_adopt(router.shards[coliseum])
+            reply = await router.submit(session_id, {"action": "coliseum", "battles": 2})
+            assert reply["state"] == {"state": "idle"}
+            assert router.placement[session_id] == home and router.migrations == 0
+            reply = await router.submit(session_id, {"action": "status"})
+            assert reply["events"][0]["type"] == "status" and reply["events"][0]["name"] == "Ayla"
+
+            # Neither shard can: the session is gone, but the character can be played again
+            fail_adopt(router.shards[home])
+            with pytest.raises(SessionError):
+                await router.submit(session_id, {"action": "status"})
+            assert not router.is_open(session_id) and router.players == {}
+            session_id, reply = await router.open("Ayla", "Half-Orc", "Werewolf", 3)
+            assert router.is_open(session_id)
+        finally:
+            router.stop()
+
+    asyncio.run(session())
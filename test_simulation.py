@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from engine import EventLog
+from Helbrand import Enemy, EnemyGroup, Game, RandomStream
+from simulation import ATTACK, FIREBALL, build_player, simulate_coliseum
+
+SEEDS = range(200)
+
+ACTIONS = {ATTACK: ("attack", None), FIREBALL: ("skill", "Fireball")}
+
+
+def coliseum_player(race, sub_race, skills, health):
+    player = build_player(race, sub_race, skills)
+    player.health = health
+    return player
+
+
+def play_coliseum(player, battles, action, seed):
+    # Fight Game.coliseum_event turn by turn with the same action; returns (won, fell in)
+    game = Game(player, EventLog(), rng=RandomStream(seed))
+    kind, argument = ACTIONS[action]
+    event = game.coliseum_event()
+    answer = None
+    won = 0
+    fell_in = None
+    while True:
+        try:
+            step = event.send(answer)
+        except StopIteration:
+            return won, fell_in
+        if isinstance(step, (Enemy, EnemyGroup)):
+            answer = None
+            while answer is None:
+                answer = game.combat_turn(step, kind, argument)
+            if answer:
+                won += 1
+            else:
+                fell_in = won + 1
+        else:
+            answer = "yes" if won < battles else "no"
+
+
+@pytest.mark.parametrize("race, sub_race, skills, action, health", [
+    ("Terrans", "Demonic", {}, ATTACK, 200),
+    ("Elves", "Angelic", {"Magic": 2, "Fireball": 3}, FIREBALL, 400),
+])
+def test_coliseum_matches_played_runs(race, sub_race, skills, action, health):
+    played_won, played_level, played_gold = [], [], []
+    for seed in SEEDS:
+        player = coliseum_player(race, sub_race, skills, health)
+        won, fell_in = play_coliseum(player, 25, action, seed)
+        assert fell_in == won + 1
+        played_won.append(won)
+        played_level.append(player.level)
+        played_gold.append(player.gold - 1000)
+
+    player = coliseum_player(race, sub_race, skills, health)
+    results = [simulate_coliseum(player, 25, action, seed=seed) for seed in SEEDS]
+    assert all(result.fell_in == result.battles_won + 1 for result in results)
+    assert abs(np.mean([result.battles_won for result in results]) - np.mean(played_won)) < 0.3
+    assert abs(np.mean([result.level for result in results]) - np.mean(played_level)) < 0.3
+    assert abs(np.mean([result.gold for result in results]) / np.mean(played_gold) - 1) < 0.02
+
+
+def test_coliseum_falls_in_the_same_swarm():
+    # 600 health always goes down to the same swarm battle, played or simulated
+    played = {play_coliseum(coliseum_player("Half-Orc", "Werewolf", {}, 600), 25, ATTACK, seed)
+              for seed in range(20)}
+    player = coliseum_player("Half-Orc", "Werewolf", {}, 600)
+    simulated = {(result.battles_won, result.fell_in)
+                 for result in (simulate_coliseum(player, 25, seed=seed) for seed in range(20))}
+    assert len(played) == 1
+    assert simulated == played
+
+
+def test_coliseum_run_that_outlasts_every_battle():
+    player = coliseum_player("Half-Orc", "Werewolf", {}, 10 ** 6)
+    won, fell_in = play_coliseum(player, 12, ATTACK, seed=1)
+    result = simulate_coliseum(coliseum_player("Half-Orc", "Werewolf", {}, 10 ** 6), 12, seed=1)
+    assert (won, fell_in) == (result.battles_won, result.fell_in) == (12, None)
+    assert result.gold == player.gold - 1000
@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+
+import sweep
+from enemies import EnemyArchetype
+
+AXES = (["Half-Orc"], ["Werewolf", "Angelic"], ["basic", "fireball"], ["Troll", "Coliseum Challenger 3"])
+FIGHTS = 300
+
+
+def test_sweep_cache_hits_and_misses(monkeypatch):
+    cache = {}
+    win_rate, turns, computed = sweep.sweep(*AXES, FIGHTS, workers=1, cache=cache)
+    assert computed == win_rate.size == 8
+    assert len(cache) == 8
+    assert ((win_rate >= 0) & (win_rate <= 1)).all()
+
+    # Same sweep again: every cell comes from the cache
+    cached_win_rate, cached_turns, computed = sweep.sweep(*AXES, FIGHTS, workers=1, cache=cache)
+    assert computed == 0
+    np.testing.assert_array_equal(cached_win_rate, win_rate)
+    np.testing.assert_array_equal(cached_turns, turns)
+
+    # A cell doesn't depend on what else was swept with it
+    alone, _, computed = sweep.sweep(["Half-Orc"], ["Angelic"], ["fireball"], ["Troll"], FIGHTS, workers=1)
+    assert computed == 1
+    assert alone[0, 0, 0, 0] == win_rate[0, 1, 1, 0]
+
+    # Tweaking one enemy only reruns that enemy's column
+    enemies = sweep.sweep_enemies()
+    troll = enemies["Troll"]
+    enemies["Troll"] = EnemyArchetype(troll.id, troll.name, troll.health * 2, troll.attack_min, troll.attack_max)
+    monkeypatch.setattr(sweep, "sweep_enemies", lambda: enemies)
+    tweaked_win_rate, tweaked_turns, computed = sweep.sweep(*AXES, FIGHTS, workers=1, cache=cache)
+    assert computed == 4
+    np.testing.assert_array_equal(tweaked_win_rate[..., 1], win_rate[..., 1])
+    np.testing.assert_array_equal(tweaked_turns[..., 1], turns[..., 1])
+    assert (tweaked_turns[..., 0] > turns[..., 0]).all()
+
+
+def test_sweep_command_reuses_its_cache(tmp_path, capsys):
+    arguments = ["--race", "Elves", "--sub-race", "Succubus", "--build", "basic", "--build", "lightning",
+                 "--enemy", "Skeleton", "-n", str(FIGHTS), "--workers", "1", "--out", str(tmp_path)]
+    assert sweep.main(arguments) == 0
+    assert "2 cells (2 simulated, 0 cached)" in capsys.readouterr().out
+    with open(tmp_path / "cache.json") as cache_file:
+        assert len(json.load(cache_file)) == 2
+    first = (tmp_path / "win_rate.csv").read_text()
+
+    assert sweep.main(arguments) == 0
+    assert "2 cells (0 simulated, 2 cached)" in capsys.readouterr().out
+    assert (tmp_path / "win_rate.csv").read_text() == first
+
+    assert sweep.main(arguments + ["--no-cache"]) == 0
+    assert "2 cells (2 simulated, 0 cached)" in capsys.readouterr().out
+    assert (tmp_path / "win_rate.csv").read_text() == first
@@ -0,0 +1,200 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+
+# Write-behind saving. Wraps a save backend (journal.SaveDirectory or
+# save_store.SaveStore) so that Game.save_game only captures the player's
+# state and returns; a worker thread does the file I/O. Saves of the same
+# slot made within `window` seconds of each other are merged into one
+# write, and every batch the worker writes is made durable with one fsync
+# per file instead of one per save. close() (called on quit and at exit)
+# writes whatever is still queued.
+
+
+def merge_captures(old, new):
+    # Fold a newer capture into a queued one
+    if new["full"]:
+        return new
+    merged = dict(old)
+    merged["fields"] = dict(old["fields"], **new["fields"])
+    merged["items"] = dict(old["items"], **new["items"])
+    merged["skills"] = new["skills"]
+    return merged
+
+
+class WriteBehindSlot:
+    def __init__(self, saver, slot):
+        self.saver = saver
+        self.slot = slot
+
+    def save(self, player):
+        self.saver.enqueue(self.slot, self.slot.capture(player))
+
+    def load(self):
+        self.saver.flush(self.slot)
+        with self.saver.io_lock:
+            return self.slot.load()
+
+    def attach(self, player):
+        self.slot.attach(player)
+
+    def __getattr__(self, name):
+        return getattr(self.slot, name)
+
+
+class WriteBehindSaver:
+    def __init__(self, saves, window=0.25, batch_size=256):
+        self.saves = saves
+        self.window = window
+        self.batch_size = batch_size
+        self.per_player = getattr(saves, "per_player", False)
+        self.slots = {}
+        self.pending = OrderedDict()  # slot -> [capture, time first queued]
+        self.condition = threading.Condition()
+        self.io_lock = threading.Lock()  # Held while the worker writes
+        self.writing = set()
+        self.flushing = 0
+        self.closed = False
+        self.error = None
+
+        self.requested = 0
+        self.coalesced = 0
+        self.written = 0
+        self.batches = 0
+        self.latency_last = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+        self.worker = threading.Thread(target=self.run, name="write-behind saver", daemon=True)
+        self.worker.start()
+        atexit.register(self.close)
+
+    # Save backend interface
+
+    def slot(self, name="default"):
+        if name not in self.slots:
+            slot = self.saves.slot(name)
+            slot.fsync = False  # The worker syncs once per batch
+            self.slots[name] = WriteBehindSlot(self, slot)
+        return self.slots[name]
+
+    def list_slots(self):
+        self.flush()
+        with self.io_lock:
+            return self.saves.list_slots()
+
+    # Queue
+
+    def enqueue(self, slot, capture):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Write-behind saver is closed")
+            self.requested += 1
+            queued = self.pending.get(slot)
+            if queued is None:
+                self.pending[slot] = [capture, time.perf_counter()]
+            else:
+                queued[0] = merge_captures(queued[0], capture)
+                self.coalesced += 1
+            self.condition.notify_all()
+
+    def flush(self, slot=None):
+        # Block until everything queued (or everything queued for one slot) is on disk
+        with self.condition:
+            self.flushing += 1
+            self.condition.notify_all()
+            try:
+                if slot is None:
+                    self.condition.wait_for(lambda: not self.pending and not self.writing)
+                else:
+                    self.condition.wait_for(lambda: slot not in self.pending and slot not in self.writing)
+            finally:
+                self.flushing -= 1
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.worker.join()
+        atexit.unregister(self.close)
+        close = getattr(self.saves, "close", None)
+        if close is not None:
+            close()
+
+    # Worker
+
+    def next_batch(self):
+        with self.condition:
+            while True:
+                if self.pending:
+                    first_queued = next(iter(self.pending.values()))[1]
+                    remaining = first_queued + self.window - time.perf_counter()
+                    if remaining <= 0 or self.flushing or self.closed or len(self.pending) >= self.batch_size:
+                        break
+                    self.condition.wait(remaining)
+                elif self.closed:
+                    return None
+                else:
+                    self.condition.wait()
+            batch = []
+            while self.pending and len(batch) < self.batch_size:
+                slot, (capture, queued_at) = self.pending.popitem(last=False)
+                batch.append((slot, capture, queued_at))
+                self.writing.add(slot)
+            return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            error = None
+            with self.io_lock:
+                targets = {}
+                try:
+                    for slot, capture, queued_at in batch:
+                        slot.write(capture)
+                        target = slot.sync_target()
+                        targets[id(target)] = target
+                    for target in targets.values():
+                        target.sync()
+                except Exception as write_error:
+                    error = write_error
+                    # The next save of these slots has to write everything again
+                    for slot, capture, queued_at in batch:
+                        slot.synced = False
+            finished = time.perf_counter()
+            with self.condition:
+                if error is not None:
+                    self.error = error
+                else:
+                    self.batches += 1
+                    self.written += len(batch)
+                    for slot, capture, queued_at in batch:
+                        latency = finished - queued_at
+                        self.latency_last = latency
+                        self.latency_total += latency
+                        self.latency_max = max(self.latency_max, latency)
+                self.writing.clear()
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "queue_depth": len(self.pending),
+                "requested": self.requested,
+                "coalesced": self.coalesced,
+                "written": self.written,
+                "batches": self.batches,
+                "flush_latency_last": self.latency_last,
+                "flush_latency_mean": self.latency_total / self.written if self.written else 0.0,
+                "flush_latency_max": self.latency_max,
+            }